@@ -0,0 +1,59 @@
+"""Summaries/sec in-process vs an AnalysisPool with increasing worker counts.
+
+Workers default to an even split of the cores (torch threads = cores // workers).
+Model loading happens in warm_up() and is not timed. The analysis cache is
+disabled so every run does real inference.
+
+Run from src/:  python -m benchmarks.bench_analysis_pool --threads 64 --workers 1,2,4,8
+"""
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.synthetic import build_synthetic_db
+from services.analysis_pool import AnalysisPool
+from services.email_analyzer import EmailAnalyzer
+
+
+def timed_summaries(analyzer, thread_ids, batch_size):
+    started = time.perf_counter()
+    summaries = analyzer.summarize_threads(thread_ids, batch_size=batch_size)
+    return summaries, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--messages-per-thread', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--workers', default='1,2,4,8', help="comma-separated worker counts")
+    parser.add_argument('--torch-threads', type=int, help="per worker (default: cores // workers)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        thread_ids = build_synthetic_db(db_path, args.threads * args.messages_per_thread,
+                                        messages_per_thread=args.messages_per_thread, body_words=(20, 200))
+        print(f"{len(thread_ids)} threads on {os.cpu_count()} cores")
+
+        analyzer = EmailAnalyzer(db_path=db_path, use_cache=False)
+        analyzer.models.warm_up(['summarizer'])
+        baseline, elapsed = timed_summaries(analyzer, thread_ids, args.batch_size)
+        baseline_rate = len(thread_ids) / elapsed
+        print(f"in-process: {baseline_rate:.2f} summaries/s")
+        analyzer.close()
+
+        for workers in [int(w) for w in args.workers.split(',')]:
+            with AnalysisPool(workers=workers, torch_threads=args.torch_threads, models=['summarizer']) as pool:
+                started = pool.warm_up()
+                analyzer = EmailAnalyzer(db_path=db_path, use_cache=False, pool=pool)
+                summaries, elapsed = timed_summaries(analyzer, thread_ids, args.batch_size)
+                rate = len(thread_ids) / elapsed
+                mismatches = sum(summaries[t] != baseline[t] for t in thread_ids)
+                print(f"{workers} workers x {pool.torch_threads} threads ({started} started): "
+                      f"{rate:.2f} summaries/s ({rate / baseline_rate:.2f}x), mismatches {mismatches}")
+                analyzer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Throughput of batched vs single-item summarization and intent inference.
+
+Run from src/:  python -m benchmarks.bench_analyzer_batch --threads 64 --batch-size 8
+"""
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.synthetic import build_synthetic_db
+from services.email_analyzer import EmailAnalyzer
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--messages-per-thread', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--intent-batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        thread_ids = build_synthetic_db(db_path, args.threads * args.messages_per_thread,
+                                        messages_per_thread=args.messages_per_thread, body_words=(20, 200))
+        # Without use_cache=False the batched pass would just read back the single-item results
+        analyzer = EmailAnalyzer(db_path=db_path, use_cache=False)
+        analyzer.models.warm_up()
+        email_ids = [row[0] for row in analyzer.conn.execute("SELECT id FROM emails")]
+
+        single, single_time = timed(lambda: {t: analyzer.summarize_thread(t) for t in thread_ids})
+        batched, batched_time = timed(analyzer.summarize_threads, thread_ids, batch_size=args.batch_size)
+        mismatches = sum(single[t] != batched[t] for t in thread_ids)
+        print(f"summaries: single {len(thread_ids) / single_time:.2f}/s, "
+              f"batched {len(thread_ids) / batched_time:.2f}/s "
+              f"({single_time / batched_time:.2f}x), mismatches {mismatches}")
+
+        single, single_time = timed(lambda: {e: analyzer.infer_intent(e) for e in email_ids})
+        batched, batched_time = timed(analyzer.infer_intents, email_ids, batch_size=args.intent_batch_size)
+        mismatches = sum(single[e] != batched[e] for e in email_ids)
+        print(f"intents: single {len(email_ids) / single_time:.2f}/s, "
+              f"batched {len(email_ids) / batched_time:.2f}/s "
+              f"({single_time / batched_time:.2f}x), mismatches {mismatches}")
+        analyzer.close()
+
+
+if __name__ == '__main__':
+    main()
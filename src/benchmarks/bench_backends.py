@@ -0,0 +1,147 @@
+"""Latency, memory and output parity of the analyzer models per inference backend.
+
+Each backend runs in its own process so its RSS is not inflated by the others.
+Summaries are scored against the first backend (normally fp32 pytorch) with
+ROUGE-1/ROUGE-L F1, and intent labels by agreement rate, over a fixed fixture
+set. Exits non-zero when a backend falls below --min-rouge-l or --min-agreement,
+so it can gate a change of ANALYZER_BACKEND.
+
+Run from src/:  python -m benchmarks.bench_backends --backends pytorch,quantized,onnx
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from services.email_analyzer import INTENT_INPUT_CHARS, SUMMARY_INPUT_CHARS, SUMMARY_KWARGS
+from services.model_registry import BACKENDS, ModelRegistry, current_rss, resolve_backend
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'analyzer_emails.json')
+TOKEN_RE = re.compile(r"\w+")
+
+
+def load_fixtures(path=FIXTURES):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _tokens(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def _f1(overlap, reference_len, candidate_len):
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / candidate_len, overlap / reference_len
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge_1(reference, candidate):
+    """unigram-overlap F1"""
+    ref, cand = _tokens(reference), _tokens(candidate)
+    counts = {}
+    for token in ref:
+        counts[token] = counts.get(token, 0) + 1
+    overlap = 0
+    for token in cand:
+        if counts.get(token):
+            counts[token] -= 1
+            overlap += 1
+    return _f1(overlap, len(ref), len(cand))
+
+
+def rouge_l(reference, candidate):
+    """longest-common-subsequence F1"""
+    ref, cand = _tokens(reference), _tokens(candidate)
+    previous = [0] * (len(cand) + 1)
+    for token in ref:
+        current = [0]
+        for j, other in enumerate(cand):
+            current.append(previous[j] + 1 if token == other else max(previous[j + 1], current[j]))
+        previous = current
+    return _f1(previous[-1], len(ref), len(cand))
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+
+def run_backend(backend, fixtures, torch_threads):
+    """load both models under backend and time one fixture at a time (the daemon's access pattern)"""
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+    rss_start = current_rss()
+    registry = ModelRegistry(backend=backend)
+    stats = registry.warm_up()
+    rss_loaded = current_rss()
+    summarizer, classifier = registry.get('summarizer'), registry.get('classifier')
+
+    summaries, labels, summary_times, intent_times = [], [], [], []
+    for email in fixtures:
+        started = time.perf_counter()
+        summaries.append(summarizer(email['body'][:SUMMARY_INPUT_CHARS], **SUMMARY_KWARGS)[0]['summary_text'])
+        summary_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        labels.append(classifier(email['body'][:INTENT_INPUT_CHARS])[0]['label'])
+        intent_times.append(time.perf_counter() - started)
+    return {
+        'backend': backend,
+        'load_seconds': sum(entry['load_seconds'] for entry in stats.values()),
+        'rss_loaded': rss_loaded - rss_start,
+        'rss_peak': current_rss() - rss_start,
+        'summary_times': summary_times,
+        'intent_times': intent_times,
+        'summaries': summaries,
+        'labels': labels,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default=','.join(BACKENDS),
+                        help="comma-separated; the first is the parity reference")
+    parser.add_argument('--fixtures', default=FIXTURES)
+    parser.add_argument('--torch-threads', type=int)
+    parser.add_argument('--min-rouge-l', type=float, default=0.6)
+    parser.add_argument('--min-agreement', type=float, default=0.9)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    backends = []
+    for backend in args.backends.split(','):
+        if resolve_backend(backend) != backend:
+            print(f"skipping {backend}: not available here")
+            continue
+        backends.append(backend)
+    print(f"{len(fixtures)} fixtures, backends: {', '.join(backends)}")
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for backend in backends:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(run_backend, (backend, fixtures, args.torch_threads)))
+
+    reference = results[0]
+    failed = False
+    for result in results:
+        rouge1 = sum(map(rouge_1, reference['summaries'], result['summaries'])) / len(fixtures)
+        rougel = sum(map(rouge_l, reference['summaries'], result['summaries'])) / len(fixtures)
+        agreement = sum(a == b for a, b in zip(reference['labels'], result['labels'])) / len(fixtures)
+        print(f"{result['backend']}: load {result['load_seconds']:.1f}s, "
+              f"RSS +{result['rss_loaded'] / 2**20:.0f} MiB (peak +{result['rss_peak'] / 2**20:.0f} MiB), "
+              f"summary p50 {percentile(result['summary_times'], 0.5) * 1000:.0f}ms "
+              f"p95 {percentile(result['summary_times'], 0.95) * 1000:.0f}ms, "
+              f"intent p50 {percentile(result['intent_times'], 0.5) * 1000:.1f}ms, "
+              f"ROUGE-1 {rouge1:.3f} ROUGE-L {rougel:.3f}, labels {agreement:.0%} agree")
+        if rougel < args.min_rouge_l or agreement < args.min_agreement:
+            print(f"  {result['backend']} is below the parity thresholds")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Event creation in CalendarScheduler: one insert per email vs batched inserts.
+
+Both runs start from a calendar that already holds --existing events, sync it
+once into the local cache, and check every new event against it. The sequential
+run then pays one round trip per event, the batched run one per 50 events.
+Conflict checks are disabled because every generated email proposes the same
+time; duplicates are still detected.
+
+Run from src/:  python -m benchmarks.bench_calendar --emails 200 --latency 0.05
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from services.calendar_scheduler import CalendarScheduler
+from services.email_parser import EmailManager
+from utils.fake_calendar import FakeCalendarService
+
+
+def invitation_emails(count):
+    for i in range(count):
+        yield {'id': f'msg{i:08d}', 'thread_id': f'thr{i:08d}', 'sender': 'colleague@example.com',
+               'recipient': 'me@example.com', 'subject': f'Project sync {i}', 'timestamp': 1700000000 + i,
+               'body': 'Can we meet on Friday at 3pm to go through the meeting notes?',
+               'labels': ['INBOX'], 'attachments': []}
+
+
+def existing_calendar(latency, count):
+    service = FakeCalendarService(latency=latency)
+    # Spread over the coming year, inside the window a full sync lists
+    today = date.today()
+    for i in range(count):
+        day = (today + timedelta(days=1 + i % 360)).isoformat()
+        service.add_event({'summary': f'Existing {i}', 'start': {'dateTime': f'{day}T09:00:00', 'timeZone': 'UTC'},
+                           'end': {'dateTime': f'{day}T09:30:00', 'timeZone': 'UTC'}})
+    service.request_count = 0
+    return service
+
+
+def run(db_path, email_ids, service, batched):
+    scheduler = CalendarScheduler(None, db_path=db_path, analyzer=object(), service=service, allow_conflicts=True)
+    started = time.perf_counter()
+    # The scheduler prints every detected intent and created event
+    with contextlib.redirect_stdout(io.StringIO()):
+        if batched:
+            results = scheduler.create_calendar_events(email_ids)
+            created = sum(status == 'created' for status in results.values())
+        else:
+            created = sum(scheduler.create_calendar_event(email_id) for email_id in email_ids)
+        # A second pass finds every event already scheduled
+        repeated = sum(scheduler.create_calendar_event(email_id) for email_id in email_ids[:10])
+    elapsed = time.perf_counter() - started
+    scheduler.close()
+    return created, repeated, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=200)
+    parser.add_argument('--existing', type=int, default=1000, help="events already on the calendar")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per stub round trip")
+    args = parser.parse_args()
+
+    email_ids = [f'msg{i:08d}' for i in range(args.emails)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for batched in (False, True):
+            db_path = os.path.join(tmp, f'bench_{batched}.db')
+            manager = EmailManager(db_path)
+            manager.store_emails(invitation_emails(args.emails))
+            manager.close()
+            service = existing_calendar(args.latency, args.existing)
+            created, repeated, elapsed = run(db_path, email_ids, service, batched)
+            print(f"{'batched' if batched else 'sequential'}: {created} events in {elapsed:.2f}s, "
+                  f"{service.request_count} requests + {service.batch_count} batches, "
+                  f"{len(service.list_calls)} list pages, {10 - repeated} of 10 repeats re-created")
+
+
+if __name__ == '__main__':
+    main()
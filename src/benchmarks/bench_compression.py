@@ -0,0 +1,58 @@
+"""Database size and thread read latency with plain vs compressed bodies.
+
+Run from src/:  python -m benchmarks.bench_compression --rows 100000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from benchmarks.synthetic import build_synthetic_db
+from utils.compress_bodies import compress_existing, db_size
+from utils.compression import zstandard
+from utils.db_utils import get_db_connection
+
+THREAD_QUERY = "SELECT sender, subject, body_text(body) FROM emails WHERE thread_id = ? ORDER BY timestamp"
+
+
+def measure(db_path, thread_ids):
+    conn = get_db_connection(db_path)
+    size = db_size(conn, db_path)
+    started = time.perf_counter()
+    for thread_id in thread_ids:
+        conn.execute(THREAD_QUERY, (thread_id,)).fetchall()
+    latency = (time.perf_counter() - started) / len(thread_ids)
+    conn.close()
+    return size, latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = os.path.join(tmp, 'plain.db')
+        thread_ids = build_synthetic_db(plain_path, args.rows, body_words=(20, 200), quote_replies=True)
+        sample = random.Random(0).sample(thread_ids, min(args.lookups, len(thread_ids)))
+        size, latency = measure(plain_path, sample)
+        print(f"plain:      {size / 2**20:8.1f} MiB, thread read {latency * 1000:.3f} ms")
+
+        variants = [('zlib', False), ('zlib', True)] + ([('zstd', False), ('zstd', True)] if zstandard else [])
+        for codec, train in variants:
+            path = os.path.join(tmp, f'{codec}{int(train)}.db')
+            shutil.copy(plain_path, path)
+            conn = get_db_connection(path)
+            compress_existing(conn, codec=codec, train=train)
+            conn.execute("VACUUM")
+            conn.close()
+            size_c, latency_c = measure(path, sample)
+            label = f"{codec}{'+dict' if train else ''}"
+            print(f"{label:<11} {size_c / 2**20:8.1f} MiB ({size_c / size:.0%}), "
+                  f"thread read {latency_c * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Meeting time extraction on the fixture corpus: extract_slots vs the old line-split parser.
+
+Each fixture email has the slot a person would book (or none). Reports
+extractions/sec, whether the top candidate (or any candidate) is that slot, and
+how often the old parser raised or picked the wrong time.
+
+Run from src/:  python -m benchmarks.bench_datetime_extraction --repeat 200
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from services.datetime_extraction import extract_email_slots
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'datetime_emails.json')
+TIMEZONE = 'Asia/Kolkata'
+
+
+def load_fixtures(path=FIXTURES):
+    with open(path) as f:
+        return json.load(f)
+
+
+def old_extract(body, now):
+    """the previous detect_scheduling_intent parsing, with now as the reference"""
+    date = now.strftime('%Y-%m-%d')
+    time_ = '10:00'
+    for line in body.split('\n'):
+        if 'on' in line.lower():
+            if 'friday' in line.lower():
+                date = (now + timedelta(days=(4 - now.weekday()) % 7)).strftime('%Y-%m-%d')
+            if 'at' in line.lower():
+                time_str = line.split('at')[-1].strip().lower()
+                if 'pm' in time_str:
+                    hour = int(time_str.split('pm')[0].strip()) + 12
+                    time_ = f"{hour:02d}:00"
+                elif 'am' in time_str:
+                    hour = int(time_str.split('am')[0].strip())
+                    time_ = f"{hour:02d}:00"
+                else:
+                    time_ = time_str[:5]
+    return datetime.strptime(f"{date}T{time_}", '%Y-%m-%dT%H:%M').replace(tzinfo=ZoneInfo(TIMEZONE))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200, help="passes over the corpus for the timing")
+    parser.add_argument('--verbose', action='store_true', help="print the emails the extractor gets wrong")
+    args = parser.parse_args()
+
+    emails = load_fixtures()
+    meetings = [e for e in emails if e['expected']]
+    top, anywhere, false_positives = 0, 0, 0
+    for email in emails:
+        slots = extract_email_slots(email, TIMEZONE)
+        starts = [slot['start'] for slot in slots]
+        if not email['expected']:
+            false_positives += bool(slots and slots[0]['confidence'] >= 0.5)
+            continue
+        expected = datetime.fromisoformat(email['expected'])
+        top += bool(starts) and starts[0] == expected
+        anywhere += expected in starts
+        if args.verbose and (not starts or starts[0] != expected):
+            print(f"{email['id']}: expected {expected}, got {[s.isoformat() for s in starts]}")
+
+    old_correct, old_errors = 0, 0
+    for email in meetings:
+        try:
+            found = old_extract(email['body'], datetime.fromtimestamp(email['timestamp'], ZoneInfo(TIMEZONE)))
+        except ValueError:
+            old_errors += 1
+            continue
+        old_correct += found == datetime.fromisoformat(email['expected'])
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for email in emails:
+            extract_email_slots(email, TIMEZONE)
+    elapsed = time.perf_counter() - started
+    count = args.repeat * len(emails)
+
+    print(f"{len(emails)} emails ({len(meetings)} with a meeting): {count / elapsed:,.0f} extractions/sec")
+    print(f"  extract_slots: top candidate right {top}/{len(meetings)}, among candidates {anywhere}/{len(meetings)}, "
+          f"confident slot in {false_positives}/{len(emails) - len(meetings)} emails without one")
+    print(f"  old parser: right {old_correct}/{len(meetings)}, raised on {old_errors}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Ingest throughput of per-message store_email vs bulk store_emails.
+
+Run from src/:  python -m benchmarks.bench_ingest --sizes 10000 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.synthetic import synthetic_emails
+from services.email_parser import EmailManager
+
+
+def ingest(db_path, emails, bulk, commit_interval):
+    manager = EmailManager(db_path)
+    started = time.perf_counter()
+    if bulk:
+        manager.store_emails(emails, commit_interval=commit_interval)
+    else:
+        for email in emails:
+            manager.store_email(email)
+    elapsed = time.perf_counter() - started
+    manager.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--commit-interval', type=int, default=1000)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        emails = list(synthetic_emails(size, body_words=(20, 200)))
+        with tempfile.TemporaryDirectory() as tmp:
+            single = ingest(os.path.join(tmp, 'single.db'), emails, False, args.commit_interval)
+            bulk = ingest(os.path.join(tmp, 'bulk.db'), emails, True, args.commit_interval)
+            # Re-ingesting the same messages must not duplicate attachment rows
+            again = ingest(os.path.join(tmp, 'bulk.db'), emails, True, args.commit_interval)
+        print(f"{size} messages: store_email {size / single:,.0f} rows/s, "
+              f"store_emails {size / bulk:,.0f} rows/s ({single / bulk:.1f}x), "
+              f"re-ingest {size / again:,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
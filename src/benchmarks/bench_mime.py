@@ -0,0 +1,113 @@
+"""Microbenchmark of MIME body extraction: legacy nested walk vs the single-pass walker.
+
+The corpus is a directory of JSON files, each holding one messages().get(format='full')
+response or a list of them. Without --corpus two synthetic newsletter-heavy corpora are
+timed: multipart/alternative with text/plain first (the usual order, where the legacy
+walk stops before the HTML) and with the HTML first (where it runs html2text).
+
+Run from src/:  python -m benchmarks.bench_mime --corpus recorded_payloads/
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import random
+import time
+import html2text
+from services.email_parser import EmailManager
+
+
+def legacy_extract(msg):
+    """the pre-walker extraction: nested recursion, eager html2text, second pass for attachments"""
+    def extract_body(payload):
+        body = ''
+        if 'parts' in payload:
+            for part in payload['parts']:
+                if part['mimeType'] == 'text/plain' and 'data' in part['body']:
+                    body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
+                    break
+                elif part['mimeType'] == 'text/html' and 'data' in part['body']:
+                    html_content = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
+                    body = html2text.html2text(html_content)
+                    break
+                elif 'parts' in part:
+                    body = extract_body(part)
+                    if body:
+                        break
+        elif 'data' in payload['body']:
+            body = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8', errors='ignore')
+        return body
+
+    body = extract_body(msg['payload'])
+    attachments = [part['filename'] for part in msg['payload'].get('parts', []) if part.get('filename')]
+    return body, attachments
+
+
+def _encode(text):
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def synthetic_corpus(count=300, seed=7, plain_first=True):
+    """newsletter-style payloads: large HTML, most with a plain alternative listed before (or after) it"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        rows = ''.join(f'<tr><td><a href="https://example.com/{j}">Item {j}</a></td><td>{"x" * 80}</td></tr>'
+                       for j in range(rng.randint(50, 800)))
+        html = f'<html><body><h1>Weekly digest {i}</h1><table>{rows}</table></body></html>'
+        plain = f'Weekly digest {i}\n' + '\n'.join(f'Item {j}' for j in range(50))
+        html_part = {'mimeType': 'text/html', 'filename': '', 'body': {'data': _encode(html), 'size': len(html)}}
+        plain_part = {'mimeType': 'text/plain', 'filename': '', 'body': {'data': _encode(plain), 'size': len(plain)}}
+        if not i % 3:
+            alternatives = [html_part]
+        else:
+            alternatives = [plain_part, html_part] if plain_first else [html_part, plain_part]
+        parts = [{'mimeType': 'multipart/alternative', 'filename': '', 'body': {'size': 0}, 'parts': alternatives}]
+        if i % 5 == 0:
+            parts.append({'mimeType': 'application/pdf', 'filename': f'report{i}.pdf',
+                          'body': {'attachmentId': f'att{i}', 'size': 20000}})
+        corpus.append({'id': f'm{i}', 'threadId': f'm{i}', 'internalDate': '0', 'payload': {
+            'mimeType': 'multipart/mixed', 'headers': [{'name': 'Subject', 'value': f'Digest {i}'}],
+            'body': {'size': 0}, 'parts': parts}})
+    return corpus
+
+
+def load_corpus(directory):
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        with open(path) as f:
+            data = json.load(f)
+        corpus.extend(data if isinstance(data, list) else [data])
+    return corpus
+
+
+def run(func, corpus, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for msg in corpus:
+            func(msg)
+    return (time.perf_counter() - started) / (repeat * len(corpus))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--corpus', help='directory of recorded JSON payloads')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpora = [('recorded', load_corpus(args.corpus))]
+    else:
+        corpora = [('plain first', synthetic_corpus(plain_first=True)),
+                   ('html first', synthetic_corpus(plain_first=False))]
+    for name, corpus in corpora:
+        print(f"{name}: {len(corpus)} payloads")
+        legacy = run(legacy_extract, corpus, args.repeat)
+        walker = run(EmailManager.parse_message, corpus, args.repeat)
+        print(f"  legacy extract_body: {legacy * 1e6:,.0f} us/msg")
+        print(f"  single-pass walker:  {walker * 1e6:,.0f} us/msg ({legacy / walker:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
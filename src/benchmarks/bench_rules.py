@@ -0,0 +1,55 @@
+"""Bulk policy evaluation over stored mail: compiled RuleEngine vs the old per-email any() checks.
+
+Run from src/:  python -m benchmarks.bench_rules --rows 100000 --keywords 200
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from benchmarks.synthetic import build_synthetic_db
+from services.email_parser import EmailManager
+from services.rules import DEFAULT_RULES, RuleEngine
+
+
+def old_is_important(sender, subject, senders, keywords):
+    sender, subject = sender.lower(), subject.lower()
+    return any(s in sender for s in senders) or any(k in subject for k in keywords)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--keywords', type=int, default=200, help="subject keywords in the policy")
+    args = parser.parse_args()
+
+    # The default keywords plus filler ones, as a grown rules file would have
+    keywords = DEFAULT_RULES['important']['subject_keywords'] + [f'campaign{n}' for n in range(args.keywords)]
+    domains = DEFAULT_RULES['important']['sender_domains']
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        build_synthetic_db(db_path, args.rows, body_words=(5, 10))
+        manager = EmailManager(db_path)
+        rules_path = os.path.join(tmp, 'rules.json')
+        with open(rules_path, 'w') as f:
+            json.dump({'important': {'sender_domains': domains, 'subject_keywords': keywords}}, f)
+        engine = RuleEngine(rules_path)
+
+        started = time.perf_counter()
+        rows = manager.conn.execute("SELECT id, sender, subject FROM emails").fetchall()
+        old = [row[0] for row in rows
+               if old_is_important(row[1], row[2], ['@' + d for d in domains], keywords)]
+        old_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        new = engine.classify_db(manager.conn, 'important')
+        new_time = time.perf_counter() - started
+        manager.close()
+
+    print(f"{args.rows} rows, {len(keywords)} keywords: any() {old_time:.2f}s, "
+          f"RuleEngine {new_time:.2f}s ({old_time / new_time:.1f}x), "
+          f"matched {len(old)} vs {len(new)}, same ids: {set(old) == set(new)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""EmailDrafter() startup time and the number of discovery builds it triggers.
+
+Uses a token.json with a non-expired access token in a temporary directory, so
+no OAuth flow or network access is needed (discovery documents are the static
+copies bundled with google-api-python-client). Models are not loaded.
+
+Run from src/:  python -m benchmarks.bench_startup --runs 20
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+import services.gmail_auth as gmail_auth
+from controllers.email_drafter import EmailDrafter
+
+
+def write_token(path):
+    expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+    with open(path, 'w') as f:
+        json.dump({'token': 'bench-access-token', 'refresh_token': 'bench-refresh-token',
+                   'client_id': 'bench.apps.googleusercontent.com', 'client_secret': 'bench-secret',
+                   'token_uri': 'https://oauth2.googleapis.com/token', 'scopes': gmail_auth.GmailAuthenticator.SCOPES,
+                   'expiry': expiry.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    builds = []
+    real_build = gmail_auth.build
+
+    def counting_build(*a, **kw):
+        builds.append(a[:2])
+        return real_build(*a, **kw)
+    gmail_auth.build = counting_build
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            write_token('token.json')
+            timings = []
+            for _ in range(args.runs):
+                builds.clear()
+                started = time.perf_counter()
+                drafter = EmailDrafter(db_path=os.path.join(tmp, 'emails.db'))
+                timings.append(time.perf_counter() - started)
+                drafter.close()
+        finally:
+            os.chdir(cwd)
+            gmail_auth.build = real_build
+
+    print(f"EmailDrafter(): median {statistics.median(timings) * 1000:.1f} ms, "
+          f"min {min(timings) * 1000:.1f} ms over {args.runs} runs")
+    print(f"discovery builds per startup: {len(builds)} {sorted(set(builds))}")
+
+
+if __name__ == '__main__':
+    main()
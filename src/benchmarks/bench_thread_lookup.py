@@ -0,0 +1,51 @@
+"""Thread lookup latency with and without the emails(thread_id, timestamp) index.
+
+Run from src/:  python -m benchmarks.bench_thread_lookup --rows 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from benchmarks.synthetic import build_synthetic_db
+from utils.db_utils import get_db_connection
+
+THREAD_QUERY = "SELECT sender, subject, body FROM emails WHERE thread_id = ? ORDER BY timestamp"
+
+
+def time_lookups(conn, thread_ids, lookups):
+    started = time.perf_counter()
+    for thread_id in thread_ids[:lookups]:
+        conn.execute(THREAD_QUERY, (thread_id,)).fetchall()
+    return (time.perf_counter() - started) / lookups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--messages-per-thread', type=int, default=5)
+    parser.add_argument('--lookups', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        started = time.perf_counter()
+        thread_ids = build_synthetic_db(db_path, args.rows, messages_per_thread=args.messages_per_thread,
+                                        body_words=(5, 30))
+        print(f"built {args.rows} rows in {time.perf_counter() - started:.1f}s")
+        random.Random(0).shuffle(thread_ids)
+
+        conn = get_db_connection(db_path)
+        conn.execute("DROP INDEX idx_emails_thread_timestamp")
+        # Unindexed scans are slow; a handful of lookups is enough to measure them
+        unindexed = time_lookups(conn, thread_ids, max(1, min(args.lookups, 5)))
+        conn.execute("CREATE INDEX idx_emails_thread_timestamp ON emails(thread_id, timestamp)")
+        indexed = time_lookups(conn, thread_ids, args.lookups)
+        conn.close()
+
+    print(f"thread lookup without index: {unindexed * 1000:.2f} ms")
+    print(f"thread lookup with index:    {indexed * 1000:.3f} ms ({unindexed / indexed:.0f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
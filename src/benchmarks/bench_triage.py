@@ -0,0 +1,72 @@
+"""How much model work the scheduling and reply cascades avoid on the fixture emails.
+
+Compares against the previous checks: a summarizer call for every body containing
+'meeting', 'call', 'schedule', 'on', 'at' or 'next' as a substring, and a
+classifier call for every reply candidate (the reply cascade makes none).
+Prints per-stage counters.
+
+Run from src/:  python -m benchmarks.bench_triage --repeat 5
+"""
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.bench_backends import load_fixtures
+from services.email_analyzer import EmailAnalyzer
+from services.email_parser import EmailManager
+from services.triage import reply_cascade, scheduling_cascade
+
+OLD_SCHEDULING_KEYWORDS = ['meeting', 'call', 'schedule', 'on', 'at', 'next']
+
+
+def fixture_emails(repeat):
+    for n in range(repeat):
+        for email in load_fixtures():
+            yield {'id': f"{email['id']}-{n}", 'thread_id': f"{email['id']}-{n}", 'sender': 'someone@example.com',
+                   'recipient': 'me@example.com', 'subject': email['subject'], 'timestamp': 1700000000 + n,
+                   'body': email['body'], 'labels': ['INBOX'], 'attachments': []}
+
+
+def report(name, cascade, elapsed, old_model_calls):
+    stats = cascade.stats()
+    print(f"{name}: {elapsed:.2f}s")
+    for stage, counters in stats.items():
+        if stage == 'unresolved':
+            continue
+        print(f"  {stage}: saw {counters['seen']}, resolved {counters['resolved']} ({counters['share']:.0%}, "
+              f"{counters['positive']} yes) in {counters['seconds'] * 1000:.1f}ms")
+    model_calls = sum(counters['seen'] for stage, counters in stats.items() if stage not in ('rules', 'unresolved'))
+    print(f"  model calls {model_calls} (previously {old_model_calls}), {stats['unresolved']} left to the default")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=1, help="copies of the fixture set (distinct ids)")
+    args = parser.parse_args()
+
+    emails = list(fixture_emails(args.repeat))
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        manager = EmailManager(db_path)
+        manager.store_emails(emails)
+        manager.close()
+        # Caching off so repeated fixtures cost a real model call each
+        analyzer = EmailAnalyzer(db_path=db_path, use_cache=False)
+
+        cascade = scheduling_cascade(analyzer)
+        started = time.perf_counter()
+        for email in emails:
+            cascade.decide(email)
+        old_calls = sum(any(kw in email['body'].lower() for kw in OLD_SCHEDULING_KEYWORDS) for email in emails)
+        report('scheduling', cascade, time.perf_counter() - started, old_calls)
+
+        cascade = reply_cascade()
+        started = time.perf_counter()
+        for email in emails:
+            cascade.decide(email)
+        report('reply', cascade, time.perf_counter() - started, len(emails))
+        analyzer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Custom Search calls made by WebSearchAssistant with the result cache and request coalescing.
+
+Newsletter-style mail repeats a handful of subjects (with Re:/Fwd: variations)
+and opening lines, so most queries are duplicates. Emails are processed from a
+thread pool against the local customsearch stub, which adds per-request latency.
+
+Run from src/:  python -m benchmarks.bench_web_search --emails 2000 --workers 8
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from services.email_parser import EmailManager
+from services.web_search_assistant import WebSearchAssistant
+from utils.fake_customsearch import FakeCustomSearchService
+
+SUBJECTS = ['Weekly jobs digest', 'New jobs matching data engineer', 'Your invitation is waiting',
+            'How was your order?', 'What is new in release 2.4', 'Team offsite questions']
+PREFIXES = ['', '', 'Re: ', 'RE: ', 'Fwd: ', 'Re: Re: ']
+OPENINGS = ['How do I update my preferences?', 'What time does the offsite start?',
+            'Have you seen these new roles?', 'What did you think of your purchase?']
+# Templated text pushing the per-email part past the 100 characters that go into the query
+TEMPLATE = 'Read on for this week\'s highlights, hand-picked for you by our editors and partners.'
+
+
+
+def newsletter_emails(count, distinct, seed=7):
+    rng = random.Random(seed)
+    topics = [(rng.choice(SUBJECTS), rng.choice(OPENINGS)) for _ in range(distinct)]
+    for i in range(count):
+        subject, opening = rng.choice(topics)
+        yield {'id': f'msg{i:08d}', 'thread_id': f'thr{i:08d}', 'sender': 'news@example.com',
+               'recipient': 'me@example.com', 'subject': rng.choice(PREFIXES) + subject,
+               'timestamp': 1700000000 + i, 'body': f"{opening} {TEMPLATE} Item {i}.",
+               'labels': ['INBOX'], 'attachments': []}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=2000)
+    parser.add_argument('--distinct', type=int, default=20, help="distinct subject/opening pairs")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per stub request")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        manager = EmailManager(db_path)
+        manager.store_emails(newsletter_emails(args.emails, args.distinct))
+        manager.close()
+
+        stub = FakeCustomSearchService(latency=args.latency)
+        assistant = WebSearchAssistant(db_path, search_service=stub, daily_quota=None, rate=1000.0)
+        email_ids = [f'msg{i:08d}' for i in range(args.emails)]
+        started = time.perf_counter()
+        # process_email_query prints every response; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(args.workers) as pool:
+            list(pool.map(assistant.process_email_query, email_ids))
+        elapsed = time.perf_counter() - started
+        stats = assistant.search_stats()
+        assistant.close()
+
+    print(f"{args.emails} emails in {elapsed:.2f}s: {stub.request_count} API requests "
+          f"(uncached: {args.emails}), hit rate {stats['hit_rate']:.1%}, "
+          f"{stats['coalesced']} coalesced, quota saved {stats['quota_saved']}")
+
+
+if __name__ == '__main__':
+    main()
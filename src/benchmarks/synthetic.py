@@ -0,0 +1,73 @@
+"""Synthetic mailbox generator shared by the benchmarks."""
+import random
+from datetime import datetime, timezone
+from services.email_parser import EmailManager
+
+WORDS = ('meeting project update schedule review budget deadline call team report client invoice '
+         'proposal follow up thanks regards please confirm tomorrow friday agenda notes draft launch '
+         'contract feedback question availability office quarter plan').split()
+# Long tail of rarer words, drawn with a Zipf-like distribution so term frequencies look like real mail
+RARE_WORDS = [f'{prefix}{n}' for n in range(2000) for prefix in ('proj', 'acct', 'ref', 'item', 'team')]
+SENDERS = ['alice@example.com', 'bob@example.org', 'jobs@indeed.com', 'news@linkedin.com',
+           'carol@example.net', 'dave@example.com', 'erin@example.org', 'frank@example.io']
+
+
+def random_word(rng):
+    if rng.random() < 0.7:
+        return rng.choice(WORDS)
+    return RARE_WORDS[min(int(rng.paretovariate(1.0)) - 1, len(RARE_WORDS) - 1)]
+
+
+def random_text(rng, words):
+    return ' '.join(random_word(rng) for _ in range(words)).capitalize() + '.'
+
+
+def quote(body, sender, timestamp):
+    """a reply-style quote block, as mail clients append below a reply"""
+    when = datetime.fromtimestamp(timestamp, timezone.utc).strftime('%a, %b %d, %Y at %I:%M %p')
+    quoted = '\n'.join('> ' + line for line in body.splitlines())
+    return f"\n\nOn {when} {sender} wrote:\n{quoted}"
+
+
+def synthetic_emails(count, messages_per_thread=5, body_words=(20, 400), seed=42, start_ts=1700000000,
+                     quote_replies=False):
+    """yield email dicts shaped like EmailManager.parse_message output.
+
+    With quote_replies each reply carries the previous message of its thread quoted
+    below a signature, the way real reply chains repeat their history.
+    """
+    rng = random.Random(seed)
+    previous = None
+    for i in range(count):
+        thread = i // messages_per_thread
+        sender = rng.choice(SENDERS)
+        timestamp = start_ts + i * 60
+        body = random_text(rng, rng.randint(*body_words))
+        if quote_replies:
+            body += f"\n\n--\n{sender.split('@')[0].capitalize()}\nSent from my phone"
+            if previous and i % messages_per_thread:
+                body += quote(*previous)
+            previous = (body, sender, timestamp)
+        yield {
+            'id': f'msg{i:08d}',
+            'thread_id': f'thr{thread:08d}',
+            'sender': sender,
+            'recipient': 'me@example.com',
+            'subject': random_text(rng, 6),
+            'timestamp': timestamp,
+            'body': body,
+            'labels': ['INBOX'],
+            'attachments': ([{'filename': f'file{i}.pdf', 'mime_type': 'application/pdf', 'size': 1024}]
+                            if i % 10 == 0 else [])
+        }
+
+
+def build_synthetic_db(db_path, count, messages_per_thread=5, **kwargs):
+    """populate db_path with count synthetic emails and return the list of thread ids"""
+    manager = EmailManager(db_path)
+    manager.store_emails(synthetic_emails(count, messages_per_thread, **kwargs), commit_interval=10000)
+    c = manager.conn.cursor()
+    c.execute("SELECT DISTINCT thread_id FROM emails")
+    thread_ids = [row[0] for row in c.fetchall()]
+    manager.close()
+    return thread_ids
@@ -4,6 +4,8 @@ from email.mime.text import MIMEText
 from services.gmail_auth import GmailAuthenticator
 from services.calendar_scheduler import CalendarScheduler
 from services.email_analyzer import EmailAnalyzer
+from services.rules import get_rules
+from services.triage import reply_cascade
 
 # Set up logging
 logging.basicConfig(filename='replies.log', level=logging.INFO, 
@@ -12,14 +14,28 @@ logging.basicConfig(filename='replies.log', level=logging.INFO,
 class EmailDrafter:
     """Class to draft and send automated email replies."""
 
-    def __init__(self, db_path='emails.db'):
+    def __init__(self, db_path='emails.db', warm_up=False, authenticator=None, analyzer=None, scheduler=None,
+                 rules=None):
         """Initialize with Gmail service, Calendar scheduler, and LLM analyzer."""
         print("Initializing EmailDrafter...")
-        self.authenticator = GmailAuthenticator()
+        self.authenticator = authenticator or GmailAuthenticator()
         self.service = self.authenticator.get_service('gmail', 'v1')
-        self.scheduler = CalendarScheduler(self.authenticator, db_path=db_path)
-        self.analyzer = EmailAnalyzer(self.authenticator ,db_path=db_path)
-        self.safe_senders = ['ajithpspk123@gmail.com']  # Whitelist for auto-send
+        # Components passed in (e.g. by the mail daemon) are shared, so the caller closes them;
+        # the ones created here are closed by close()
+        self._owns_analyzer = analyzer is None
+        self._owns_scheduler = scheduler is None
+        self.analyzer = analyzer or EmailAnalyzer(self.authenticator, db_path=db_path)
+        self.scheduler = scheduler or CalendarScheduler(self.authenticator, db_path=db_path, analyzer=self.analyzer)
+        # Rules decide; emails they leave open get no automated reply
+        self.reply_cascade = reply_cascade()
+        if warm_up:
+            self.analyzer.models.warm_up()
+        # Whitelist for auto-send: the safe_senders policy in rules.json
+        self.rules = rules or get_rules()
+
+    def is_safe_sender(self, sender):
+        """whether replies to sender (a raw From header) may be sent without confirmation"""
+        return self.rules.is_safe_sender(sender)
 
     def get_email_details(self, email_id):
         """Retrieve email details from the database."""
@@ -30,18 +46,20 @@ class EmailDrafter:
         email = self.get_email_details(email_id)
         if not email:
             return False
-        intent = self.analyzer.infer_intent(email_id)
-        return 'request' in intent.lower() or 'meeting' in email['body'].lower()
+        return self.reply_cascade.decide(dict(email, id=email_id))
 
-    def draft_reply(self, email_id):
+    def draft_reply(self, email_id, book_event=True):
         """Draft a reply using LLM based on email content."""
         email = self.get_email_details(email_id)
         if not email:
             return None
 
-        # Check for scheduling request and book event
-        event_booked = self.scheduler.create_calendar_event(email_id)
-        meeting_details = self.scheduler.detect_scheduling_intent(email_id) if event_booked else None
+        # Check for scheduling request and book event (unless the caller already booked it)
+        if book_event:
+            event_booked = self.scheduler.create_calendar_event(email_id)
+            meeting_details = self.scheduler.detect_scheduling_intent(email_id) if event_booked else None
+        else:
+            meeting_details = self.scheduler.detect_scheduling_intent(email_id)
 
         # Prepare LLM prompt
         prompt = (
@@ -52,14 +70,14 @@ class EmailDrafter:
         if meeting_details:
             prompt += (
                 f"A meeting was scheduled for {meeting_details['date']} at {meeting_details['time']} "
-                f"(Asia/Kolkata). Propose this time in the reply."
+                f"({meeting_details['start'].tzname()}). Propose this time in the reply."
             )
         else:
             prompt += "No specific action detected; provide a general acknowledgment."
         prompt += "\nKeep it concise and professional."
 
         # Use LLM to generate reply (BART summarizer as placeholder)
-        reply_text = self.analyzer.summarizer(prompt, max_length=150, min_length=50, do_sample=False)[0]['summary_text']
+        reply_text = self.analyzer.summarize_text(prompt, max_length=150, min_length=50)
         
         return {
             'to': email['sender'],
@@ -67,9 +85,14 @@ class EmailDrafter:
             'body': reply_text
         }
 
-    def send_reply(self, email_id, auto_send=False):
-        """Send the drafted reply via Gmail API with safeguards."""
-        draft = self.draft_reply(email_id)
+    def send_reply(self, email_id, auto_send=False, book_event=True, raise_errors=False, draft=None):
+        """Send the drafted reply via Gmail API with safeguards.
+
+        draft is a reply from draft_reply to send as it is; without one a reply is
+        drafted here. With raise_errors a failed send raises instead of returning
+        False, so a caller can tell it apart from a reply that was not sent on purpose.
+        """
+        draft = draft or self.draft_reply(email_id, book_event=book_event)
         if not draft:
             print(f"No draft generated for email {email_id}.")
             return False
@@ -81,7 +104,7 @@ class EmailDrafter:
 
         # Check if auto-send is safe
         email = self.get_email_details(email_id)
-        if auto_send and email['sender'] in self.safe_senders:
+        if auto_send and self.is_safe_sender(email['sender']):
             message = MIMEText(draft['body'])
             message['to'] = draft['to']
             message['subject'] = draft['subject']
@@ -96,6 +119,8 @@ class EmailDrafter:
                 return True
             except Exception as e:
                 print(f"Error sending reply: {e}")
+                if raise_errors:
+                    raise
                 return False
         else:
             # Require confirmation
@@ -122,8 +147,10 @@ class EmailDrafter:
 
     def close(self):
         """Close resources."""
-        self.scheduler.close()
-        self.analyzer.close()
+        if self._owns_scheduler:
+            self.scheduler.close()
+        if self._owns_analyzer:
+            self.analyzer.close()
 
 if __name__ == '__main__':
     drafter = EmailDrafter()
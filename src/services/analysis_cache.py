@@ -0,0 +1,92 @@
+import hashlib
+import json
+import time
+
+
+class AnalysisCache:
+    """Content-addressed cache of model outputs stored in emails.db, with LRU eviction."""
+
+    def __init__(self, conn, max_entries=50000):
+        """Initialize with a connection from get_db_connection and the maximum number of cached entries."""
+        self.conn = conn
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._count = self.conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(model, params, text):
+        """hash of model name, generation parameters and input text"""
+        digest = hashlib.sha256()
+        digest.update(json.dumps({'model': model, 'params': params}, sort_keys=True).encode())
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8', errors='surrogatepass'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """return the cached value for key, or None"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """return {key: value} for the keys present in the cache, marking them recently used"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        c = self.conn.cursor()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f"SELECT key, value FROM analysis_cache WHERE key IN ({placeholders})", chunk)
+            found.update(c.fetchall())
+        if found:
+            c.executemany("UPDATE analysis_cache SET last_used = ? WHERE key = ?",
+                          [(time.time(), key) for key in found])
+            self.conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key, kind, value):
+        self.put_many([(key, kind, value)])
+
+    def put_many(self, entries):
+        """store (key, kind, value) entries, evicting least recently used ones past max_entries"""
+        now = time.time()
+        c = self.conn.cursor()
+        for key, kind, value in entries:
+            c.execute('''INSERT INTO analysis_cache (key, kind, value, created_at, last_used)
+                         VALUES (?, ?, ?, ?, ?)
+                         ON CONFLICT(key) DO UPDATE SET value = excluded.value, last_used = excluded.last_used''',
+                      (key, kind, value, now, now))
+        self._count += len(entries)
+        if self._count > self.max_entries:
+            self._evict()
+        self.conn.commit()
+
+    def _evict(self):
+        c = self.conn.cursor()
+        # Re-count: other processes may share the table and upserts don't grow it
+        self._count = c.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+        excess = self._count - self.max_entries
+        if excess <= 0:
+            return
+        c.execute('''DELETE FROM analysis_cache WHERE key IN (
+                         SELECT key FROM analysis_cache ORDER BY last_used LIMIT ?)''', (excess,))
+        self.evictions += c.rowcount
+        self._count -= c.rowcount
+
+    def clear(self):
+        self.conn.execute("DELETE FROM analysis_cache")
+        self.conn.commit()
+        self._count = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': self._count,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from services.model_registry import MODEL_SPECS, ModelRegistry, get_registry, model_id
+
+# Set in each worker by _init_worker; the registry there is that process's own
+_worker_state = {}
+
+
+def _init_worker(model_names, torch_threads, backend):
+    # Pin intra-op threads before the first forward pass, so N workers x M threads fits the cores
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[var] = str(torch_threads)
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass  # RuntimeError: interop threads already set (forked from a process that used torch)
+    registry = ModelRegistry(backend=backend)
+    registry.warm_up(model_names)
+    _worker_state['registry'] = registry
+
+
+def _ping(hold):
+    # Holding each worker briefly keeps it busy, so the executor starts a process per ping
+    time.sleep(hold)
+    return os.getpid()
+
+
+def _summarize(texts, params, batch_size):
+    summarizer = _worker_state['registry'].get('summarizer')
+    return [out['summary_text'] for out in summarizer(list(texts), batch_size=batch_size, **params)]
+
+
+def _classify(texts, batch_size):
+    classifier = _worker_state['registry'].get('classifier')
+    return [out['label'] for out in classifier(list(texts), batch_size=batch_size)]
+
+
+class AnalysisPool:
+    """Process pool for CPU inference: each worker loads the pipelines once and owns a slice of the cores.
+
+    Methods return concurrent.futures.Future objects. Workers are started with the
+    'spawn' method by default, since forking a process that has already run torch
+    can deadlock its thread pools.
+    """
+
+    def __init__(self, workers=None, torch_threads=None, models=None, mp_context='spawn', backend=None):
+        """Initialize with the worker count and torch threads per worker (both derived from the core count).
+
+        backend defaults to the one this process's registry uses.
+        """
+        cores = os.cpu_count() or 1
+        if workers is None:
+            workers = max(1, cores // (torch_threads or 1)) if torch_threads else cores
+        self.workers = workers
+        self.torch_threads = torch_threads or max(1, cores // workers)
+        self.models = list(models or MODEL_SPECS)
+        self.backend = backend or get_registry().backend
+        self.executor = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context(mp_context),
+                                            initializer=_init_worker,
+                                            initargs=(self.models, self.torch_threads, self.backend))
+
+    def model_id(self, name):
+        """identifier of the outputs the workers produce for the model called name"""
+        return model_id(MODEL_SPECS[name]['model'], self.backend)
+
+    def warm_up(self):
+        """start every worker (each loads its models) and return how many came up"""
+        futures = [self.executor.submit(_ping, 0.2) for _ in range(self.workers)]
+        return len({future.result() for future in futures})
+
+    def submit_summaries(self, texts, max_length=130, min_length=30, batch_size=8):
+        """Future resolving to the summaries of texts (generated in one worker)"""
+        params = {'max_length': max_length, 'min_length': min_length, 'do_sample': False}
+        return self.executor.submit(_summarize, list(texts), params, batch_size)
+
+    def summarize(self, text, max_length=130, min_length=30):
+        """Future resolving to the summary of one text"""
+        future = self.submit_summaries([text], max_length, min_length, batch_size=1)
+        return _first(future)
+
+    def map_summaries(self, texts, max_length=130, min_length=30, batch_size=8):
+        """split texts into batches across the workers; returns one Future per batch, in order"""
+        texts = list(texts)
+        return [self.submit_summaries(texts[start:start + batch_size], max_length, min_length, batch_size)
+                for start in range(0, len(texts), batch_size)]
+
+    def submit_labels(self, texts, batch_size=32):
+        """Future resolving to the classifier label of each text"""
+        return self.executor.submit(_classify, list(texts), batch_size)
+
+    def map_labels(self, texts, batch_size=32):
+        texts = list(texts)
+        return [self.submit_labels(texts[start:start + batch_size], batch_size)
+                for start in range(0, len(texts), batch_size)]
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _first(future):
+    """Future of future.result()[0]"""
+    first = Future()
+
+    def done(source):
+        if source.cancelled():
+            first.cancel()
+        elif source.exception() is not None:
+            first.set_exception(source.exception())
+        else:
+            first.set_result(source.result()[0])
+    future.add_done_callback(done)
+    return first
+
+
+def gather(futures):
+    """results of a list of batch futures, flattened in order"""
+    results = []
+    for future in futures:
+        results.extend(future.result())
+    return results
@@ -0,0 +1,175 @@
+import base64
+import hashlib
+import os
+import tempfile
+import time
+from services.gmail_auth import GmailAuthenticator
+from utils.db_utils import get_db_connection
+
+# Encoded characters decoded per step; a multiple of 4 so every slice is valid base64
+DECODE_CHUNK_CHARS = 4 * 64 * 1024
+
+
+class AttachmentStore:
+    """Class to download attachment bodies on demand into a content-addressed, size-bounded disk cache."""
+
+    def __init__(self, service, db_path='emails.db', root='attachments', max_bytes=2 * 1024 ** 3):
+        """Initialize with a Gmail service, the email database and the cache directory and size limit."""
+        self.service = service
+        self.conn = get_db_connection(db_path)
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def list_attachments(self, message_id):
+        c = self.conn.cursor()
+        c.execute("SELECT filename, mime_type, size, sha256, part_id FROM attachments WHERE message_id = ? "
+                  "ORDER BY id", (message_id,))
+        return [{'filename': r[0], 'mime_type': r[1], 'size': r[2], 'sha256': r[3], 'part_id': r[4]}
+                for r in c.fetchall()]
+
+    def get_path(self, message_id, filename, part_id=None):
+        """return a local path to the attachment, downloading it on first access
+
+        part_id picks one of several attachments sharing a filename; without it the first is used.
+        """
+        c = self.conn.cursor()
+        if part_id is None:
+            c.execute("SELECT id, attachment_id, sha256, part_id FROM attachments "
+                      "WHERE message_id = ? AND filename = ? ORDER BY id LIMIT 1", (message_id, filename))
+        else:
+            c.execute("SELECT id, attachment_id, sha256, part_id FROM attachments WHERE message_id = ? AND part_id = ?",
+                      (message_id, part_id))
+        row = c.fetchone()
+        if not row:
+            print(f"Attachment {filename} of email {message_id} not found in database.")
+            return None
+        row_id, attachment_id, sha256, part_id = row
+
+        if sha256:
+            c.execute("SELECT path FROM attachment_blobs WHERE sha256 = ?", (sha256,))
+            blob = c.fetchone()
+            if blob and os.path.exists(blob[0]):
+                self.hits += 1
+                c.execute("UPDATE attachment_blobs SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+                self.conn.commit()
+                return blob[0]
+
+        self.misses += 1
+        if attachment_id:
+            response = self.service.users().messages().attachments().get(
+                userId='me', messageId=message_id, id=attachment_id).execute()
+            data = response['data']
+        else:
+            # Small parts carry their data inline in the message instead of an attachmentId
+            data = self._inline_data(message_id, part_id)
+            if data is None:
+                print(f"{filename} of email {message_id} has no attachmentId and no inline data "
+                      f"in MIME part {part_id}; it cannot be downloaded.")
+                return None
+        sha256, size, path = self._write_blob(data)
+
+        now = time.time()
+        c.execute('''INSERT INTO attachment_blobs (sha256, size, path, created_at, last_used)
+                     VALUES (?, ?, ?, ?, ?)
+                     ON CONFLICT(sha256) DO UPDATE SET last_used = excluded.last_used, path = excluded.path''',
+                  (sha256, size, path, now, now))
+        c.execute("UPDATE attachments SET sha256 = ? WHERE id = ?", (sha256, row_id))
+        self.conn.commit()
+        self._evict(keep=sha256)
+        return path
+
+    def _inline_data(self, message_id, part_id):
+        """body.data of the MIME part part_id, from the full message; None if there is none"""
+        if part_id is None:
+            return None
+        message = self.service.users().messages().get(userId='me', id=message_id, format='full').execute()
+        stack = [(message['payload'], '')]
+        while stack:
+            part, path = stack.pop()
+            if part.get('partId', path) == part_id:
+                return part.get('body', {}).get('data')
+            # Same numbering as mime_walker.walk_payload for payloads without partId
+            prefix = f"{path}." if path else ''
+            stack.extend((child, f"{prefix}{index}") for index, child in enumerate(part.get('parts', [])))
+        return None
+
+    def open(self, message_id, filename, part_id=None):
+        path = self.get_path(message_id, filename, part_id)
+        return open(path, 'rb') if path else None
+
+    def _write_blob(self, data):
+        """decode base64url data to disk chunk by chunk while hashing it; identical content is stored once"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for start in range(0, len(data), DECODE_CHUNK_CHARS):
+                    chunk = data[start:start + DECODE_CHUNK_CHARS]
+                    raw = base64.urlsafe_b64decode(chunk + '=' * (-len(chunk) % 4))
+                    digest.update(raw)
+                    f.write(raw)
+                    size += len(raw)
+            sha256 = digest.hexdigest()
+            path = self.blob_path(sha256)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return sha256, size, path
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def total_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM attachment_blobs").fetchone()[0]
+
+    def _evict(self, keep=None):
+        """delete least recently used blobs until the cache fits in max_bytes"""
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+        c = self.conn.cursor()
+        c.execute("SELECT sha256, size, path FROM attachment_blobs ORDER BY last_used")
+        victims = []
+        for sha256, size, path in c.fetchall():
+            if excess <= 0:
+                break
+            if sha256 == keep:
+                continue
+            victims.append((sha256, path))
+            excess -= size
+        for sha256, path in victims:
+            if os.path.exists(path):
+                os.remove(path)
+        # attachments.sha256 is kept so an evicted blob is simply re-downloaded next time
+        c.executemany("DELETE FROM attachment_blobs WHERE sha256 = ?", [(sha256,) for sha256, _ in victims])
+        self.conn.commit()
+        self.evictions += len(victims)
+
+    def stats(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM attachment_blobs").fetchone()[0]
+        return {'blobs': count, 'bytes': self.total_bytes(), 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    import sys
+    auth = GmailAuthenticator()
+    store = AttachmentStore(auth.get_service())
+    message_id = sys.argv[1]
+    for attachment in store.list_attachments(message_id):
+        print(f"{attachment['filename']}: {store.get_path(message_id, attachment['filename'], attachment['part_id'])}")
+    store.close()
@@ -0,0 +1,137 @@
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from services.email_parser import http_status
+
+# Private extended property linking an event to the email it was created from
+SOURCE_PROPERTY = 'sourceEmailId'
+# A full sync only lists events overlapping this window around now; with singleEvents=True an
+# unbounded list would expand every recurring event over all time
+SYNC_PAST_DAYS = 30
+SYNC_FUTURE_DAYS = 366
+
+
+def event_time(value, default_tz='UTC'):
+    """epoch seconds of an event start/end ({'dateTime': ..., 'timeZone': ...} or all-day {'date': ...})"""
+    try:
+        tz = ZoneInfo(value.get('timeZone') or default_tz)
+    except ZoneInfoNotFoundError:
+        tz = timezone.utc
+    if 'dateTime' in value:
+        parsed = datetime.fromisoformat(value['dateTime'])
+    else:
+        parsed = datetime.fromisoformat(value['date'])
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=tz)
+    return parsed.timestamp()
+
+
+class CalendarCache:
+    """Local copy of one calendar's events for free/busy, conflict and duplicate checks.
+
+    The first sync lists the events from past_days ago to future_days ahead and
+    keeps the nextSyncToken; later syncs ask only for changes since that token
+    (which may include events outside the window). An expired token (410 Gone)
+    falls back to a full sync. A sync that fails part way is rolled back, so the
+    copy never holds some pages of a sync without its token. Events inserted
+    through this process are recorded right away, so checks see them before the
+    next sync.
+    """
+
+    def __init__(self, conn, service, calendar_id='primary', min_sync_interval=60.0, past_days=SYNC_PAST_DAYS,
+                 future_days=SYNC_FUTURE_DAYS):
+        """Initialize with a connection from get_db_connection and a Calendar v3 service."""
+        self.conn = conn
+        self.service = service
+        self.calendar_id = calendar_id
+        self.min_sync_interval = min_sync_interval
+        self.past_days = past_days
+        self.future_days = future_days
+        self.syncs = {'full': 0, 'incremental': 0}
+        self._last_sync = 0.0
+
+    def get_sync_token(self):
+        row = self.conn.execute("SELECT sync_token FROM calendar_sync WHERE calendar_id = ?",
+                                (self.calendar_id,)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, force=False):
+        """bring the local copy up to date; skipped when the last sync was under min_sync_interval ago"""
+        if not force and time.monotonic() - self._last_sync < self.min_sync_interval:
+            return None
+        token = self.get_sync_token()
+        if token:
+            try:
+                changed = self._list(syncToken=token)
+                self.syncs['incremental'] += 1
+                self._last_sync = time.monotonic()
+                return changed
+            except Exception as e:
+                if http_status(e) != 410:
+                    raise
+                print("Calendar sync token expired, running a full sync...")
+        now = datetime.now(timezone.utc)
+        # The DELETE shares _list's transaction, so a failed full sync keeps the previous copy
+        self.conn.execute("DELETE FROM calendar_events WHERE calendar_id = ?", (self.calendar_id,))
+        changed = self._list(showDeleted=False,
+                             timeMin=(now - timedelta(days=self.past_days)).isoformat(),
+                             timeMax=(now + timedelta(days=self.future_days)).isoformat())
+        self.syncs['full'] += 1
+        self._last_sync = time.monotonic()
+        return changed
+
+    def _list(self, **params):
+        """page through events().list, applying every page and the new sync token in one transaction;
+        returns the number of events seen"""
+        seen = 0
+        page_token = None
+        try:
+            while True:
+                response = self.service.events().list(calendarId=self.calendar_id, singleEvents=True,
+                                                      maxResults=2500, pageToken=page_token, **params).execute()
+                for event in response.get('items', []):
+                    self.record(event, commit=False)
+                    seen += 1
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    break
+            self.conn.execute('''INSERT INTO calendar_sync (calendar_id, sync_token, last_sync) VALUES (?, ?, ?)
+                                 ON CONFLICT(calendar_id) DO UPDATE SET sync_token = excluded.sync_token,
+                                     last_sync = excluded.last_sync''',
+                              (self.calendar_id, response.get('nextSyncToken'), time.time()))
+            self.conn.commit()
+        except Exception:
+            # Earlier pages must not be committed later without the token that covers them
+            self.conn.rollback()
+            raise
+        return seen
+
+    def record(self, event, commit=True):
+        """apply one event resource (inserted here or returned by a sync) to the local copy"""
+        if event.get('status') == 'cancelled' or 'start' not in event:
+            self.conn.execute("DELETE FROM calendar_events WHERE calendar_id = ? AND event_id = ?",
+                              (self.calendar_id, event['id']))
+        else:
+            source = event.get('extendedProperties', {}).get('private', {}).get(SOURCE_PROPERTY)
+            self.conn.execute('''INSERT OR REPLACE INTO calendar_events
+                                 (calendar_id, event_id, summary, start, end, transparent, source_email_id, updated)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                              (self.calendar_id, event['id'], event.get('summary'), event_time(event['start']),
+                               event_time(event['end']), int(event.get('transparency') == 'transparent'),
+                               source, event.get('updated')))
+        if commit:
+            self.conn.commit()
+
+    def busy(self, start, end):
+        """events (id, summary, start, end) marked busy that overlap [start, end), in epoch seconds"""
+        rows = self.conn.execute('''SELECT event_id, summary, start, end FROM calendar_events
+                                    WHERE calendar_id = ? AND start < ? AND end > ? AND transparent = 0
+                                    ORDER BY start''', (self.calendar_id, end, start)).fetchall()
+        return [{'id': r[0], 'summary': r[1], 'start': r[2], 'end': r[3]} for r in rows]
+
+    def find_duplicate(self, email_id, summary, start):
+        """id of an event already created from email_id, or with the same summary and start time"""
+        row = self.conn.execute('''SELECT event_id FROM calendar_events
+                                   WHERE calendar_id = ? AND (source_email_id = ? OR (summary = ? AND start = ?))
+                                   LIMIT 1''', (self.calendar_id, email_id, summary, start)).fetchone()
+        return row[0] if row else None
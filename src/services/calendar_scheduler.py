@@ -1,24 +1,45 @@
-import sqlite3
+import os
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from services.calendar_cache import SOURCE_PROPERTY, CalendarCache, event_time
+from services.datetime_extraction import DEFAULT_DURATION, DEFAULT_TIME, extract_email_slots
 from services.email_analyzer import EmailAnalyzer
+from services.triage import scheduling_cascade
+from utils.db_utils import ANALYSIS_BODY_SQL, get_db_connection
+
+# Used where the email names no timezone
+TIMEZONE = os.getenv('CALENDAR_TIMEZONE', 'Asia/Kolkata')
+# Calendar batch requests are limited to 50 calls each
+BATCH_SIZE = 50
 
 class CalendarScheduler:
     """Class to schedule events on Google Calendar based on email content."""
 
-    def __init__(self, authenticator, db_path='emails.db'):
-        """Initialize with database, Calendar service, and LLM analyzer."""
+    def __init__(self, authenticator, db_path='emails.db', analyzer=None, small_model=None, service=None,
+                 calendar_id='primary', allow_conflicts=False):
+        """Initialize with database, Calendar service, and LLM analyzer.
+
+        Events that overlap a busy slot are not created unless allow_conflicts is set.
+        """
         print("Initializing CalendarScheduler...")
-        self.conn = sqlite3.connect(db_path)
-        self.service = authenticator.get_service('calendar', 'v3')  # Use shared authenticator
-        self.analyzer = EmailAnalyzer(authenticator, db_path=db_path)  # Pass authenticator
+        self.conn = get_db_connection(db_path)
+        self.service = service or authenticator.get_service('calendar', 'v3')  # Use shared authenticator
+        # Reuse the caller's analyzer when given; models are shared through the registry either way
+        self.owns_analyzer = analyzer is None
+        self.analyzer = analyzer or EmailAnalyzer(authenticator, db_path=db_path)
+        # Keyword rules decide most emails; only the ambiguous rest reaches the summarizer
+        self.cascade = scheduling_cascade(self.analyzer, small_model=small_model)
+        # Free/busy and already-scheduled checks run against a local, incrementally synced copy
+        self.cache = CalendarCache(self.conn, self.service, calendar_id=calendar_id)
+        self.allow_conflicts = allow_conflicts
 
     def get_email_content(self, email_id):
         """Retrieve email content from the database."""
         c = self.conn.cursor()
-        c.execute("SELECT sender, subject, body FROM emails WHERE id = ?", (email_id,))
+        c.execute(f"SELECT sender, subject, {ANALYSIS_BODY_SQL}, timestamp FROM emails WHERE id = ?", (email_id,))
         result = c.fetchone()
         if result:
-            return {'sender': result[0], 'subject': result[1], 'body': result[2]}
+            return {'sender': result[0], 'subject': result[1], 'body': result[2], 'timestamp': result[3]}
         print(f"Email {email_id} not found in database.")
         return None
 
@@ -28,84 +49,157 @@ class CalendarScheduler:
         if not email:
             return None
 
-        body = email['body']
-        # Simple heuristic + LLM enhancement
-        scheduling_keywords = ['meeting', 'call', 'schedule', 'on', 'at', 'next']
-        if not any(kw in body.lower() for kw in scheduling_keywords):
+        if not self.cascade.decide(email):
             return None
 
-        # Use LLM to extract structured details
-        prompt = (
-            f"Analyze this email body and extract meeting details if present:\n"
-            f"{body}\n\n"
-            f"Return in this format: Title: [title], Date: [YYYY-MM-DD], Time: [HH:MM] (24h). "
-            f"If no clear details, suggest defaults."
-        )
-        summary = self.analyzer.summarizer(body, max_length=100, min_length=30, do_sample=False)[0]['summary_text']
-        
-        # Dummy parsing (enhance with LLM or regex for production)
+        body = email['body'] or ''
         title = email['subject'] if 'meeting' in body.lower() else f"Meeting from {email['sender']}"
-        date = datetime.now().strftime('%Y-%m-%d')  # Default to today
-        time = '10:00'  # Default morning meeting
-        for line in body.split('\n'):
-            if 'on' in line.lower():
-                if 'friday' in line.lower():
-                    date = (datetime.now() + timedelta(days=(4 - datetime.now().weekday()) % 7)).strftime('%Y-%m-%d')
-                if 'at' in line.lower():
-                    time_str = line.split('at')[-1].strip().lower()
-                    if 'pm' in time_str:
-                        hour = int(time_str.split('pm')[0].strip()) + 12  # Convert PM to 24h
-                        time = f"{hour:02d}:00"
-                    elif 'am' in time_str:
-                        hour = int(time_str.split('am')[0].strip())
-                        time = f"{hour:02d}:00"
-                    else:
-                        time = time_str[:5]  # Fallback for "HH:MM"
-
-        event_details = {'title': title, 'date': date, 'time': time}
-        print(f"Detected scheduling intent: {event_details}")
+        # Candidate slots, best first; relative dates count from when the email was sent
+        slots = extract_email_slots(email, default_tz=TIMEZONE)
+        if slots:
+            best = slots[0]
+        else:
+            # Scheduling intent but no usable time: the default slot on the day the email was sent
+            sent = datetime.fromtimestamp(email['timestamp'] or datetime.now().timestamp(), ZoneInfo(TIMEZONE))
+            start = sent.replace(hour=DEFAULT_TIME[0], minute=DEFAULT_TIME[1], second=0, microsecond=0)
+            best = {'start': start, 'end': start + timedelta(minutes=DEFAULT_DURATION), 'timezone': TIMEZONE,
+                    'confidence': 0.0}
+
+        event_details = {'title': title, 'date': best['start'].strftime('%Y-%m-%d'),
+                         'time': best['start'].strftime('%H:%M'), 'start': best['start'], 'end': best['end'],
+                         'timezone': best['timezone'], 'confidence': best['confidence'],
+                         'alternatives': slots[1:]}
+        print(f"Detected scheduling intent: {title} on {event_details['date']} at {event_details['time']} "
+              f"{best['start'].tzname()} (confidence {best['confidence']:.2f}, {len(slots[1:])} alternatives)")
         return event_details
 
-    def create_calendar_event(self, email_id):
-        """Create a Google Calendar event from email details."""
+    def build_event(self, email_id):
+        """Calendar event resource for an email's scheduling intent (None if there is none)."""
         event_details = self.detect_scheduling_intent(email_id)
         if not event_details:
-            print(f"No scheduling intent detected for email {email_id}.")
-            return False
+            return None
 
-        # Format start and end times correctly for Google Calendar API
-        start_time = f"{event_details['date']}T{event_details['time']}:00"
-        end_time = (datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S') + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S')
+        # A stated UTC offset ("UTC+5:30") is not a zone name; such times are booked in the local timezone
+        timezone = event_details['timezone'] or TIMEZONE
+        start = event_details['start'].astimezone(ZoneInfo(timezone))
+        end = event_details['end'].astimezone(ZoneInfo(timezone))
 
-        event = {
+        return {
             'summary': event_details['title'],
             'start': {
-                'dateTime': start_time,
-                'timeZone': 'Asia/Kolkata'  # Adjust to your timezone
+                'dateTime': start.strftime('%Y-%m-%dT%H:%M:%S'),
+                'timeZone': timezone
             },
             'end': {
-                'dateTime': end_time,
-                'timeZone': 'Asia/Kolkata'
-            }
+                'dateTime': end.strftime('%Y-%m-%dT%H:%M:%S'),
+                'timeZone': timezone
+            },
+            # Lets later runs recognise the event as already scheduled for this email
+            'extendedProperties': {'private': {SOURCE_PROPERTY: email_id}}
         }
 
+    def check_event(self, email_id, event, planned=()):
+        """'duplicate' or 'conflict' if the event should not be created, else None.
+
+        planned holds (summary, start, end) of events about to be created in the same batch.
+        """
+        start, end = event_time(event['start']), event_time(event['end'])
+        duplicate = self.cache.find_duplicate(email_id, event['summary'], start)
+        if duplicate or any(summary == event['summary'] and s == start for summary, s, _ in planned):
+            print(f"Email {email_id} is already scheduled ({duplicate or 'earlier in this batch'}).")
+            return 'duplicate'
+        if self.allow_conflicts:
+            return None
+        busy = [b['summary'] for b in self.cache.busy(start, end)]
+        busy += [summary for summary, s, e in planned if s < end and e > start]
+        if busy:
+            print(f"Not scheduling email {email_id}: {event['start']['dateTime']} conflicts with {', '.join(map(str, busy))}.")
+            return 'conflict'
+        return None
+
+    def create_calendar_event(self, email_id):
+        """Create a Google Calendar event from email details."""
+        event = self.build_event(email_id)
+        if not event:
+            print(f"No scheduling intent detected for email {email_id}.")
+            return False
+
+        self.cache.sync()
+        status = self.check_event(email_id, event)
+        if status == 'duplicate':
+            return True  # the meeting is already on the calendar
+        if status == 'conflict':
+            return False
+
         try:
-            event_result = self.service.events().insert(calendarId='primary', body=event).execute()
+            event_result = self.service.events().insert(calendarId=self.cache.calendar_id, body=event).execute()
+            self.cache.record(event_result)
             print(f"Event created: {event_result.get('htmlLink')}")
             return True
         except Exception as e:
             print(f"Error creating event: {e}")
             return False
 
+    def create_calendar_events(self, email_ids, batch_size=BATCH_SIZE):
+        """Create events for many emails with one sync and batched inserts.
+
+        Returns {email_id: 'created' | 'duplicate' | 'conflict' | 'no_intent' | 'error'}.
+        """
+        results = {}
+        events = []
+        for email_id in dict.fromkeys(email_ids):
+            event = self.build_event(email_id)
+            if event:
+                events.append((email_id, event))
+            else:
+                results[email_id] = 'no_intent'
+        if not events:
+            return results
+
+        self.cache.sync()
+        planned = []
+        to_insert = []
+        for email_id, event in events:
+            status = self.check_event(email_id, event, planned)
+            if status:
+                results[email_id] = status
+                continue
+            planned.append((event['summary'], event_time(event['start']), event_time(event['end'])))
+            to_insert.append((email_id, event))
+
+        def inserted(request_id, response, exception):
+            if exception is not None:
+                print(f"Error creating event for email {request_id}: {exception}")
+                results[request_id] = 'error'
+            else:
+                self.cache.record(response, commit=False)
+                results[request_id] = 'created'
+
+        for start in range(0, len(to_insert), batch_size):
+            batch = self.service.new_batch_http_request(callback=inserted)
+            for email_id, event in to_insert[start:start + batch_size]:
+                batch.add(self.service.events().insert(calendarId=self.cache.calendar_id, body=event),
+                          request_id=email_id)
+            batch.execute()
+            self.conn.commit()
+        created = sum(status == 'created' for status in results.values())
+        print(f"Created {created} of {len(results)} events.")
+        return results
+
     def close(self):
         """Close the database connection and analyzer."""
         self.conn.close()
-        self.analyzer.close()
+        if self.owns_analyzer:
+            self.analyzer.close()
 
 if __name__ == '__main__':
-    from gmail_auth import GmailAuthenticator  # Import for standalone testing
+    import sys
+    from services.gmail_auth import GmailAuthenticator  # Import for standalone testing
     authenticator = GmailAuthenticator()  # Create instance for testing
     scheduler = CalendarScheduler(authenticator)  # Pass authenticator
-    email_id = '1960ff6580cb6e25'
-    scheduler.create_calendar_event(email_id)
+    email_ids = sys.argv[1:] or ['1960ff6580cb6e25']
+    if len(email_ids) == 1:
+        scheduler.create_calendar_event(email_ids[0])
+    else:
+        print(scheduler.create_calendar_events(email_ids))
     scheduler.close()
\ No newline at end of file
@@ -0,0 +1,410 @@
+"""Date, time, duration and timezone extraction for scheduling emails.
+
+One compiled pattern finds every date/time expression in a single pass over
+the text. Expressions in the same sentence are combined into candidate slots
+(each time is paired with the nearest date), and relative expressions such as
+"tomorrow", "next Friday" or "in 2 days" are resolved against the email's
+timestamp. Each slot gets a confidence from what was actually stated (an
+explicit date and time, scheduling vocabulary nearby, a timezone, a duration)
+so callers can pick the best one or offer the alternatives.
+"""
+import os
+import re
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from services.triage import SCHEDULING_RE
+
+# 03/04 is 3 April unless DATE_DAY_FIRST=0 (then 4 March); unambiguous when a part is over 12
+DAY_FIRST = os.getenv('DATE_DAY_FIRST', '1') != '0'
+DEFAULT_TIME = (10, 0)  # for a date given without a time
+DEFAULT_DURATION = 60  # minutes, when neither a duration nor an end time is given
+# Dates further than this from the reference ("in 99999999 days", "9999-12-31") are not
+# meeting times, and near date.min/date.max the slot arithmetic would overflow
+MAX_DAYS_AWAY = 366
+OFFSET_UNIT_MINUTES = {'m': 1, 'h': 60, 'd': 24 * 60, 'w': 7 * 24 * 60}
+PERIOD_TIMES = {'morning': (9, 0), 'afternoon': (14, 0), 'evening': (18, 0), 'tonight': (19, 0), 'eod': (17, 0)}
+
+MONTHS = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+NUMBER_WORDS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'ten': 10,
+                'fifteen': 15, 'twenty': 20, 'thirty': 30, 'forty-five': 45, 'forty five': 45, 'ninety': 90,
+                'half an': 0.5, 'half a': 0.5}
+TZ_ABBREVIATIONS = {
+    'utc': 'UTC', 'gmt': 'UTC',
+    'ist': 'Asia/Kolkata', 'india time': 'Asia/Kolkata', 'indian standard time': 'Asia/Kolkata',
+    'pst': 'America/Los_Angeles', 'pdt': 'America/Los_Angeles', 'pt': 'America/Los_Angeles',
+    'pacific time': 'America/Los_Angeles',
+    'est': 'America/New_York', 'edt': 'America/New_York', 'et': 'America/New_York', 'eastern time': 'America/New_York',
+    'cst': 'America/Chicago', 'cdt': 'America/Chicago', 'ct': 'America/Chicago', 'central time': 'America/Chicago',
+    'mst': 'America/Denver', 'mdt': 'America/Denver', 'mt': 'America/Denver', 'mountain time': 'America/Denver',
+    'bst': 'Europe/London', 'cet': 'Europe/Paris', 'cest': 'Europe/Paris', 'eet': 'Europe/Athens',
+    'eest': 'Europe/Athens', 'jst': 'Asia/Tokyo', 'sgt': 'Asia/Singapore', 'hkt': 'Asia/Hong_Kong',
+    'aest': 'Australia/Sydney', 'aedt': 'Australia/Sydney',
+}
+# Also ordinary words; only taken as timezones right after a time ("3pm ET")
+AMBIGUOUS_ZONES = {'et', 'pt', 'ct', 'mt'}
+
+_MONTH = (r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+          r"sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)")
+# Abbreviated weekdays ("Sat", "Sun") only count in front of a date
+_WEEKDAY = (r"(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday|"
+            rf"(?:mon|tues?|wed|thu(?:rs?)?|fri|sat|sun)\.?(?=,?\s+(?:\d|{_MONTH})))")
+_AMPM = r"[ap]\.?\s?m\b\.?"
+_RANGE_SEP = r"\s*(?:-|–|—|to|until|till|and)\s*"
+_ZONE_ABBREVIATIONS = r"(?:ist|pst|pdt|pt|est|edt|et|cst|cdt|ct|mst|mdt|mt|bst|cet|cest|eet|eest|jst|sgt|hkt|aest|aedt)"
+_NUMBER = r"\d+(?:\.\d+)?|half an?|forty[- ]five|an?|one|two|three|four|five|six|ten|fifteen|twenty|thirty|ninety"
+
+# Every expression but a sentence stop starts a word; the (?<!\w) guard makes
+# the scan fail fast inside words instead of trying each alternative there.
+TOKEN_RE = re.compile(r"(?P<stop>[!?;]|\.(?=\s|$)|\n\s*\n)|(?<!\w)(?:" + '|'.join([
+    r"(?P<iso>\b(?P<iso_y>\d{4})-(?P<iso_m>\d{1,2})-(?P<iso_d>\d{1,2})\b)",
+    r"(?P<numeric>(?<![\d/.])(?P<num_a>\d{1,2})/(?P<num_b>\d{1,2})(?:/(?P<num_y>\d{4}|\d{2}))?(?![\d/]))",
+    # "3-4pm", "10:30 to 11:15 am", "14:00-15:30"
+    rf"(?P<range>\b(?:from\s+|between\s+)?(?:(?P<rs_h>\d{{1,2}})(?:[:.](?P<rs_m>[0-5]\d))?\s*(?P<rs_ap>{_AMPM})?"
+    rf"{_RANGE_SEP}(?P<re_h>\d{{1,2}})(?:[:.](?P<re_m>[0-5]\d))?\s*(?P<re_ap>{_AMPM})|"
+    rf"(?P<rs_h24>[01]?\d|2[0-3]):(?P<rs_m24>[0-5]\d){_RANGE_SEP}(?P<re_h24>[01]?\d|2[0-3]):(?P<re_m24>[0-5]\d)"
+    r"(?![\d:])))",
+    rf"(?P<time>\b(?P<t_h>\d{{1,2}})(?:[:.](?P<t_m>[0-5]\d))?\s*(?P<t_ap>{_AMPM})|"
+    r"\b(?P<t_h24>[01]?\d|2[0-3]):(?P<t_m24>[0-5]\d)(?![\d:])|"
+    r"\b(?P<t_noon>noon|midday)\b|"
+    r"\b(?P<t_oclock>\d{1,2})\s*o'?clock\b|"
+    # bare "at 3": only when followed by something that ends the time expression
+    r"\bat\s+(?P<t_bare>\d{1,2})(?=\s*(?:[,;!?)]|\.(?:\s|$)|$|\n|tomorrow\b|today\b|tonight\b|on\b|this\b|next\b|"
+    rf"or\b|if\b|then\b|for\b|with\b|works?\b|ok\b|okay\b|sharp\b|\w+day\b|utc\b|gmt\b|{_ZONE_ABBREVIATIONS}\b)))",
+    rf"(?P<month_day>\b(?P<md_month>{_MONTH})\.?\s+(?P<md_day>\d{{1,2}})(?:st|nd|rd|th)?\b(?!:)"
+    r"(?:,?\s+(?P<md_year>\d{4})\b)?)",
+    rf"(?P<day_month>\b(?P<dm_day>\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<dm_month>{_MONTH})\b\.?"
+    r"(?:,?\s+(?P<dm_year>\d{4})\b)?)",
+    r"(?P<ordinal>\bthe\s+(?P<ord_day>\d{1,2})(?:st|nd|rd|th)\b)",
+    r"(?P<relative>\b(?:day after tomorrow|tomorrow|today|tonight|this (?:morning|afternoon|evening))\b)",
+    rf"(?P<offset>\bin\s+(?P<off_n>{_NUMBER})\s+(?P<off_unit>minutes?|mins?|hours?|hrs?|days?|weeks?)\b)",
+    r"(?P<week>\b(?:next week|end of (?:the |this )?week)\b)",
+    rf"(?P<weekday>\b(?:(?P<wd_mod>next|this|coming|last)\s+)?(?P<wd>{_WEEKDAY}))",
+    r"(?P<period>\b(?:morning|afternoon|evening|eod|end of (?:the )?day)\b)",
+    rf"(?P<duration>\b(?P<dur_n>{_NUMBER})[\s-]*(?P<dur_unit>hours?|hrs?|minutes?|mins?)\b"
+    r"(?P<dur_half>\s+and\s+a\s+half)?(?:\s+(?:and\s+)?(?P<dur_extra>\d+)\s*(?:minutes?|mins?)\b)?)",
+    rf"(?P<topic>{SCHEDULING_RE.pattern})",
+    r"(?P<zone>\b(?:utc|gmt)(?:\s*(?P<zone_sign>[+-])\s*(?P<zone_h>\d{1,2})(?::?(?P<zone_m>\d{2}))?)?\b|"
+    r"\b(?:(?:pacific|eastern|central|mountain|india|indian standard)\s+time)\b|"
+    rf"\b{_ZONE_ABBREVIATIONS}\b|"
+    r"\b[a-z]+/[a-z_]+(?:/[a-z_]+)?\b)",
+]) + ")", re.IGNORECASE)
+
+Token = namedtuple('Token', 'kind start end value')
+
+
+@lru_cache(maxsize=256)
+def _zone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def _reference(reference, tz):
+    """the moment relative dates count from, in tz"""
+    if reference is None:
+        return datetime.now(tz)
+    if isinstance(reference, datetime):
+        return reference.replace(tzinfo=tz) if reference.tzinfo is None else reference.astimezone(tz)
+    return datetime.fromtimestamp(reference, tz)
+
+
+def _number(text):
+    text = text.lower()
+    return NUMBER_WORDS[text] if text in NUMBER_WORDS else float(text)
+
+
+def _hour(hour, minute, ampm):
+    """(hour, minute, ambiguous) on the 24h clock, or None if not a valid time"""
+    hour, minute = int(hour), int(minute or 0)
+    if ampm:
+        if not 1 <= hour <= 12:
+            return None
+        pm = ampm.lower().startswith('p')
+        return (hour % 12 + (12 if pm else 0), minute, False)
+    if hour > 23:
+        return None
+    # "3:30" with no am/pm in a scheduling email is almost always the afternoon
+    return (hour, minute, hour < 12)
+
+
+def _month_date(ref, year, month, day):
+    """date for a day and month; without a year, the next one unless it is within a month back"""
+    try:
+        value = date(int(year) if year else ref.year, month, int(day))
+    except ValueError:
+        return None
+    if not year and value < ref.date() - timedelta(days=31):
+        try:
+            value = value.replace(year=value.year + 1)
+        except ValueError:
+            return None
+    if abs((value - ref.date()).days) > MAX_DAYS_AWAY:
+        return None
+    return value
+
+
+def _date_token(m, kind, ref):
+    """[(date, score), ...] alternatives for a date expression, None to ignore it"""
+    today = ref.date()
+    if kind == 'iso':
+        value = _month_date(ref, m['iso_y'], int(m['iso_m']), m['iso_d']) if 1 <= int(m['iso_m']) <= 12 else None
+        return [(value, 0.35)] if value else None
+    if kind == 'numeric':
+        a, b = int(m['num_a']), int(m['num_b'])
+        day, month = (a, b) if DAY_FIRST else (b, a)
+        if month > 12 and day <= 12:
+            day, month = month, day
+        if month > 12 or not 1 <= day <= 31:
+            return None
+        year = m['num_y']
+        if year and len(year) == 2:
+            year = f"20{year}"
+        value = _month_date(ref, year, month, day)
+        return [(value, 0.3 if a <= 12 and b <= 12 else 0.35)] if value else None
+    if kind in ('month_day', 'day_month'):
+        prefix = 'md' if kind == 'month_day' else 'dm'
+        month = MONTHS.index(m[f'{prefix}_month'][:3].lower()) + 1
+        value = _month_date(ref, m[f'{prefix}_year'], month, m[f'{prefix}_day'])
+        return [(value, 0.35)] if value else None
+    if kind == 'ordinal':
+        value = _month_date(ref, None, today.month, m['ord_day'])
+        if value and value < today:
+            following = today.replace(day=1) + timedelta(days=32)
+            value = _month_date(ref, following.year, following.month, m['ord_day'])
+        return [(value, 0.25)] if value else None
+    if kind == 'relative':
+        word = m['relative'].lower()
+        days = {'tomorrow': 1, 'day after tomorrow': 2}.get(word, 0)
+        return [(today + timedelta(days=days), 0.35)]
+    if kind == 'week':
+        monday = today + timedelta(days=7 - today.weekday())
+        if m['week'].lower() == 'next week':
+            return [(monday, 0.15)]
+        return [(monday - timedelta(days=3), 0.2)]  # end of the week: Friday
+    if kind == 'weekday':
+        weekday = WEEKDAYS.index(m['wd'][:3].lower())
+        modifier = (m['wd_mod'] or '').lower()
+        ahead = (weekday - today.weekday()) % 7
+        if modifier == 'last':
+            return None
+        if modifier == 'this':
+            return [(today + timedelta(days=ahead), 0.3)]
+        if modifier == 'next':
+            following_week = today + timedelta(days=7 - today.weekday() + weekday)
+            if ahead and following_week - today > timedelta(days=ahead):
+                # "next Friday" on a Monday: the Friday of next week, or possibly this one
+                return [(following_week, 0.3), (today + timedelta(days=ahead), 0.2)]
+            return [(following_week, 0.3)]
+        return [(today + timedelta(days=ahead or 7), 0.3)]
+    return None
+
+
+def _time_token(m, kind):
+    """(hour, minute, ambiguous, score, end) for a time or time range; end is (hour, minute) or None"""
+    if kind == 'range':
+        if m['rs_h24'] is not None:
+            return (int(m['rs_h24']), int(m['rs_m24']), False, 0.4, (int(m['re_h24']), int(m['re_m24'])))
+        end = _hour(m['re_h'], m['re_m'], m['re_ap'])
+        start = _hour(m['rs_h'], m['rs_m'], m['rs_ap'] or m['re_ap'])
+        if not end or not start:
+            return None
+        if not m['rs_ap'] and (start[0], start[1]) >= (end[0], end[1]):
+            start = _hour(m['rs_h'], m['rs_m'], 'am')  # "11-1pm"
+        return (start[0], start[1], False, 0.4, end[:2])
+    if m['t_noon']:
+        return (12, 0, False, 0.4, None)
+    if m['t_h24'] is not None:
+        parsed = _hour(m['t_h24'], m['t_m24'], None)
+        if len(m['t_h24']) == 2:
+            return (parsed[0], parsed[1], False, 0.4, None)  # "09:30" is on the 24h clock
+        return parsed + (0.4 if not parsed[2] else 0.3, None)
+    if m['t_h'] is not None:
+        parsed = _hour(m['t_h'], m['t_m'], m['t_ap'])
+        return parsed and parsed + (0.4, None)
+    parsed = _hour(m['t_oclock'] or m['t_bare'], None, None)
+    return parsed and (parsed[0], parsed[1], 1 <= parsed[0] <= 12, 0.25, None)
+
+
+def _zone_token(m):
+    """(tzinfo, IANA name or None for a fixed offset)"""
+    text = re.sub(r'\s+', ' ', m['zone'].lower())
+    if m['zone_sign']:
+        offset = timedelta(hours=int(m['zone_h']), minutes=int(m['zone_m'] or 0))
+        if offset > timedelta(hours=14):
+            return None
+        return (timezone(-offset if m['zone_sign'] == '-' else offset), None)
+    name = TZ_ABBREVIATIONS.get(text, m['zone'])
+    tz = _zone(name)
+    return (tz, name) if tz else None
+
+
+def _duration_token(m):
+    """minutes"""
+    minutes = _number(m['dur_n']) * (60 if m['dur_unit'].lower().startswith('h') else 1)
+    if m['dur_half']:
+        minutes += 30
+    if m['dur_extra']:
+        minutes += int(m['dur_extra'])
+    return int(minutes) if 0 < minutes <= 24 * 60 else None
+
+
+def scan(text, ref):
+    """the Tokens found in one pass over text; ref is the timezone-aware reference moment"""
+    tokens = []
+    for m in TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        if kind in ('stop', 'topic'):
+            tokens.append(Token(kind, m.start(), m.end(), None))
+            continue
+        if kind in ('range', 'time'):
+            value = _time_token(m, kind)
+            category = 'time'
+        elif kind == 'period':
+            word = m['period'].lower()
+            value, category = 'eod' if word.startswith('e') and word != 'evening' else word, 'period'
+        elif kind == 'duration':
+            value, category = _duration_token(m), 'duration'
+        elif kind == 'zone':
+            word = m['zone'].lower()
+            after_time = tokens and tokens[-1].kind == 'time' and m.start() - tokens[-1].end <= 2
+            value = _zone_token(m) if word not in AMBIGUOUS_ZONES or after_time else None
+            category = 'zone'
+        elif kind == 'offset':
+            count, unit = _number(m['off_n']), m['off_unit'].lower()
+            minutes = count * OFFSET_UNIT_MINUTES[unit[0]]
+            if minutes > MAX_DAYS_AWAY * 24 * 60:
+                continue
+            if unit.startswith(('d', 'w')):
+                value, category = [((ref + timedelta(minutes=minutes)).date(), 0.3)], 'date'
+            else:
+                moment = ref + timedelta(minutes=minutes)
+                value, category = moment.replace(second=0, microsecond=0), 'moment'
+        else:
+            value, category = _date_token(m, kind, ref), 'date'
+        if value is None:
+            continue
+        if kind == 'relative' and m['relative'].lower() not in ('today', 'tomorrow', 'day after tomorrow'):
+            # "tonight", "this afternoon": today, and the period for a bare time
+            tokens.append(Token('period', m.start(), m.end(), m['relative'].lower().replace('this ', '')))
+        previous = tokens[-1] if tokens else None
+        if category == 'date' and previous and previous.kind == 'date' and m.start() - previous.end <= 3:
+            # "Friday, 24 Oct": one date; keep the explicit one
+            keep = value if value[0][1] >= previous.value[0][1] else previous.value
+            tokens[-1] = Token('date', previous.start, m.end(), keep)
+            continue
+        tokens.append(Token(category, m.start(), m.end(), value))
+    return tokens
+
+
+def _sentences(tokens):
+    sentence = []
+    for token in tokens:
+        if token.kind == 'stop':
+            if sentence:
+                yield sentence
+            sentence = []
+        else:
+            sentence.append(token)
+    if sentence:
+        yield sentence
+
+
+def _gap(a, b):
+    return b.start - a.end if a.end <= b.start else a.start - b.end
+
+
+def extract_slots(text, reference=None, default_tz='UTC', min_confidence=0.2, max_slots=5):
+    """candidate meeting slots in text, most confident first.
+
+    reference is the email's timestamp (epoch seconds or datetime) that relative
+    dates resolve against; default_tz applies where the text names no timezone.
+    Each slot is a dict with start and end (timezone-aware datetimes), timezone
+    (IANA name, None for a stated UTC offset), confidence (0-1) and the text it
+    came from.
+    """
+    default_zone = _zone(default_tz) or timezone.utc
+    ref = _reference(reference, default_zone)
+    text = text or ''
+    tokens = scan(text, ref)
+    zones = [t.value for t in tokens if t.kind == 'zone']
+    durations = [t.value for t in tokens if t.kind == 'duration']
+    email_zone = zones[0] if zones else None
+    email_duration = durations[0] if durations else None
+    topic_anywhere = any(t.kind == 'topic' for t in tokens)
+
+    slots = {}
+
+    def add(day, hour, minute, score, end, zone, duration, topic, span):
+        tz, name = zone or (default_zone, default_tz)
+        start = datetime.combine(day, time(hour, minute), tzinfo=tz)
+        if end:
+            finish = datetime.combine(day, time(*end), tzinfo=tz)
+            if finish <= start:
+                finish += timedelta(days=1)
+        else:
+            finish = start + timedelta(minutes=duration or DEFAULT_DURATION)
+        confidence = score + (0.15 if topic else 0.05 if topic_anywhere else 0.0)
+        confidence += (0.05 if zone else 0.0) + (0.05 if end or duration else 0.0)
+        if start < ref:
+            confidence *= 0.3
+        confidence = round(min(confidence, 1.0), 2)
+        key = start.timestamp()
+        if key not in slots or slots[key]['confidence'] < confidence:
+            slots[key] = {'start': start, 'end': finish, 'timezone': name, 'confidence': confidence,
+                          'text': ' '.join(text[span[0]:span[1]].split()).rstrip('.,;')}
+
+    carry = None  # the last date mentioned, for times in later sentences
+    for sentence in _sentences(tokens):
+        dates = [t for t in sentence if t.kind == 'date']
+        times = [t for t in sentence if t.kind == 'time']
+        period = next((t.value for t in sentence if t.kind == 'period'), None)
+        zone = next((t.value for t in sentence if t.kind == 'zone'), email_zone)
+        duration = next((t.value for t in sentence if t.kind == 'duration'), email_duration)
+        topic = any(t.kind == 'topic' for t in sentence)
+        paired = set()
+        for t in times:
+            hour, minute, ambiguous, time_score, end = t.value
+            if ambiguous and hour < 12 and (period in ('afternoon', 'evening', 'tonight') or
+                                            (period is None and hour < 8)):
+                hour += 12
+                if end and end[0] < 12:
+                    end = (end[0] + 12, end[1])
+            if dates:
+                nearest = min(dates, key=lambda d: _gap(d, t))
+                paired.add(nearest.start)
+                alternatives = nearest.value
+                span = (min(nearest.start, t.start), max(nearest.end, t.end))
+            elif carry:
+                alternatives = [(day, min(score, 0.2)) for day, score in carry]
+                span = (t.start, t.end)
+            else:
+                alternatives = [(ref.date(), 0.05)]
+                span = (t.start, t.end)
+            for day, date_score in alternatives:
+                add(day, hour, minute, date_score + time_score, end, zone, duration, topic, span)
+        for d in dates:
+            if d.start in paired:
+                continue
+            hour, minute = PERIOD_TIMES.get(period, DEFAULT_TIME)
+            for day, date_score in d.value:
+                add(day, hour, minute, date_score + (0.1 if period else 0.0), None, zone, duration, topic,
+                    (d.start, d.end))
+        for t in sentence:
+            if t.kind == 'moment':
+                moment = t.value.astimezone(zone[0]) if zone else t.value
+                add(moment.date(), moment.hour, moment.minute, 0.6, None, zone, duration, topic, (t.start, t.end))
+        if dates:
+            carry = dates[-1].value
+
+    ranked = sorted(slots.values(), key=lambda s: (-s['confidence'], s['start']))
+    return [s for s in ranked if s['confidence'] >= min_confidence][:max_slots]
+
+
+def extract_email_slots(email, default_tz='UTC', **kwargs):
+    """extract_slots over an email dict's subject and body, relative to its timestamp"""
+    text = f"{email.get('subject') or ''}.\n{email.get('body') or ''}"
+    return extract_slots(text, reference=email.get('timestamp'), default_tz=default_tz, **kwargs)
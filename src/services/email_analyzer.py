@@ -1,60 +1,296 @@
-import sqlite3
 import base64
-from transformers import pipeline
-# from gmail_auth import GmailAuthenticator
+from services.analysis_cache import AnalysisCache
+from services.analysis_pool import gather
+from services.model_registry import get_registry
+from utils.db_utils import ANALYSIS_BODY_SQL, get_db_connection
+
+# Generation/truncation settings shared by the single-item and batched paths
+SUMMARY_INPUT_CHARS = 1024
+SUMMARY_KWARGS = {'max_length': 130, 'min_length': 30, 'do_sample': False}
+INTENT_INPUT_CHARS = 512
+INTENT_MESSAGES = {
+    'POSITIVE': "Likely a confirmation or positive response.",
+    'NEGATIVE': "Likely a rejection or negative response.",
+}
+# Token budget per map-reduce chunk: BART's 1024-token window minus room for special tokens
+CHUNK_TOKEN_BUDGET = 1000
+# Stay well below SQLite's bound-parameter limit for IN (...) lookups
+SQL_CHUNK_SIZE = 500
 
 class EmailAnalyzer:
     """class to analyze email content using Hugging Face Transformers."""
 
-    def __init__(self, authenticator, db_path='emails.db', model_name='distilbert-base-uncased'):
+    def __init__(self, authenticator=None, db_path='emails.db', model_name='distilbert-base-uncased', registry=None,
+                 use_cache=True, cache_size=50000, pool=None):
         """Initialize the EmailAnalyzer with a database path and model name."""
-        """initalize database connection and llm pipeline"""
-        self.conn = sqlite3.connect(db_path)
-        self.service = authenticator.get_service()
-        self.summarizer = pipeline("summarization", model="facebook/bart-large-cnn", framework="pt")
-        self.classifier = pipeline("text-classification", model="distilbert-base-uncased-finetuned-sst-2-english", framework="pt")
+        """initalize database connection; pipelines come from the shared model registry"""
+        self.conn = get_db_connection(db_path)
+        self.service = authenticator.get_service() if authenticator else None
+        self.models = registry or get_registry()
+        self.cache = AnalysisCache(self.conn, max_entries=cache_size) if use_cache else None
+        # With an AnalysisPool, inference runs in its worker processes and no model is loaded here
+        self.pool = pool
+
+    @property
+    def summarizer(self):
+        """BART summarization pipeline, loaded on first use"""
+        return self.models.get('summarizer')
+
+    @property
+    def classifier(self):
+        """DistilBERT SST-2 pipeline, loaded on first use"""
+        return self.models.get('classifier')
 
     def get_thread_context(self, thread_id):
         """retrieve all emails in a thread from the database"""
         c = self.conn.cursor()
-        c.execute("SELECT sender, subject, body FROM emails WHERE THREAD_ID = ? ORDER BY timestamp", (thread_id,))
+        c.execute(f"SELECT sender, subject, {ANALYSIS_BODY_SQL} FROM emails WHERE THREAD_ID = ? ORDER BY timestamp", (thread_id,))
         emails = c.fetchall()
         return [{'sender': e[0], 'subject': e[1], 'body': e[2]} for e in emails]
     
-    def summarize_thread(self, thread_id):
+    def get_thread_contexts(self, thread_ids):
+        """retrieve the emails of many threads in bulk, keyed by thread id"""
+        contexts = {}
+        thread_ids = list(dict.fromkeys(thread_ids))
+        c = self.conn.cursor()
+        for start in range(0, len(thread_ids), SQL_CHUNK_SIZE):
+            chunk = thread_ids[start:start + SQL_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f"SELECT thread_id, sender, subject, {ANALYSIS_BODY_SQL} FROM emails WHERE thread_id IN ({placeholders}) "
+                      "ORDER BY thread_id, timestamp", chunk)
+            for e in c.fetchall():
+                contexts.setdefault(e[0], []).append({'sender': e[1], 'subject': e[2], 'body': e[3]})
+        return contexts
+
+    @staticmethod
+    def _summary_input(thread_emails):
+        """combined, truncated thread text fed to the summarizer (None if there is nothing to summarize)"""
+        combined_text = " ".join(email['body'] for email in thread_emails if email['body'])
+        return combined_text[:SUMMARY_INPUT_CHARS] if combined_text else None
+
+    def _cache_key(self, model_name, params, text):
+        # Outputs differ between backends, so the backend is part of the key (fp32 PyTorch keeps the bare name)
+        return AnalysisCache.make_key((self.pool or self.models).model_id(model_name), params, text)
+
+    def _cached_run(self, model_name, kind, texts, run, params):
+        """return outputs for texts, calling run(missing_texts) only for cache misses"""
+        if not self.cache:
+            return run(texts)
+        keys = [self._cache_key(model_name, params, text) for text in texts]
+        cached = self.cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        if missing:
+            outputs = run([texts[i] for i in missing])
+            self.cache.put_many([(keys[i], kind, output) for i, output in zip(missing, outputs)])
+            for i, output in zip(missing, outputs):
+                cached[keys[i]] = output
+        return [cached[key] for key in keys]
+
+    def summarize_text(self, text, max_length=130, min_length=30):
+        """summarize arbitrary text with BART, reusing cached output for identical input"""
+        params = {'max_length': max_length, 'min_length': min_length, 'do_sample': False}
+        if self.pool:
+            run = lambda texts: [self.pool.summarize(texts[0], max_length, min_length).result()]
+        else:
+            run = lambda texts: [self.summarizer(texts[0], **params)[0]['summary_text']]
+        return self._cached_run('summarizer', 'summary', [text], run, params)[0]
+
+    @staticmethod
+    def _intent_message(label):
+        return INTENT_MESSAGES.get(label, "Intent unclear.")
+
+    @staticmethod
+    def _by_token_length(pipe, texts):
+        """indices of texts ordered longest-first by token count, so batches pad to similar lengths"""
+        lengths = [len(ids) for ids in pipe.tokenizer(texts, truncation=False)['input_ids']]
+        return sorted(range(len(texts)), key=lambda i: lengths[i], reverse=True)
+
+    def summarize_thread(self, thread_id, mode='truncate', **kwargs):
         """summarizes the content of an email thread"""
+        if mode == 'map_reduce':
+            return self.summarize_thread_long(thread_id, **kwargs)
         thread_emails = self.get_thread_context(thread_id)
         if not thread_emails:
             return "No emails found in thread."
         
-        # combine email bodies for summarization'
-        combined_text = " ".join(email['body'] for email in thread_emails if email['body'])
-        if not combined_text:
+        # combine email bodies for summarization
+        truncated_text = self._summary_input(thread_emails)
+        if not truncated_text:
             return "No content available for summarization."
         
         # summarize the combined text
-        max_length = 1024
-        truncated_text = combined_text[:max_length]
-        summary = self.summarizer(truncated_text, max_length=130, min_length=30, do_sample=False)
-        return summary[0]['summary_text']
+        return self.summarize_text(truncated_text, SUMMARY_KWARGS['max_length'], SUMMARY_KWARGS['min_length'])
+
+    def summarize_thread_long(self, thread_id, chunk_tokens=CHUNK_TOKEN_BUDGET, chunk_batch_size=4):
+        """map-reduce summary of a whole thread: summarize token-budgeted chunks, then the summaries"""
+        # Any two summaries must fit in one chunk, or reducing them makes no progress
+        if chunk_tokens < 2 * SUMMARY_KWARGS['max_length']:
+            raise ValueError(f"chunk_tokens must be at least {2 * SUMMARY_KWARGS['max_length']} "
+                             f"(two summaries of up to {SUMMARY_KWARGS['max_length']} tokens), got {chunk_tokens}")
+        # Only the tokenizer: with a pool, the summarizer itself stays out of this process
+        tokenizer = self.models.tokenizer('summarizer')
+        # A chunk plus the special tokens the pipeline adds must fit the model's input window
+        limit = tokenizer.model_max_length - tokenizer.num_special_tokens_to_add()
+        if chunk_tokens > limit:
+            raise ValueError(f"chunk_tokens must be at most {limit} (the summarizer's "
+                             f"{tokenizer.model_max_length}-token input minus special tokens), got {chunk_tokens}")
+        c = self.conn.cursor()
+        c.execute(f"SELECT {ANALYSIS_BODY_SQL} FROM emails WHERE thread_id = ? ORDER BY timestamp", (thread_id,))
+        bodies = (row[0] for row in c)
+
+        summaries, found, group = [], False, []
+        for chunk in self._token_chunks(bodies, tokenizer, chunk_tokens):
+            found = True
+            group.append(chunk)
+            if len(group) >= chunk_batch_size:
+                summaries.extend(self._summarize_chunks(group, chunk_batch_size))
+                group = []
+                # Fold summaries early so memory stays bounded however long the thread is
+                if self._token_count(tokenizer, " ".join(summaries)) > chunk_tokens:
+                    summaries = [self._reduce(summaries, tokenizer, chunk_tokens, chunk_batch_size)]
+        if group:
+            summaries.extend(self._summarize_chunks(group, chunk_batch_size))
+
+        if not found:
+            c.execute("SELECT 1 FROM emails WHERE thread_id = ? LIMIT 1", (thread_id,))
+            return "No content available for summarization." if c.fetchone() else "No emails found in thread."
+        return (self._reduce(summaries, tokenizer, chunk_tokens, chunk_batch_size)
+                or "No content available for summarization.")
+
+    @staticmethod
+    def _token_count(tokenizer, text):
+        return len(tokenizer(text, add_special_tokens=False, truncation=False)['input_ids'])
+
+    @staticmethod
+    def _token_chunks(texts, tokenizer, budget):
+        """pack texts into chunks of at most budget tokens, splitting only at text boundaries
+        unless a single text is longer than the budget"""
+        current, current_tokens = [], 0
+        for text in texts:
+            if not text:
+                continue
+            ids = tokenizer(text, add_special_tokens=False, truncation=False)['input_ids']
+            if len(ids) > budget:
+                if current:
+                    yield " ".join(current)
+                    current, current_tokens = [], 0
+                for start in range(0, len(ids), budget):
+                    yield tokenizer.decode(ids[start:start + budget], skip_special_tokens=True)
+                continue
+            if current_tokens + len(ids) > budget:
+                yield " ".join(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += len(ids)
+        if current:
+            yield " ".join(current)
+
+    def _summarize_chunks(self, chunks, batch_size):
+        def run(batch):
+            if self.pool:
+                return gather(self.pool.map_summaries(batch, SUMMARY_KWARGS['max_length'],
+                                                      SUMMARY_KWARGS['min_length'], batch_size))
+            outputs = self.summarizer(batch, batch_size=batch_size, **SUMMARY_KWARGS)
+            return [output['summary_text'] for output in outputs]
+        return self._cached_run('summarizer', 'summary', chunks, run, SUMMARY_KWARGS)
+
+    def _reduce(self, summaries, tokenizer, budget, batch_size):
+        """summarize summaries until a single one remains ('' if they are all empty)"""
+        summaries = [summary for summary in summaries if summary]
+        while len(summaries) > 1:
+            chunks = list(self._token_chunks(summaries, tokenizer, budget))
+            if len(chunks) >= len(summaries):
+                # No two summaries fit one chunk, so another pass would not shrink the list
+                ids = tokenizer(" ".join(summaries), add_special_tokens=False, truncation=False)['input_ids']
+                return tokenizer.decode(ids[:budget], skip_special_tokens=True)
+            summaries = [summary for summary in self._summarize_chunks(chunks, batch_size) if summary]
+        return summaries[0] if summaries else ''
+
+    def summarize_threads(self, thread_ids, batch_size=8):
+        """summarize many threads with bulk lookups and batched generation; returns {thread_id: summary}"""
+        contexts = self.get_thread_contexts(thread_ids)
+        results = {}
+        pending_ids, texts = [], []
+        for thread_id in dict.fromkeys(thread_ids):
+            thread_emails = contexts.get(thread_id)
+            if not thread_emails:
+                results[thread_id] = "No emails found in thread."
+                continue
+            text = self._summary_input(thread_emails)
+            if not text:
+                results[thread_id] = "No content available for summarization."
+                continue
+            pending_ids.append(thread_id)
+            texts.append(text)
+
+        def run(batch):
+            if self.pool:
+                # Each batch goes to a different worker
+                return gather(self.pool.map_summaries(batch, SUMMARY_KWARGS['max_length'],
+                                                      SUMMARY_KWARGS['min_length'], batch_size))
+            order = self._by_token_length(self.summarizer, batch)
+            summaries = [None] * len(batch)
+            outputs = self.summarizer([batch[i] for i in order], batch_size=batch_size, **SUMMARY_KWARGS)
+            for i, summary in zip(order, outputs):
+                summaries[i] = summary['summary_text']
+            return summaries
+
+        if texts:
+            summaries = self._cached_run('summarizer', 'summary', texts, run, SUMMARY_KWARGS)
+            results.update(zip(pending_ids, summaries))
+        return results
     
     def infer_intent(self, email_id):
         """infer the sender's intent from an email"""
         c = self.conn.cursor()
-        c.execute("SELECT body FROM emails WHERE id=?", (email_id,))
+        c.execute(f"SELECT {ANALYSIS_BODY_SQL} FROM emails WHERE id=?", (email_id,))
         result = c.fetchone()
         if not result or not result[0]:
             return "No content available for intent inference."
         
-        body = result[0][:512] # truncate for model limits
+        body = result[0][:INTENT_INPUT_CHARS] # truncate for model limits
         # simple intent classification (positive/negative)
-        intent = self.classifier(body)
-        label = intent[0]['label']
-        if label == "POSITIVE":
-            return "Likely a confirmation or positive response."
-        elif label == "NEGATIVE":
-            return "Likely a rejection or negative response."
-        return "Intent unclear."
+        if self.pool:
+            run = lambda texts: self.pool.submit_labels(texts, batch_size=1).result()
+        else:
+            run = lambda texts: [self.classifier(texts[0])[0]['label']]
+        label = self._cached_run('classifier', 'label', [body], run, {})[0]
+        return self._intent_message(label)
+
+    def infer_intents(self, email_ids, batch_size=32):
+        """infer intent for many emails with bulk lookups and batched classification; returns {email_id: intent}"""
+        email_ids = list(dict.fromkeys(email_ids))
+        bodies = {}
+        c = self.conn.cursor()
+        for start in range(0, len(email_ids), SQL_CHUNK_SIZE):
+            chunk = email_ids[start:start + SQL_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f"SELECT id, {ANALYSIS_BODY_SQL} FROM emails WHERE id IN ({placeholders})", chunk)
+            bodies.update(c.fetchall())
+
+        results = {}
+        pending_ids, texts = [], []
+        for email_id in email_ids:
+            if not bodies.get(email_id):
+                results[email_id] = "No content available for intent inference."
+                continue
+            pending_ids.append(email_id)
+            texts.append(bodies[email_id][:INTENT_INPUT_CHARS])
+
+        def run(batch):
+            if self.pool:
+                return gather(self.pool.map_labels(batch, batch_size))
+            order = self._by_token_length(self.classifier, batch)
+            labels = [None] * len(batch)
+            for i, intent in zip(order, self.classifier([batch[i] for i in order], batch_size=batch_size)):
+                labels[i] = intent['label']
+            return labels
+
+        if texts:
+            labels = self._cached_run('classifier', 'label', texts, run, {})
+            for email_id, label in zip(pending_ids, labels):
+                results[email_id] = self._intent_message(label)
+        return results
     
     def analyze_and_report(self, thread_id, email_id=None):
         """generate a report with summary and intent"""
@@ -70,7 +306,7 @@ class EmailAnalyzer:
 
 
 if __name__ == "__main__":
-    from gmail_auth import GmailAuthenticator
+    from services.gmail_auth import GmailAuthenticator
     authenticator = GmailAuthenticator()
     analyzer = EmailAnalyzer(authenticator)
     thread_id = '195f60b397c7396d'
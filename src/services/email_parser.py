@@ -1,97 +1,178 @@
-import base64
-import sqlite3
+import random
+import time
 from datetime import datetime
 from services.gmail_auth import GmailAuthenticator
-import html2text
+from services.mime_walker import MAX_PART_BYTES, walk_payload
+from utils.db_utils import apply_migrations, get_db_connection, has_fts, index_compressed_bodies
+from utils.dequote import strip_quoted
+
+# HTTP statuses worth retrying inside a batch: rate limits and transient backend errors
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def http_status(exception):
+    """best-effort HTTP status of an API exception (HttpError or a fake)"""
+    resp = getattr(exception, 'resp', None)
+    status = getattr(resp, 'status', None) or getattr(exception, 'status_code', None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
 
 class EmailManager:
-    def __init__(self, db_path='emails.db'):
-        self.conn = sqlite3.connect(db_path)
+    def __init__(self, db_path='emails.db', compress_bodies=False):
+        self.conn = get_db_connection(db_path)
+        # Compressed bodies are read back transparently through body_text() in SQL
+        self.compress_bodies = compress_bodies
         self.setup_database()
+        if compress_bodies:
+            # The FTS triggers must decode bodies before the first compressed one is written
+            index_compressed_bodies(self.conn)
 
     def setup_database(self):
-        c = self.conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS emails (
-                     id TEXT PRIMARY KEY,
-                     thread_id TEXT,
-                     sender TEXT,
-                     recipient TEXT,
-                     subject TEXT,
-                     timestamp INTEGER,
-                     body TEXT)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS attachments (
-                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                     message_id TEXT,
-                     filename TEXT,
-                     mime_type TEXT,
-                     size INTEGER,
-                     FOREIGN KEY (message_id) REFERENCES emails(id))''')
-        self.conn.commit()
+        # Schema lives in utils.db_utils.MIGRATIONS; get_db_connection already applied it
+        apply_migrations(self.conn)
 
     def parse_email(self, service, message):
         msg = service.users().messages().get(userId='me', id=message['id'], format='full').execute()
-        headers = msg['payload']['headers']
+        return self.parse_message(msg)
 
-        sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
-        recipient = next((h['value'] for h in headers if h['name'] == 'To'), 'Unknown Recipient')
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
+    @staticmethod
+    def parse_message(msg, max_part_bytes=MAX_PART_BYTES):
+        """parse a full-format Gmail message resource into an email dict"""
+        headers = {}
+        for h in msg['payload'].get('headers', []):
+            headers.setdefault(h['name'], h['value'])
+
+        sender = headers.get('From', 'Unknown Sender')
+        recipient = headers.get('To', 'Unknown Recipient')
+        subject = headers.get('Subject', 'No Subject')
         timestamp = int(msg.get('internalDate', 0)) // 1000
-        thread_id = msg.get('threadId', message['id'])
-
-        # Parse body with recursive part traversal
-        def extract_body(payload):
-            body = ''
-            if 'parts' in payload:
-                for part in payload['parts']:
-                    if part['mimeType'] == 'text/plain' and 'data' in part['body']:
-                        body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
-                        break
-                    elif part['mimeType'] == 'text/html' and 'data' in part['body']:
-                        html_content = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
-                        body = html2text.html2text(html_content)
-                        break
-                    elif 'parts' in part:  # Nested parts (e.g., multipart/alternative)
-                        body = extract_body(part)
-                        if body:
-                            break
-            elif 'data' in payload['body']:
-                body = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8', errors='ignore')
-            return body
-
-        body = extract_body(msg['payload'])
-
-        attachments = []
-        if 'parts' in msg['payload']:
-            for part in msg['payload']['parts']:
-                if 'filename' in part and part['filename']:
-                    attachments.append({
-                        'filename': part['filename'],
-                        'mime_type': part['mimeType'],
-                        'size': int(part['body'].get('size', 0))
-                    })
+        thread_id = msg.get('threadId', msg['id'])
+
+        # One pass collects body candidates and attachments; HTML is only converted if there is no plain text
+        content = walk_payload(msg['payload'], max_part_bytes)
+        body = content.body
 
         return {
-            'id': message['id'],
+            'id': msg['id'],
             'thread_id': thread_id,
             'sender': sender,
             'recipient': recipient,
             'subject': subject,
             'timestamp': timestamp,
             'body': body,
-            'attachments': attachments
+            # New content only (no quoted history or signature) is what the analysis services read
+            'new_body': strip_quoted(body),
+            'labels': msg.get('labelIds', []),
+            'attachments': content.attachments
         }
 
     def store_email(self, email):
+        self.store_emails([email])
+
+    def store_emails(self, emails, commit_interval=1000):
+        """bulk upsert emails and their attachments, committing every commit_interval messages"""
+        stored = 0
+        batch = []
+        for email in emails:
+            batch.append(email)
+            if len(batch) >= commit_interval:
+                stored += self._write_emails(batch)
+                batch = []
+        if batch:
+            stored += self._write_emails(batch)
+        return stored
+
+    def _write_emails(self, batch):
+        encode = self.conn.body_codec.compress if self.compress_bodies else (lambda body: body)
+        email_rows = [(email['id'], email['thread_id'], email['sender'], email['recipient'], email['subject'],
+                       email['timestamp'], encode(email['body']),
+                       encode(email['new_body'] if 'new_body' in email else strip_quoted(email['body'])),
+                       ','.join(email.get('labels', [])))
+                      for email in batch]
+        attachment_rows = [(email['id'], attachment.get('part_id', str(index)), attachment['filename'],
+                            attachment['mime_type'], attachment['size'], attachment.get('attachment_id'))
+                           for email in batch for index, attachment in enumerate(email['attachments'])]
+        with self.conn:
+            c = self.conn.cursor()
+            # Upsert rather than INSERT OR REPLACE so the row (and its rowid) is updated in place
+            c.executemany('''INSERT INTO emails (id, thread_id, sender, recipient, subject, timestamp, body,
+                                                 new_body, labels)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                             ON CONFLICT(id) DO UPDATE SET
+                                 thread_id = excluded.thread_id, sender = excluded.sender,
+                                 recipient = excluded.recipient, subject = excluded.subject,
+                                 timestamp = excluded.timestamp, body = excluded.body,
+                                 new_body = excluded.new_body, labels = excluded.labels''', email_rows)
+            # Rows from before attachments were keyed by part_id are superseded by the ones stored now
+            c.executemany("DELETE FROM attachments WHERE message_id = ? AND part_id IS NULL",
+                          [(email['id'],) for email in batch if email['attachments']])
+            c.executemany('''INSERT INTO attachments (message_id, part_id, filename, mime_type, size, attachment_id)
+                             VALUES (?, ?, ?, ?, ?, ?)
+                             ON CONFLICT(message_id, part_id) DO UPDATE SET
+                                 filename = excluded.filename, mime_type = excluded.mime_type,
+                                 size = excluded.size, attachment_id = excluded.attachment_id''', attachment_rows)
+        return len(batch)
+
+    def existing_ids(self, message_ids):
+        """return the subset of message_ids already stored"""
+        found = set()
+        message_ids = list(message_ids)
         c = self.conn.cursor()
-        c.execute('''INSERT OR REPLACE INTO emails (id, thread_id, sender, recipient, subject, timestamp, body)
-                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                  (email['id'], email['thread_id'], email['sender'], email['recipient'],
-                   email['subject'], email['timestamp'], email['body']))
-        for attachment in email['attachments']:
-            c.execute('''INSERT INTO attachments (message_id, filename, mime_type, size)
-                         VALUES (?, ?, ?, ?)''',
-                      (email['id'], attachment['filename'], attachment['mime_type'], attachment['size']))
+        for start in range(0, len(message_ids), 500):
+            chunk = message_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f"SELECT id FROM emails WHERE id IN ({placeholders})", chunk)
+            found.update(row[0] for row in c.fetchall())
+        return found
+
+    def delete_emails(self, message_ids):
+        """remove messages and their attachment rows"""
+        c = self.conn.cursor()
+        rows = [(message_id,) for message_id in message_ids]
+        c.executemany("DELETE FROM attachments WHERE message_id = ?", rows)
+        c.executemany("DELETE FROM emails WHERE id = ?", rows)
         self.conn.commit()
+        return len(rows)
+
+    def update_labels(self, labels_by_id):
+        """overwrite the stored label set for each message id"""
+        c = self.conn.cursor()
+        c.executemany("UPDATE emails SET labels = ? WHERE id = ?",
+                      [(','.join(labels), message_id) for message_id, labels in labels_by_id.items()])
+        self.conn.commit()
+
+    def search_emails(self, query, since=None, until=None, limit=20, offset=0, raw=False):
+        """full-text search over subject/sender/body, ranked by bm25 with a highlighted body snippet.
+
+        since/until take epoch seconds or datetimes; limit/offset paginate. Unless
+        raw=True, each word of query is quoted so FTS5 operators are matched literally.
+        """
+        if not has_fts(self.conn):
+            raise RuntimeError("Full-text search is not available in this SQLite build.")
+        match = query if raw else ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+        if not match:
+            return []
+        sql = '''SELECT e.id, e.thread_id, e.sender, e.subject, e.timestamp,
+                        snippet(emails_fts, 2, '[', ']', '...', 16),
+                        bm25(emails_fts, 10.0, 5.0, 1.0) AS rank
+                 FROM emails_fts JOIN emails e ON e.rowid = emails_fts.rowid
+                 WHERE emails_fts MATCH ?'''
+        params = [match]
+        if since is not None:
+            sql += " AND e.timestamp >= ?"
+            params.append(int(since.timestamp()) if isinstance(since, datetime) else int(since))
+        if until is not None:
+            sql += " AND e.timestamp < ?"
+            params.append(int(until.timestamp()) if isinstance(until, datetime) else int(until))
+        sql += " ORDER BY rank LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        c = self.conn.cursor()
+        c.execute(sql, params)
+        return [{'id': r[0], 'thread_id': r[1], 'sender': r[2], 'subject': r[3], 'timestamp': r[4],
+                 'snippet': r[5], 'rank': r[6]} for r in c.fetchall()]
 
     def fetch_and_store_emails(self, service, max_results=10):
         results = service.users().messages().list(userId='me', maxResults=max_results).execute()
@@ -102,6 +183,105 @@ class EmailManager:
             self.store_email(email)
             self.print_email(email)
 
+    def list_message_ids(self, service, query=None, page_size=500, max_messages=None):
+        """yield message ids from messages().list, following nextPageToken"""
+        page_token = None
+        seen = 0
+        while True:
+            kwargs = {'userId': 'me', 'maxResults': page_size}
+            if query:
+                kwargs['q'] = query
+            if page_token:
+                kwargs['pageToken'] = page_token
+            results = service.users().messages().list(**kwargs).execute()
+            for message in results.get('messages', []):
+                yield message['id']
+                seen += 1
+                if max_messages is not None and seen >= max_messages:
+                    return
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
+
+    def fetch_messages_batched(self, service, message_ids, batch_size=50, max_retries=5, backoff=1.0):
+        """fetch full messages through batch HTTP requests, retrying 429/5xx items with backoff.
+
+        Returns (messages, failed_ids). Gmail caps a batch at 100 calls and
+        starts rate limiting above ~50, hence the default.
+        """
+        fetched = {}
+        failed = []
+        pending = list(message_ids)
+        attempt = 0
+        while pending:
+            retry = []
+
+            def callback(request_id, response, exception):
+                if exception is None:
+                    fetched[request_id] = response
+                elif http_status(exception) in RETRYABLE_STATUSES:
+                    retry.append(request_id)
+                else:
+                    print(f"Failed to fetch message {request_id}: {exception}")
+                    failed.append(request_id)
+
+            for start in range(0, len(pending), batch_size):
+                batch = service.new_batch_http_request(callback=callback)
+                for message_id in pending[start:start + batch_size]:
+                    batch.add(service.users().messages().get(userId='me', id=message_id, format='full'),
+                              request_id=message_id)
+                batch.execute()
+
+            if not retry:
+                break
+            attempt += 1
+            if attempt > max_retries:
+                print(f"Giving up on {len(retry)} messages after {max_retries} retries.")
+                failed.extend(retry)
+                break
+            # Exponential backoff with jitter before retrying only the throttled items
+            delay = backoff * (2 ** (attempt - 1)) + random.uniform(0, backoff)
+            print(f"{len(retry)} messages rate limited, retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            pending = retry
+
+        messages = [fetched[message_id] for message_id in message_ids if message_id in fetched]
+        return messages, failed
+
+    def backfill_emails(self, service, query=None, batch_size=50, page_size=500, max_messages=None,
+                        max_retries=5, verbose=False):
+        """paginate through the mailbox and store every message using batched fetches"""
+        stats = {'fetched': 0, 'failed': 0, 'pages': 0}
+        started = time.perf_counter()
+        page = []
+        for message_id in self.list_message_ids(service, query=query, page_size=page_size,
+                                                max_messages=max_messages):
+            page.append(message_id)
+            if len(page) >= page_size:
+                self._store_batch(service, page, batch_size, max_retries, stats, verbose)
+                page = []
+        if page:
+            self._store_batch(service, page, batch_size, max_retries, stats, verbose)
+
+        elapsed = time.perf_counter() - started
+        stats['elapsed'] = elapsed
+        stats['messages_per_sec'] = stats['fetched'] / elapsed if elapsed > 0 else 0.0
+        print(f"Backfill complete: {stats['fetched']} messages in {elapsed:.1f}s "
+              f"({stats['messages_per_sec']:.1f} msg/s, {stats['failed']} failed)")
+        return stats
+
+    def _store_batch(self, service, message_ids, batch_size, max_retries, stats, verbose):
+        messages, failed = self.fetch_messages_batched(service, message_ids, batch_size=batch_size,
+                                                       max_retries=max_retries)
+        emails = [self.parse_message(msg) for msg in messages]
+        self.store_emails(emails)
+        if verbose:
+            for email in emails:
+                self.print_email(email)
+        stats['fetched'] += len(messages)
+        stats['failed'] += len(failed)
+        stats['pages'] += 1
+
     def print_email(self, email):
         print(f"ID: {email['id']}")
         print(f"Thread ID: {email['thread_id']}")
@@ -120,8 +300,12 @@ class EmailManager:
         self.conn.close()
 
 if __name__ == '__main__':
+    import sys
     auth = GmailAuthenticator()
     service = auth.get_service()
     email_manager = EmailManager()
-    email_manager.fetch_and_store_emails(service)
-    email_manager.close()
\ No newline at end of file
+    if '--backfill' in sys.argv:
+        email_manager.backfill_emails(service)
+    else:
+        email_manager.fetch_and_store_emails(service)
+    email_manager.close()
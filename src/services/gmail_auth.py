@@ -1,9 +1,18 @@
 import os
+import threading
+from datetime import datetime, timedelta, timezone
+import google_auth_httplib2
+import httplib2
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 
+# Refresh access tokens this long before they expire, so requests never stall on a 401 and refresh
+REFRESH_MARGIN = timedelta(minutes=5)
+HTTP_TIMEOUT = 60
+
 class GmailAuthenticator:
     """Class to handle Gmail API authentication."""
 
@@ -19,6 +28,10 @@ class GmailAuthenticator:
         self.token_path = token_path
         self.creds = None
         self.service = None
+        self._services = {}  # (name, version) -> service, shared by all threads
+        self._local = threading.local()  # per-thread HTTP transport
+        self._services_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
         self.authenticate()
 
     def authenticate(self):
@@ -36,6 +49,7 @@ class GmailAuthenticator:
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
                 creds.refresh(Request())
+                self._save_token(creds)
             else:
                 flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, self.SCOPES)
                 flow.oauth2session.params['access_type'] = 'offline'  # Ensure refresh_token
@@ -43,17 +57,61 @@ class GmailAuthenticator:
                 creds = flow.run_local_server(port=8080)  
                 # Save the credentials for future use
                 print("Authentication completed, saving token...")
-                with open(self.token_path, 'w') as token:
-                    token.write(creds.to_json())
+                self._save_token(creds)
         
         # Store the credentials
         self.creds = creds
         # Build and store the default Gmail service
-        self.service = build('gmail', 'v1', credentials=self.creds)
+        self.service = self.get_service('gmail', 'v1')
+
+    def _save_token(self, creds):
+        with open(self.token_path, 'w') as token:
+            token.write(creds.to_json())
+
+    def refresh_if_needed(self):
+        """refresh the access token if it expires within REFRESH_MARGIN; returns True if refreshed"""
+        if not self._expiring():
+            return False
+        with self._refresh_lock:
+            # Another thread may have refreshed while we waited for the lock
+            if not self._expiring() or not self.creds.refresh_token:
+                return False
+            self.creds.refresh(Request())
+            self._save_token(self.creds)
+            return True
+
+    def _expiring(self):
+        expiry = self.creds.expiry  # naive UTC, as google-auth stores it
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return expiry is not None and expiry - REFRESH_MARGIN <= now
+
+    def http(self):
+        """this thread's authorized HTTP transport; httplib2 connections are not thread-safe"""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+            self._local.http = http
+        return http
+
+    def _build_request(self, http, *args, **kwargs):
+        # Every API request is routed through the calling thread's transport, so one service
+        # object can be shared across threads while each thread keeps its connections alive
+        self.refresh_if_needed()
+        return HttpRequest(self.http(), *args, **kwargs)
 
     def get_service(self, service_name='gmail', version='v1'):
-        """Return a Google API service instance for the specified service and version."""
-        return build(service_name, version, credentials=self.creds)
+        """Return a Google API service instance for the specified service and version.
+
+        Services are built once per (name, version) from the discovery documents bundled
+        with google-api-python-client and shared; building parses the whole document.
+        """
+        key = (service_name, version)
+        with self._services_lock:
+            if key not in self._services:
+                self._services[key] = build(service_name, version, http=self.http(),
+                                            requestBuilder=self._build_request,
+                                            static_discovery=True, cache_discovery=False)
+            return self._services[key]
 
 if __name__ == '__main__':
     auth = GmailAuthenticator()
@@ -0,0 +1,201 @@
+import time
+from services.email_parser import EmailManager, http_status
+from services.gmail_auth import GmailAuthenticator
+
+HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+# Syncs that retry a message that failed to fetch before it is given up on
+MAX_FETCH_ATTEMPTS = 5
+
+
+class HistoryExpiredError(Exception):
+    """Raised when the stored historyId is too old for users().history().list."""
+
+
+class GmailSyncEngine:
+    """Class to keep emails.db in step with the mailbox using Gmail history records."""
+
+    def __init__(self, email_manager, service, account='me', batch_size=50):
+        """Initialize with an EmailManager (for its connection) and a Gmail service."""
+        self.email_manager = email_manager
+        self.conn = email_manager.conn
+        self.service = service
+        self.account = account
+        self.batch_size = batch_size
+        self._last_response_history_id = None
+
+    def get_history_id(self):
+        c = self.conn.cursor()
+        c.execute("SELECT history_id FROM sync_state WHERE account = ?", (self.account,))
+        row = c.fetchone()
+        return row[0] if row else None
+
+    def set_history_id(self, history_id, full=False):
+        now = int(time.time())
+        c = self.conn.cursor()
+        c.execute('''INSERT INTO sync_state (account, history_id, last_full_sync, last_sync)
+                     VALUES (?, ?, ?, ?)
+                     ON CONFLICT(account) DO UPDATE SET
+                         history_id = excluded.history_id,
+                         last_full_sync = COALESCE(excluded.last_full_sync, sync_state.last_full_sync),
+                         last_sync = excluded.last_sync''',
+                  (self.account, str(history_id), now if full else None, now))
+        self.conn.commit()
+
+    def sync(self):
+        """apply mailbox changes since the last run, falling back to a full resync if needed"""
+        history_id = self.get_history_id()
+        if history_id is None:
+            return self.full_resync()
+        try:
+            return self.incremental_sync(history_id)
+        except HistoryExpiredError:
+            print(f"History {history_id} has expired, running a full resync...")
+            return self.full_resync()
+
+    def incremental_sync(self, start_history_id):
+        """fetch history records after start_history_id and apply only those deltas"""
+        added, deleted, labels = {}, set(), {}
+        latest_history_id = start_history_id
+        for record in self._list_history(start_history_id):
+            for item in record.get('messagesAdded', []):
+                message = item['message']
+                added[message['id']] = message
+                deleted.discard(message['id'])
+            for item in record.get('messagesDeleted', []):
+                message_id = item['message']['id']
+                added.pop(message_id, None)
+                labels.pop(message_id, None)
+                deleted.add(message_id)
+            for key in ('labelsAdded', 'labelsRemoved'):
+                for item in record.get(key, []):
+                    message = item['message']
+                    if 'labelIds' in message:
+                        labels[message['id']] = message['labelIds']
+            latest_history_id = record.get('id', latest_history_id)
+
+        new_ids = [message_id for message_id in added if message_id not in deleted]
+        existing = self.email_manager.existing_ids(new_ids)
+        stored = self._fetch_and_store([message_id for message_id in new_ids if message_id not in existing])
+
+        # Label changes on messages we just fetched are already reflected in the fetched copy
+        label_updates = {message_id: label_ids for message_id, label_ids in labels.items()
+                         if message_id not in stored}
+        if label_updates:
+            self.email_manager.update_labels(label_updates)
+        if deleted:
+            self.email_manager.delete_emails(deleted)
+            self._forget_failures(deleted)
+
+        # Messages that failed to fetch are in sync_failures and retried next time, so the cursor can move on
+        self.set_history_id(max(int(latest_history_id), int(self._last_response_history_id or 0)))
+        result = {
+            'mode': 'incremental',
+            'added': sorted(stored),
+            'deleted': len(deleted),
+            'labels_updated': len(label_updates),
+            'failed': len(self.pending_failures()),
+            'history_id': self.get_history_id()
+        }
+        print(f"Incremental sync: {len(stored)} added, {len(deleted)} deleted, "
+              f"{len(label_updates)} relabelled (historyId {result['history_id']})")
+        return result
+
+    def full_resync(self, query=None, max_messages=None):
+        """list the whole mailbox, store messages we don't have and drop ones that are gone"""
+        # Take the historyId before listing so changes made during the resync are replayed next time
+        profile = self.service.users().getProfile(userId=self.account).execute()
+        history_id = profile['historyId']
+
+        listed = list(self.email_manager.list_message_ids(self.service, query=query, max_messages=max_messages))
+        existing = self.email_manager.existing_ids(listed)
+        stored = self._fetch_and_store([message_id for message_id in listed if message_id not in existing])
+
+        deleted = 0
+        if query is None and max_messages is None:
+            c = self.conn.cursor()
+            c.execute("SELECT id FROM emails")
+            listed_set = set(listed)
+            stale = [row[0] for row in c.fetchall() if row[0] not in listed_set]
+            deleted = self.email_manager.delete_emails(stale) if stale else 0
+
+        self.set_history_id(history_id, full=True)
+        print(f"Full resync: {len(stored)} added, {deleted} deleted (historyId {history_id})")
+        return {'mode': 'full', 'added': sorted(stored), 'deleted': deleted,
+                'labels_updated': 0, 'failed': len(self.pending_failures()), 'history_id': str(history_id)}
+
+    def _list_history(self, start_history_id):
+        """yield history records page by page"""
+        page_token = None
+        while True:
+            kwargs = {'userId': self.account, 'startHistoryId': start_history_id,
+                      'historyTypes': HISTORY_TYPES}
+            if page_token:
+                kwargs['pageToken'] = page_token
+            try:
+                response = self.service.users().history().list(**kwargs).execute()
+            except Exception as e:
+                # Gmail answers 404 once startHistoryId falls out of its retention window
+                if http_status(e) == 404:
+                    raise HistoryExpiredError(str(e)) from e
+                raise
+            self._last_response_history_id = response.get('historyId', self._last_response_history_id)
+            yield from response.get('history', [])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return
+
+    def _fetch_and_store(self, message_ids):
+        """batch-fetch and store message_ids plus earlier failures, returning the set actually stored"""
+        requested = set(message_ids)
+        message_ids = list(message_ids) + [message_id for message_id in self.pending_failures()
+                                           if message_id not in requested]
+        stored = set()
+        if not message_ids:
+            return stored
+        messages, failed = self.email_manager.fetch_messages_batched(self.service, message_ids,
+                                                                     batch_size=self.batch_size)
+        self.email_manager.store_emails(self.email_manager.parse_message(msg) for msg in messages)
+        stored.update(msg['id'] for msg in messages)
+        self._forget_failures(stored)
+        self.record_failures(failed)
+        return stored
+
+    def pending_failures(self):
+        """ids of messages that failed to fetch and will be retried by the next sync"""
+        c = self.conn.cursor()
+        c.execute("SELECT message_id FROM sync_failures WHERE account = ? ORDER BY last_attempt", (self.account,))
+        return [row[0] for row in c.fetchall()]
+
+    def record_failures(self, message_ids):
+        """queue message ids that could not be fetched for the next sync to retry"""
+        if not message_ids:
+            return
+        c = self.conn.cursor()
+        print(f"{len(message_ids)} messages failed to fetch; they are retried on the next sync.")
+        c.executemany('''INSERT INTO sync_failures (account, message_id, attempts, last_attempt) VALUES (?, ?, 1, ?)
+                         ON CONFLICT(account, message_id) DO UPDATE SET attempts = sync_failures.attempts + 1,
+                             last_attempt = excluded.last_attempt''',
+                      [(self.account, message_id, int(time.time())) for message_id in message_ids])
+        # A message that keeps failing (e.g. deleted before it could be fetched) is not retried forever
+        c.execute("SELECT message_id FROM sync_failures WHERE account = ? AND attempts >= ?",
+                  (self.account, MAX_FETCH_ATTEMPTS))
+        given_up = [row[0] for row in c.fetchall()]
+        if given_up:
+            print(f"Giving up on {len(given_up)} messages after {MAX_FETCH_ATTEMPTS} failed syncs: {', '.join(given_up)}")
+            self._forget_failures(given_up, commit=False)
+        self.conn.commit()
+
+    def _forget_failures(self, message_ids, commit=True):
+        if not message_ids:
+            return
+        self.conn.cursor().executemany("DELETE FROM sync_failures WHERE account = ? AND message_id = ?",
+                                       [(self.account, message_id) for message_id in message_ids])
+        if commit:
+            self.conn.commit()
+
+if __name__ == '__main__':
+    auth = GmailAuthenticator()
+    email_manager = EmailManager()
+    engine = GmailSyncEngine(email_manager, auth.get_service())
+    engine.sync()
+    email_manager.close()
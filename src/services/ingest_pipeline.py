@@ -0,0 +1,260 @@
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from services.email_parser import EmailManager
+from services.gmail_auth import GmailAuthenticator
+from services.gmail_sync import GmailSyncEngine
+
+_DONE = object()  # end-of-stream marker passed down the queues
+
+
+def parse_batch(messages):
+    """parse a batch of full-format messages (module level so process pools can pickle it)"""
+    return [EmailManager.parse_message(msg) for msg in messages]
+
+
+class StageStats:
+    """Per-stage counters: time spent working, waiting for input, and blocked on a full output queue."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.wait_in = 0.0
+        self.wait_out = 0.0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def add(self, items=0, busy=0.0, wait_in=0.0, wait_out=0.0, errors=0):
+        with self._lock:
+            self.items += items
+            self.busy += busy
+            self.wait_in += wait_in
+            self.wait_out += wait_out
+            self.errors += errors
+
+    def as_dict(self):
+        return {'items': self.items, 'busy': self.busy, 'wait_in': self.wait_in,
+                'wait_out': self.wait_out, 'errors': self.errors}
+
+
+class IngestPipeline:
+    """Staged list -> fetch -> parse -> store pipeline with bounded queues between stages.
+
+    Each fetcher calls service_factory once; GmailAuthenticator.get_service hands them
+    all the same service, whose requests go out on each thread's own AuthorizedHttp.
+    Parsing runs in a process pool so html2text uses more than one core, and a single
+    writer thread owns the database connection. Full queues block the upstream stage,
+    so a slow stage shows up as wait_out on the stage before it. Messages that fail to
+    fetch go into sync_failures, where the next GmailSyncEngine sync retries them.
+
+    Parse workers are started with the 'spawn' method by default: the pool starts
+    them on first submit, when the stage threads are already running and may hold
+    locks (sqlite, httplib2, stdout) that a forked child would inherit held.
+    """
+
+    def __init__(self, service_factory, db_path='emails.db', fetchers=4, parse_workers=4, use_processes=True,
+                 batch_size=50, write_batch=1000, queue_size=8, mp_context='spawn', account='me'):
+        """Initialize with a zero-argument callable returning a Gmail service, plus stage sizes."""
+        self.service_factory = service_factory
+        self.db_path = db_path
+        self.fetchers = fetchers
+        self.parse_workers = parse_workers
+        self.use_processes = use_processes
+        self.batch_size = batch_size
+        self.write_batch = write_batch
+        self.queue_size = queue_size
+        self.mp_context = mp_context
+        self.account = account
+        self.manager = EmailManager(db_path)
+        self.stats = {}
+        self.failed = []
+        self._failed_lock = threading.Lock()
+
+    def run(self, message_ids=None, query=None, max_messages=None):
+        """ingest message_ids (or every message matching query) and return per-stage stats
+
+        The report's 'failed' lists the ids that could not be fetched.
+        """
+        self.stats = {name: StageStats(name) for name in ('list', 'fetch', 'parse', 'store')}
+        self.failed = []
+        id_queue = queue.Queue(self.queue_size)
+        raw_queue = queue.Queue(self.queue_size)
+        parsed_queue = queue.Queue(self.queue_size)
+        started = time.perf_counter()
+
+        if self.use_processes:
+            pool = ProcessPoolExecutor(max_workers=self.parse_workers,
+                                       mp_context=multiprocessing.get_context(self.mp_context))
+        else:
+            pool = ThreadPoolExecutor(max_workers=self.parse_workers)
+        with pool:
+            lister = self._spawn(self._list_stage, id_queue, message_ids, query, max_messages)
+            fetchers = [self._spawn(self._fetch_stage, id_queue, raw_queue) for _ in range(self.fetchers)]
+            parsers = [self._spawn(self._parse_stage, raw_queue, parsed_queue, pool)
+                       for _ in range(self.parse_workers)]
+            writer = self._spawn(self._store_stage, parsed_queue)
+
+            # Shut stages down in order, one end marker per downstream consumer
+            lister.join()
+            for _ in fetchers:
+                id_queue.put(_DONE)
+            for thread in fetchers:
+                thread.join()
+            for _ in parsers:
+                raw_queue.put(_DONE)
+            for thread in parsers:
+                thread.join()
+            parsed_queue.put(_DONE)
+            writer.join()
+
+        if self.failed:
+            GmailSyncEngine(self.manager, None, account=self.account).record_failures(self.failed)
+        elapsed = time.perf_counter() - started
+        stored = self.stats['store'].items
+        report = {name: stage.as_dict() for name, stage in self.stats.items()}
+        report['failed'] = list(self.failed)
+        report['elapsed'] = elapsed
+        report['messages_per_sec'] = stored / elapsed if elapsed > 0 else 0.0
+        self.print_report(report)
+        return report
+
+    @staticmethod
+    def _spawn(target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def _put(q, item, stats):
+        started = time.perf_counter()
+        q.put(item)
+        stats.add(wait_out=time.perf_counter() - started)
+
+    @staticmethod
+    def _get(q, stats):
+        started = time.perf_counter()
+        item = q.get()
+        stats.add(wait_in=time.perf_counter() - started)
+        return item
+
+    def _list_stage(self, out_queue, message_ids, query, max_messages):
+        stats = self.stats['list']
+        try:
+            if message_ids is None:
+                service = self.service_factory()
+                message_ids = self.manager.list_message_ids(service, query=query, max_messages=max_messages)
+            batch = []
+            started = time.perf_counter()
+            for message_id in message_ids:
+                batch.append(message_id)
+                if len(batch) >= self.batch_size:
+                    stats.add(items=len(batch), busy=time.perf_counter() - started)
+                    self._put(out_queue, batch, stats)
+                    batch = []
+                    started = time.perf_counter()
+            if batch:
+                stats.add(items=len(batch), busy=time.perf_counter() - started)
+                self._put(out_queue, batch, stats)
+        except Exception as e:
+            print(f"List stage failed: {e}")
+            stats.add(errors=1)
+
+    def _fetch_stage(self, in_queue, out_queue):
+        stats = self.stats['fetch']
+        try:
+            service = self.service_factory()
+        except Exception as e:
+            print(f"Fetch stage could not create a service: {e}")
+            service = None
+        while True:
+            batch = self._get(in_queue, stats)
+            if batch is _DONE:
+                return
+            if service is None:
+                # Keep draining so the lister never blocks on a dead fetcher
+                stats.add(errors=len(batch))
+                self._add_failed(batch)
+                continue
+            started = time.perf_counter()
+            try:
+                messages, failed = self.manager.fetch_messages_batched(service, batch, batch_size=self.batch_size)
+            except Exception as e:
+                print(f"Fetch stage failed for {len(batch)} messages: {e}")
+                stats.add(errors=len(batch), busy=time.perf_counter() - started)
+                self._add_failed(batch)
+                continue
+            stats.add(items=len(messages), errors=len(failed), busy=time.perf_counter() - started)
+            self._add_failed(failed)
+            if messages:
+                self._put(out_queue, messages, stats)
+
+    def _add_failed(self, message_ids):
+        with self._failed_lock:
+            self.failed.extend(message_ids)
+
+    def _parse_stage(self, in_queue, out_queue, pool):
+        stats = self.stats['parse']
+        while True:
+            messages = self._get(in_queue, stats)
+            if messages is _DONE:
+                return
+            started = time.perf_counter()
+            try:
+                emails = pool.submit(parse_batch, messages).result()
+            except Exception as e:
+                print(f"Parse stage failed for {len(messages)} messages: {e}")
+                stats.add(errors=len(messages), busy=time.perf_counter() - started)
+                continue
+            stats.add(items=len(emails), busy=time.perf_counter() - started)
+            self._put(out_queue, emails, stats)
+
+    def _store_stage(self, in_queue):
+        stats = self.stats['store']
+        # SQLite connections belong to the thread that opened them
+        writer = EmailManager(self.db_path)
+        pending = []
+        try:
+            while True:
+                emails = self._get(in_queue, stats)
+                if emails is not _DONE:
+                    pending.extend(emails)
+                    # Keep draining while more is queued so commits cover larger batches
+                    if len(pending) < self.write_batch and not in_queue.empty():
+                        continue
+                if pending:
+                    started = time.perf_counter()
+                    try:
+                        stored = writer.store_emails(pending, commit_interval=self.write_batch)
+                        stats.add(items=stored, busy=time.perf_counter() - started)
+                    except Exception as e:
+                        # Keep consuming so upstream stages never block on a dead writer
+                        print(f"Store stage failed for {len(pending)} messages: {e}")
+                        stats.add(errors=len(pending), busy=time.perf_counter() - started)
+                    pending = []
+                if emails is _DONE:
+                    return
+        finally:
+            writer.close()
+
+    @staticmethod
+    def print_report(report):
+        print(f"Ingested {report['store']['items']} messages in {report['elapsed']:.1f}s "
+              f"({report['messages_per_sec']:.1f} msg/s)")
+        print(f"{'stage':<7}{'items':>9}{'busy s':>10}{'wait in s':>11}{'blocked s':>11}{'errors':>8}")
+        for name in ('list', 'fetch', 'parse', 'store'):
+            stage = report[name]
+            print(f"{name:<7}{stage['items']:>9}{stage['busy']:>10.2f}{stage['wait_in']:>11.2f}"
+                  f"{stage['wait_out']:>11.2f}{stage['errors']:>8}")
+
+    def close(self):
+        self.manager.close()
+
+
+if __name__ == '__main__':
+    auth = GmailAuthenticator()
+    pipeline = IngestPipeline(lambda: auth.get_service())
+    pipeline.run()
+    pipeline.close()
@@ -0,0 +1,301 @@
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from services.email_parser import EmailManager
+from services.gmail_sync import GmailSyncEngine
+from services.notification_sources import AdaptivePoller, PubSubPushSource
+from services.work_queue import QueueWorker, WorkQueue, build_handlers
+from utils.latency import LatencyTracker
+
+
+class MailDaemon:
+    """Resident process that keeps clients, models and connections warm and reacts to new mail.
+
+    Each notification from the source triggers an incremental history sync; every new
+    inbox message is then queued in email_jobs and run through its stages (analysis,
+    Slack, calendar, reply drafting) right away, so a restart or a parallel
+    work_queue worker never repeats a stage. Latency from notification to the last
+    stage is tracked per message.
+    """
+
+    def __init__(self, service, source, db_path='emails.db', analyzer=None, notifier=None, scheduler=None,
+                 drafter=None, metrics_port=None, auto_send=False):
+        """Initialize with a Gmail service, a notification source and the optional pipeline components.
+
+        Drafted replies are only sent with auto_send (see build_handlers).
+        """
+        self.service = service
+        self.source = source
+        self.manager = EmailManager(db_path)
+        self.sync_engine = GmailSyncEngine(self.manager, service)
+        self.analyzer = analyzer
+        self.notifier = notifier
+        self.scheduler = scheduler
+        self.drafter = drafter
+        self.metrics_port = metrics_port
+
+        handlers = build_handlers(self.manager.conn, analyzer, notifier, scheduler, drafter, auto_send=auto_send)
+        self.queue = WorkQueue(self.manager.conn)
+        self.worker = QueueWorker(self.queue, handlers, observe=self._observe)
+
+        self.latency = {'notify_to_done': LatencyTracker(), 'delivery_to_done': LatencyTracker()}
+        self.step_latency = {stage: LatencyTracker() for stage in handlers}
+        self.counters = {'notifications': 0, 'skipped_notifications': 0, 'syncs': 0, 'sync_errors': 0,
+                         'messages': 0, 'step_errors': 0}
+        self.last_sync_at = time.time()
+        self._stop = threading.Event()
+        self._metrics_server = None
+
+    @classmethod
+    def from_authenticator(cls, authenticator, source, db_path='emails.db', slack_channel=None, drafts=True,
+                           metrics_port=None, warm_up=True, slack_digest_window=None, auto_send=False):
+        """build a daemon with every component sharing one analyzer (and so one set of loaded models)
+
+        slack_digest_window overrides SlackNotifier's default digest window.
+        """
+        from controllers.email_drafter import EmailDrafter
+        from services.calendar_scheduler import CalendarScheduler
+        from services.email_analyzer import EmailAnalyzer
+        from services.slack_notifier import SlackNotifier
+
+        analyzer = EmailAnalyzer(authenticator, db_path=db_path)
+        notifier = None
+        if slack_channel:
+            window = {} if slack_digest_window is None else {'digest_window': slack_digest_window}
+            notifier = SlackNotifier(db_path, channel=slack_channel, analyzer=analyzer, **window)
+        scheduler = CalendarScheduler(authenticator, db_path=db_path, analyzer=analyzer)
+        drafter = EmailDrafter(db_path, authenticator=authenticator, analyzer=analyzer,
+                               scheduler=scheduler) if drafts else None
+        if warm_up:
+            analyzer.models.warm_up()
+        return cls(authenticator.get_service(), source, db_path=db_path, analyzer=analyzer, notifier=notifier,
+                   scheduler=scheduler, drafter=drafter, metrics_port=metrics_port, auto_send=auto_send)
+
+    # main loop
+
+    def run(self, max_notifications=None):
+        """serve notifications until stop() (or max_notifications have been handled)"""
+        self.source.start(self.service)
+        self._start_metrics_server()
+        if self.sync_engine.get_history_id() is None:
+            # Establish the baseline without running the pipeline over the whole mailbox
+            self.sync_engine.sync()
+            self.last_sync_at = time.time()
+        handled = 0
+        try:
+            while not self._stop.is_set():
+                notification = self.source.get(timeout=1.0)
+                if notification is None:
+                    continue
+                notifications = [notification]
+                # Coalesce everything already queued into one sync
+                while True:
+                    extra = self.source.get(timeout=0)
+                    if extra is None:
+                        break
+                    notifications.append(extra)
+                self.handle_notifications(notifications)
+                handled += len(notifications)
+                if max_notifications is not None and handled >= max_notifications:
+                    break
+        except KeyboardInterrupt:
+            print("Interrupted, shutting down...")
+        return self.metrics()
+
+    def stop(self):
+        self._stop.set()
+
+    def handle_notifications(self, notifications):
+        """sync once for a group of notifications and run the pipeline over new inbox mail"""
+        self.counters['notifications'] += len(notifications)
+        pushed = [n['history_id'] for n in notifications if n.get('history_id') is not None]
+        stored = self.sync_engine.get_history_id()
+        if pushed and len(pushed) == len(notifications) and stored and max(pushed) <= int(stored):
+            # Pub/Sub redelivery or a change we already synced
+            self.counters['skipped_notifications'] += len(notifications)
+            self.source.report(0)
+            return []
+
+        sync_started = time.time()
+        try:
+            result = self.sync_engine.sync()
+        except Exception as e:
+            print(f"Sync failed: {e}")
+            self.counters['sync_errors'] += 1
+            self.source.report(0)
+            return []
+        self.counters['syncs'] += 1
+
+        emails = self._new_inbox_emails(result)
+        self.last_sync_at = sync_started
+        received_at = min(n['received_at'] for n in notifications)
+        self.queue.enqueue(email['id'] for email in emails)
+        for email in emails:
+            self.process(email, received_at)
+        self.source.report(len(emails))
+        return emails
+
+    def _new_inbox_emails(self, result):
+        """stored rows for the sync's added messages that arrived in the inbox (not our own sent mail)"""
+        added = result['added']
+        rows = []
+        c = self.manager.conn.cursor()
+        for start in range(0, len(added), 500):
+            chunk = added[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f"SELECT id, thread_id, timestamp, labels FROM emails WHERE id IN ({placeholders}) "
+                      "ORDER BY timestamp", chunk)
+            rows.extend(c.fetchall())
+        emails = []
+        for message_id, thread_id, timestamp, labels in rows:
+            labels = set((labels or '').split(','))
+            if 'INBOX' not in labels or 'SENT' in labels:
+                continue
+            # A full resync (first run or expired history) lists old mail too; only act on what is new
+            if result['mode'] == 'full' and timestamp < self.last_sync_at:
+                continue
+            emails.append({'id': message_id, 'thread_id': thread_id, 'timestamp': timestamp})
+        return emails
+
+    def _observe(self, stage, seconds, error):
+        self.step_latency[stage].add(seconds)
+        if error is not None:
+            self.counters['step_errors'] += 1
+
+    def process(self, email, received_at=None):
+        """run the remaining stages of one queued message, recording end-to-end latency"""
+        # A failed stage stays queued with backoff and is retried by the work_queue workers
+        self.worker.process_emails([email['id']])
+        done = time.time()
+        self.counters['messages'] += 1
+        if received_at is not None:
+            self.latency['notify_to_done'].add(done - received_at)
+        if email.get('timestamp'):
+            self.latency['delivery_to_done'].add(max(0.0, done - email['timestamp']))
+
+    # metrics
+
+    def metrics(self):
+        report = dict(self.counters)
+        report['latency'] = {name: tracker.as_dict() for name, tracker in self.latency.items()}
+        report['steps'] = {name: tracker.as_dict() for name, tracker in self.step_latency.items()}
+        report['cascades'] = {name: cascade.stats() for name, cascade in self._cascades().items()}
+        if self.notifier:
+            report['slack'] = self.notifier.stats()
+        return report
+
+    def _cascades(self):
+        cascades = {}
+        if self.scheduler:
+            cascades['scheduling'] = self.scheduler.cascade
+        if self.drafter:
+            cascades['reply'] = self.drafter.reply_cascade
+        return cascades
+
+    def metrics_text(self):
+        """metrics in the Prometheus text exposition format"""
+        lines = [f"mail_daemon_{name}_total {value}" for name, value in self.counters.items()]
+        for metric, label, trackers in (('mail_daemon_latency_seconds', 'stage', self.latency),
+                                        ('mail_daemon_step_seconds', 'step', self.step_latency)):
+            for name, tracker in trackers.items():
+                stats = tracker.as_dict()
+                for quantile in ('p50', 'p95'):
+                    if stats[quantile] is not None:
+                        lines.append(f'{metric}{{{label}="{name}",quantile="0.{quantile[1:]}"}} {stats[quantile]:.6f}')
+                lines.append(f'{metric}_count{{{label}="{name}"}} {stats["count"]}')
+                lines.append(f'{metric}_sum{{{label}="{name}"}} {stats["sum"]:.6f}')
+        if self.notifier:
+            for name, value in self.notifier.stats().items():
+                if name == 'queue_delay':
+                    lines.append(f'mail_daemon_slack_queue_delay_seconds_count {value["count"]}')
+                    lines.append(f'mail_daemon_slack_queue_delay_seconds_sum {value["sum"]:.6f}')
+                elif name == 'pending':
+                    lines.append(f'mail_daemon_slack_pending {value}')
+                else:
+                    lines.append(f'mail_daemon_slack_{name}_total {value}')
+        for name, cascade in self._cascades().items():
+            for stage, counters in cascade.stats().items():
+                if stage == 'unresolved':
+                    continue
+                labels = f'cascade="{name}",stage="{stage}"'
+                lines.append(f'mail_daemon_cascade_resolved_total{{{labels}}} {counters["resolved"]}')
+                lines.append(f'mail_daemon_cascade_seconds_total{{{labels}}} {counters["seconds"]:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def _start_metrics_server(self):
+        if self.metrics_port is None:
+            return
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = daemon.metrics_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._metrics_server = ThreadingHTTPServer(('0.0.0.0', self.metrics_port), Handler)
+        self.metrics_port = self._metrics_server.server_address[1]
+        threading.Thread(target=self._metrics_server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://0.0.0.0:{self.metrics_port}/metrics")
+
+    def close(self):
+        self.stop()
+        self.source.close()
+        if self._metrics_server:
+            self._metrics_server.shutdown()
+            self._metrics_server.server_close()
+        if self.drafter:
+            self.drafter.close()
+        elif self.scheduler:
+            self.scheduler.close()
+        if self.notifier:
+            self.notifier.close()
+        if self.analyzer:
+            self.analyzer.close()
+        self.manager.close()
+
+
+if __name__ == '__main__':
+    from services.gmail_auth import GmailAuthenticator
+
+    parser = argparse.ArgumentParser(description="Keep models and clients warm and process new mail as it arrives.")
+    parser.add_argument('--db', default='emails.db')
+    parser.add_argument('--push-topic', help="Pub/Sub topic (projects/<p>/topics/<t>); polls when omitted")
+    parser.add_argument('--push-port', type=int, default=8085)
+    parser.add_argument('--push-token', help="shared secret expected as ?token= on push requests")
+    parser.add_argument('--min-interval', type=float, default=15)
+    parser.add_argument('--max-interval', type=float, default=300)
+    parser.add_argument('--slack-channel')
+    parser.add_argument('--slack-digest-window', type=float,
+                        help="seconds to collect Slack notifications into one digest (default 30)")
+    parser.add_argument('--no-drafts', action='store_true')
+    parser.add_argument('--auto-send', action='store_true',
+                        help="send drafted replies to safe senders without confirmation (trusts the From header)")
+    parser.add_argument('--metrics-port', type=int)
+    args = parser.parse_args()
+
+    if args.push_topic:
+        source = PubSubPushSource(args.push_topic, port=args.push_port, verification_token=args.push_token)
+    else:
+        source = AdaptivePoller(args.min_interval, args.max_interval)
+    daemon = MailDaemon.from_authenticator(GmailAuthenticator(), source, db_path=args.db,
+                                           slack_channel=args.slack_channel, drafts=not args.no_drafts,
+                                           metrics_port=args.metrics_port,
+                                           slack_digest_window=args.slack_digest_window,
+                                           auto_send=args.auto_send)
+    try:
+        daemon.run()
+    finally:
+        print(daemon.metrics())
+        daemon.close()
@@ -0,0 +1,76 @@
+import base64
+import html2text
+
+# Decoded bytes kept per text part; newsletters can carry megabytes of HTML we never read
+MAX_PART_BYTES = 256 * 1024
+
+
+def decode_part(data, max_bytes=MAX_PART_BYTES):
+    """base64url-decode at most max_bytes of a Gmail part body"""
+    # 4 encoded characters carry 3 bytes, so only decode the prefix we keep
+    limit = -(-max_bytes // 3) * 4
+    chunk = data[:limit]
+    raw = base64.urlsafe_b64decode(chunk + '=' * (-len(chunk) % 4))
+    return raw[:max_bytes].decode('utf-8', errors='ignore')
+
+
+class MimeContent:
+    """Body candidates and attachment metadata collected from one pass over a payload tree."""
+
+    def __init__(self, max_part_bytes=MAX_PART_BYTES):
+        self.plain = None
+        self.html_data = None  # still base64url-encoded: only decoded when there is no text/plain part
+        self.max_part_bytes = max_part_bytes
+        self.attachments = []
+        self._body = None
+
+    @property
+    def html(self):
+        return decode_part(self.html_data, self.max_part_bytes) if self.html_data is not None else None
+
+    @property
+    def body(self):
+        """text/plain body if there is one, otherwise the HTML body converted to text"""
+        if self._body is None:
+            if self.plain is not None:
+                self._body = self.plain
+            elif self.html_data is not None:
+                self._body = html2text.html2text(self.html)
+            else:
+                self._body = ''
+        return self._body
+
+
+def walk_payload(payload, max_part_bytes=MAX_PART_BYTES):
+    """walk a Gmail message payload once, returning a MimeContent.
+
+    The first text/plain and first text/html parts (in document order) are kept
+    as body candidates, the HTML one undecoded until it is needed; parts with a
+    filename are recorded as attachments without decoding them.
+    """
+    content = MimeContent(max_part_bytes)
+    stack = [(payload, '')]
+    while stack:
+        part, path = stack.pop()
+        mime_type = part.get('mimeType', '')
+        body = part.get('body', {})
+        if part.get('filename'):
+            content.attachments.append({
+                'filename': part['filename'],
+                'mime_type': mime_type,
+                'size': int(body.get('size', 0)),
+                # partId is stable across fetches (attachmentId is not) and unique even when filenames repeat
+                'part_id': part.get('partId', path),
+                'attachment_id': body.get('attachmentId')
+            })
+        elif 'data' in body:
+            if mime_type == 'text/html':
+                if content.html_data is None:
+                    content.html_data = body['data']
+            elif content.plain is None and (mime_type == 'text/plain' or part is payload):
+                content.plain = decode_part(body['data'], max_part_bytes)
+        if 'parts' in part:
+            # Reversed so parts pop off the stack in document order; paths follow Gmail's partId numbering
+            prefix = f"{path}." if path else ''
+            stack.extend(reversed([(child, f"{prefix}{index}") for index, child in enumerate(part['parts'])]))
+    return content
@@ -0,0 +1,198 @@
+import importlib.util
+import os
+import threading
+import time
+from transformers import pipeline
+
+# Pipelines shared by every service; keyed by the name services ask for
+MODEL_SPECS = {
+    'summarizer': {'task': 'summarization', 'model': 'facebook/bart-large-cnn'},
+    'classifier': {'task': 'text-classification', 'model': 'distilbert-base-uncased-finetuned-sst-2-english'},
+}
+
+# How the pipelines run: fp32 PyTorch, int8 dynamically quantized PyTorch, or ONNX Runtime via optimum
+BACKENDS = ('pytorch', 'quantized', 'onnx')
+DEFAULT_BACKEND = os.getenv('ANALYZER_BACKEND', 'pytorch')
+# Exported ONNX graphs are written here once and reloaded on later starts
+ONNX_CACHE_DIR = os.getenv('ONNX_CACHE_DIR', 'onnx_models')
+ONNX_MODEL_CLASSES = {
+    'summarization': 'ORTModelForSeq2SeqLM',
+    'text-classification': 'ORTModelForSequenceClassification',
+}
+
+
+def onnx_available():
+    return importlib.util.find_spec('onnxruntime') is not None and importlib.util.find_spec('optimum') is not None
+
+
+def resolve_backend(backend=None):
+    """validated backend name; 'onnx' falls back to 'pytorch' when ONNX Runtime is not installed"""
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Known backends: {', '.join(BACKENDS)}")
+    if backend == 'onnx' and not onnx_available():
+        print("ONNX backend needs onnxruntime and optimum[onnxruntime]; falling back to pytorch")
+        return 'pytorch'
+    return backend
+
+
+def model_id(model, backend):
+    """identifier for a model's outputs under a backend (fp32 PyTorch keeps the plain model name)"""
+    return model if backend == 'pytorch' else f"{model}@{backend}"
+
+
+def current_rss():
+    """resident set size of this process in bytes (0 if it cannot be determined)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return 0
+
+
+class ModelRegistry:
+    """Process-wide, lazily loaded Hugging Face pipelines."""
+
+    def __init__(self, specs=None, backend=None):
+        """Initialize with model specs and an inference backend; nothing is loaded until first use."""
+        self.specs = dict(specs or MODEL_SPECS)
+        self.backend = resolve_backend(backend)
+        self._models = {}
+        self._tokenizers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """return the pipeline called name, loading it on first use"""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            if name not in self._models:
+                self._models[name] = self._load(name)
+            return self._models[name]
+
+    def tokenizer(self, name):
+        """the tokenizer of the model called name, without loading the model itself
+
+        Used for token counting where inference runs elsewhere (e.g. in an AnalysisPool).
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model.tokenizer
+        with self._lock:
+            if name not in self._tokenizers:
+                if name not in self.specs:
+                    raise KeyError(f"Unknown model '{name}'. Known models: {', '.join(self.specs)}")
+                from transformers import AutoTokenizer
+                self._tokenizers[name] = AutoTokenizer.from_pretrained(self.specs[name]['model'])
+            return self._tokenizers[name]
+
+    def model_id(self, name):
+        """identifier of the outputs of the model called name, used in analysis cache keys"""
+        return model_id(self.specs[name]['model'], self.backend)
+
+    def _load(self, name):
+        if name not in self.specs:
+            raise KeyError(f"Unknown model '{name}'. Known models: {', '.join(self.specs)}")
+        spec = self.specs[name]
+        print(f"Loading {name} ({spec['model']}, {self.backend})...")
+        rss_before = current_rss()
+        started = time.perf_counter()
+        if self.backend == 'onnx':
+            model = self._load_onnx(spec)
+        else:
+            model = pipeline(spec['task'], model=spec['model'], framework='pt')
+            if self.backend == 'quantized':
+                import torch
+                # int8 weights for every Linear layer; activations are quantized on the fly
+                model.model = torch.quantization.quantize_dynamic(model.model, {torch.nn.Linear}, dtype=torch.qint8)
+        load_seconds = time.perf_counter() - started
+        self._stats[name] = {
+            'model': spec['model'],
+            'backend': self.backend,
+            'load_seconds': load_seconds,
+            'rss_delta_bytes': max(current_rss() - rss_before, 0),
+            'param_bytes': _param_bytes(model.model),
+        }
+        print(f"Loaded {name} in {load_seconds:.1f}s")
+        return model
+
+    def _load_onnx(self, spec):
+        import optimum.onnxruntime
+        from transformers import AutoTokenizer
+
+        model_class = getattr(optimum.onnxruntime, ONNX_MODEL_CLASSES[spec['task']])
+        export_dir = os.path.join(ONNX_CACHE_DIR, spec['model'].replace('/', '--'))
+        if os.path.isdir(export_dir):
+            model = model_class.from_pretrained(export_dir)
+        else:
+            print(f"Exporting {spec['model']} to ONNX in {export_dir}...")
+            model = model_class.from_pretrained(spec['model'], export=True)
+            model.save_pretrained(export_dir)
+        tokenizer = AutoTokenizer.from_pretrained(spec['model'])
+        return pipeline(spec['task'], model=model, tokenizer=tokenizer)
+
+    def warm_up(self, names=None):
+        """load the given models (all known models by default) ahead of first use"""
+        for name in names or self.specs:
+            self.get(name)
+        return self.stats()
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def stats(self):
+        """load time and memory footprint per model"""
+        report = {}
+        for name, spec in self.specs.items():
+            entry = {'model': spec['model'], 'backend': self.backend, 'loaded': name in self._models}
+            entry.update(self._stats.get(name, {}))
+            report[name] = entry
+        return report
+
+    def unload(self, name):
+        with self._lock:
+            self._models.pop(name, None)
+            self._stats.pop(name, None)
+
+
+def _param_bytes(model):
+    """bytes held in a model's parameters; quantized packed weights and ONNX sessions report 0"""
+    if not hasattr(model, 'parameters'):
+        return 0
+    return sum(p.numel() * p.element_size() for p in model.parameters())
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """return the registry shared by every service in this process"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load every model and report its load time and memory.")
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(backend=args.backend)
+    for name, entry in registry.warm_up().items():
+        print(f"{name}: {entry['model']} ({entry['backend']}) loaded in {entry['load_seconds']:.1f}s, "
+              f"RSS +{entry['rss_delta_bytes'] / 2**20:.0f} MiB, "
+              f"params {entry['param_bytes'] / 2**20:.0f} MiB")
@@ -0,0 +1,163 @@
+"""New-mail notification sources for the mail daemon.
+
+A source is anything with start(service), get(timeout) -> notification or None,
+report(new_messages) and close(). A notification is a dict with 'source',
+'received_at' (epoch seconds) and, for push deliveries, 'history_id'.
+"""
+import base64
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class PubSubPushSource:
+    """Receives Gmail push notifications from a Cloud Pub/Sub push subscription.
+
+    Runs a small HTTP server whose endpoint is registered as the subscription's push
+    URL; users().watch() points Gmail at the topic and is renewed before it expires
+    (Gmail drops a watch after 7 days). Pub/Sub may drop or delay deliveries, so a
+    fallback poll is emitted if nothing arrives for fallback_interval seconds.
+    """
+
+    def __init__(self, topic_name=None, host='0.0.0.0', port=8085, path='/gmail/push', verification_token=None,
+                 label_ids=('INBOX',), fallback_interval=1800, renew_margin=24 * 3600):
+        """Initialize with the Pub/Sub topic Gmail publishes to and the push endpoint to serve."""
+        self.topic_name = topic_name
+        self.host = host
+        self.port = port
+        self.path = path
+        self.verification_token = verification_token
+        self.label_ids = list(label_ids)
+        self.fallback_interval = fallback_interval
+        self.renew_margin = renew_margin
+        self.service = None
+        self.watch_expiration = None
+        self.received = 0
+        self.rejected = 0
+        self._queue = queue.Queue()
+        self._last_event = time.time()
+        self._server = None
+
+    def start(self, service):
+        self.service = service
+        self._renew_watch()
+        source = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                status = source.handle_push(self.path, self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                self.send_response(status)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass  # one line per delivery is too noisy for a daemon
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"Listening for Pub/Sub pushes on http://{self.host}:{self.port}{self.path}")
+
+    def handle_push(self, request_path, body):
+        """validate and enqueue one push delivery, returning the HTTP status to answer with"""
+        url = urlparse(request_path)
+        if url.path != self.path:
+            return 404
+        if self.verification_token and parse_qs(url.query).get('token', [None])[0] != self.verification_token:
+            self.rejected += 1
+            return 403
+        try:
+            envelope = json.loads(body)
+            data = json.loads(base64.b64decode(envelope['message']['data']))
+            notification = {'source': 'push', 'received_at': time.time(), 'history_id': int(data['historyId']),
+                            'email': data.get('emailAddress'), 'message_id': envelope['message'].get('messageId')}
+        except (ValueError, KeyError, TypeError) as e:
+            # A 2xx acks the message; malformed deliveries would otherwise be retried forever
+            print(f"Ignoring malformed push delivery: {e}")
+            self.rejected += 1
+            return 204
+        self.received += 1
+        self._queue.put(notification)
+        return 204
+
+    def _renew_watch(self):
+        if not self.topic_name or self.service is None:
+            return
+        if self.watch_expiration and time.time() < self.watch_expiration - self.renew_margin:
+            return
+        response = self.service.users().watch(userId='me', body={
+            'topicName': self.topic_name, 'labelIds': self.label_ids, 'labelFilterBehavior': 'include'}).execute()
+        self.watch_expiration = int(response['expiration']) / 1000
+        print(f"Gmail watch on {self.topic_name} active until {time.ctime(self.watch_expiration)}")
+
+    def get(self, timeout=None):
+        """next notification, or None if none arrived within timeout"""
+        self._renew_watch()
+        if time.time() - self._last_event >= self.fallback_interval:
+            self._last_event = time.time()
+            return {'source': 'fallback', 'received_at': self._last_event}
+        wait = self.fallback_interval - (time.time() - self._last_event)
+        try:
+            notification = self._queue.get(timeout=wait if timeout is None else min(timeout, wait))
+        except queue.Empty:
+            return None
+        self._last_event = time.time()
+        return notification
+
+    def report(self, new_messages):
+        pass
+
+    def close(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if self.topic_name and self.service is not None:
+            try:
+                self.service.users().stop(userId='me').execute()
+            except Exception as e:
+                print(f"Could not stop Gmail watch: {e}")
+
+
+class AdaptivePoller:
+    """Polls on a schedule that tightens while mail is arriving and relaxes when the mailbox is quiet.
+
+    The interval drops to min_interval whenever a poll finds new messages and grows
+    by backoff after each empty poll, up to max_interval.
+    """
+
+    def __init__(self, min_interval=15, max_interval=300, backoff=2.0):
+        """Initialize with the poll interval bounds in seconds and the growth factor."""
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.polls = 0
+        self._next_poll = 0.0
+
+    def start(self, service):
+        self._next_poll = time.time()
+
+    def get(self, timeout=None):
+        wait = self._next_poll - time.time()
+        if timeout is not None and wait > timeout:
+            time.sleep(timeout)
+            return None
+        if wait > 0:
+            time.sleep(wait)
+        self.polls += 1
+        # One poll per interval: until report() reschedules it, further get() calls
+        # wait instead of handing out another poll (the daemon drains with timeout=0)
+        self._next_poll = time.time() + self.interval
+        return {'source': 'poll', 'received_at': time.time()}
+
+    def report(self, new_messages):
+        if new_messages:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        self._next_poll = time.time() + self.interval
+
+    def close(self):
+        pass
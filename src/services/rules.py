@@ -0,0 +1,287 @@
+"""Sender and keyword policies (important mail, safe senders) compiled from rules.json.
+
+rules.json maps a policy name to its rules; an email matches a policy when any
+rule matches:
+
+    {
+      "important": {
+        "sender_domains": ["indeed.com", "linkedin.com"],
+        "subject_keywords": ["urgent", "action required"],
+        "headers": [{"field": "labels", "contains": "IMPORTANT"},
+                    {"field": "recipient", "regex": "^team-.*@example\\\\.com"}]
+      },
+      "safe_senders": {"senders": ["boss@example.com"]}
+    }
+
+Addresses are parsed out of the From header ("Name <addr>"), so senders match
+exactly and sender_domains match the domain and its subdomains. Keywords match
+case-insensitively as substrings. Policies missing from the file keep their
+defaults, and the file is re-read when it changes.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from email.utils import parseaddr
+from functools import lru_cache
+
+try:
+    import ahocorasick  # pyahocorasick: one automaton pass regardless of the number of keywords
+except ImportError:
+    ahocorasick = None
+
+RULES_PATH = os.getenv('RULES_PATH', 'rules.json')
+DEFAULT_RULES = {
+    'important': {
+        'sender_domains': ['indeed.com', 'linkedin.com'],
+        'subject_keywords': ['urgent', 'important', 'meeting', 'deadline', 'action required'],
+    },
+    'safe_senders': {
+        'senders': ['ajithpspk123@gmail.com'],
+    },
+}
+# Stored email columns header predicates can test
+FIELDS = ('sender', 'recipient', 'subject', 'labels')
+
+
+@lru_cache(maxsize=65536)
+def parse_sender(header):
+    """(address, domain) of a From header, lowercased"""
+    address = parseaddr(header or '')[1].lower()
+    return address, address.rpartition('@')[2]
+
+
+def _trie_pattern(keywords):
+    """regex matching any keyword, factored into a prefix trie.
+
+    A flat alternation makes re try every keyword at every position; the trie
+    shares common prefixes. Only whether some keyword occurs matters, so a keyword
+    that another one starts with (e.g. 'meet' and 'meeting') ends its branch.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def emit(node):
+        if '' in node:
+            return ''
+        alternatives = [re.escape(char) + emit(child) for char, child in sorted(node.items())]
+        return alternatives[0] if len(alternatives) == 1 else f"(?:{'|'.join(alternatives)})"
+    return re.compile(emit(trie))
+
+
+def _keyword_matcher(keywords):
+    """callable(lowercased text) -> bool, true when any keyword occurs in the text"""
+    keywords = sorted({k.lower() for k in keywords if k})
+    if not keywords:
+        return None
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for keyword in keywords:
+            automaton.add_word(keyword, keyword)
+        automaton.make_automaton()
+        return lambda text: next(automaton.iter(text), None) is not None
+    pattern = _trie_pattern(keywords)
+    return lambda text: pattern.search(text) is not None
+
+
+class CompiledPolicy:
+    """One policy's rules: address sets plus one combined matcher per field."""
+
+    def __init__(self, name, spec):
+        """Initialize from a policy spec (senders, sender_domains, subject_keywords, headers)."""
+        self.name = name
+        self.senders = frozenset(parse_sender(s)[0] for s in spec.get('senders', []))
+        self.domains = frozenset(d.lower().lstrip('@') for d in spec.get('sender_domains', []))
+        contains = {field: [] for field in FIELDS}
+        contains['subject'].extend(spec.get('subject_keywords', []))
+        patterns = {field: [] for field in FIELDS}
+        for predicate in spec.get('headers', []):
+            field = predicate['field']
+            if field not in FIELDS:
+                raise ValueError(f"Unknown header field '{field}' in policy '{name}'. "
+                                 f"Known fields: {', '.join(FIELDS)}")
+            if 'contains' in predicate:
+                contains[field].append(predicate['contains'])
+            else:
+                patterns[field].append(f"(?:{predicate['regex']})")
+        self.matchers = []
+        for field in FIELDS:
+            matcher = _keyword_matcher(contains[field])
+            if matcher:
+                self.matchers.append((FIELDS.index(field), matcher))
+            if patterns[field]:
+                regex = re.compile('|'.join(patterns[field]), re.IGNORECASE)
+                self.matchers.append((FIELDS.index(field), lambda text, regex=regex: regex.search(text) is not None))
+
+    def _sender_matches(self, sender):
+        if not self.senders and not self.domains:
+            return False
+        address, domain = parse_sender(sender)
+        if address in self.senders:
+            return True
+        while domain:
+            if domain in self.domains:
+                return True
+            domain = domain.partition('.')[2]
+        return False
+
+    def match_row(self, row):
+        """row holds the FIELDS values in order (sender, recipient, subject, labels)"""
+        if self._sender_matches(row[0]):
+            return True
+        return any(matcher((row[index] or '').lower()) for index, matcher in self.matchers)
+
+    def matches(self, email):
+        """email dict with FIELDS values; labels may be a list (as parsed) or comma-joined (as stored)"""
+        row = tuple(email.get(field) for field in FIELDS)
+        return self.match_row(tuple(','.join(value) if isinstance(value, (list, tuple)) else value for value in row))
+
+
+def _check_spec(name, spec):
+    """raise ValueError unless spec has the shape CompiledPolicy expects"""
+    if not isinstance(spec, dict):
+        raise ValueError(f"Policy '{name}' must be an object, got {type(spec).__name__}")
+    for key in ('senders', 'sender_domains', 'subject_keywords'):
+        values = spec.get(key, [])
+        if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+            raise ValueError(f"'{key}' in policy '{name}' must be a list of strings")
+    headers = spec.get('headers', [])
+    if not isinstance(headers, list):
+        raise ValueError(f"'headers' in policy '{name}' must be a list")
+    for predicate in headers:
+        if not isinstance(predicate, dict) or not isinstance(predicate.get('field'), str) \
+                or not isinstance(predicate.get('contains', predicate.get('regex')), str):
+            raise ValueError(f"Header predicates in policy '{name}' need a 'field' and a 'contains' or 'regex' string")
+
+
+def compile_rules(rules):
+    """{name: CompiledPolicy} for the default policies overridden by rules"""
+    if rules is not None and not isinstance(rules, dict):
+        raise ValueError(f"Rules must be an object of policies, got {type(rules).__name__}")
+    merged = dict(DEFAULT_RULES)
+    merged.update(rules or {})
+    for name, spec in merged.items():
+        _check_spec(name, spec)
+    return {name: CompiledPolicy(name, spec) for name, spec in merged.items()}
+
+
+class RuleEngine:
+    """Policies loaded from a JSON file and recompiled whenever the file changes.
+
+    The file's mtime is checked at most every check_interval seconds, so editing
+    rules.json takes effect in a running daemon without a restart. A file that
+    fails to load leaves the previous rules in place.
+    """
+
+    def __init__(self, path=RULES_PATH, check_interval=1.0):
+        """Initialize with the rules file (defaults apply when it does not exist)."""
+        self.path = path
+        self.check_interval = check_interval
+        self.version = 0
+        self._policies = compile_rules(None)
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """re-read the rules file if it changed; returns True when new rules were compiled"""
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return False
+            try:
+                rules = None
+                if mtime is not None:
+                    with open(self.path) as f:
+                        rules = json.load(f)
+                policies = compile_rules(rules)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError, re.error) as e:
+                print(f"Keeping previous rules; could not load {self.path}: {e}")
+                self._mtime = mtime
+                return False
+            self._policies = policies
+            self._mtime = mtime
+            self.version += 1
+            if mtime is not None:
+                print(f"Loaded rules from {self.path}: {', '.join(policies)}")
+            return True
+
+    def policy(self, name):
+        if time.monotonic() - self._checked >= self.check_interval:
+            self.reload()
+        return self._policies[name]
+
+    def matches(self, name, email):
+        """whether an email dict (sender, subject, and optionally recipient, labels) matches policy name"""
+        return self.policy(name).matches(email)
+
+    def is_important(self, email):
+        return self.matches('important', email)
+
+    def is_safe_sender(self, sender):
+        return self.matches('safe_senders', {'sender': sender})
+
+    def classify_cursor(self, name, cursor, batch_size=10000):
+        """yield the ids of rows (id, sender, recipient, subject, labels) matching policy name"""
+        policy = self.policy(name)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                if policy.match_row(row[1:]):
+                    yield row[0]
+
+    def classify_db(self, conn, name, batch_size=10000):
+        """ids of all stored emails matching policy name"""
+        cursor = conn.execute(f"SELECT id, {', '.join(FIELDS)} FROM emails")
+        return list(self.classify_cursor(name, cursor, batch_size))
+
+
+_rules = None
+_rules_lock = threading.Lock()
+
+
+def get_rules():
+    """return the rule engine shared by every service in this process"""
+    global _rules
+    if _rules is None:
+        with _rules_lock:
+            if _rules is None:
+                _rules = RuleEngine()
+    return _rules
+
+
+if __name__ == '__main__':
+    from utils.db_utils import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Classify stored emails with a policy from the rules file.")
+    parser.add_argument('--rules', default=RULES_PATH)
+    parser.add_argument('--db', default='emails.db')
+    parser.add_argument('--policy', default='important')
+    parser.add_argument('--init', action='store_true', help="write the default rules to --rules and exit")
+    args = parser.parse_args()
+
+    if args.init:
+        with open(args.rules, 'w') as f:
+            json.dump(DEFAULT_RULES, f, indent=2)
+        print(f"Wrote default rules to {args.rules}")
+    else:
+        engine = RuleEngine(args.rules)
+        conn = get_db_connection(args.db)
+        started = time.perf_counter()
+        matched = engine.classify_db(conn, args.policy)
+        total = conn.execute("SELECT COUNT(*) FROM emails").fetchone()[0]
+        print(f"{len(matched)} of {total} emails match '{args.policy}' ({time.perf_counter() - started:.2f}s)")
+        conn.close()
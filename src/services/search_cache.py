@@ -0,0 +1,139 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+DEFAULT_TTL = 24 * 3600
+# Reply/forward prefixes in several languages; "Re: Re: Fwd: X" and "X" are the same search
+SUBJECT_PREFIX_RE = re.compile(r"^\s*((re|fwd?|aw|sv|wg|tr|rv|antw)\s*(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+NON_WORD_RE = re.compile(r"[\W_]+")
+
+
+class QuotaExceededError(Exception):
+    """Raised when the daily request quota of an API has been used up."""
+
+
+def normalize_query(query):
+    """lowercase, without reply/forward prefixes, punctuation or repeated whitespace"""
+    query = SUBJECT_PREFIX_RE.sub('', query or '')
+    return NON_WORD_RE.sub(' ', query.lower()).strip()
+
+
+class SearchCache:
+    """TTL cache of web search results in emails.db, keyed by normalized query."""
+
+    def __init__(self, conn, ttl=DEFAULT_TTL, max_entries=10000):
+        """Initialize with a connection from get_db_connection, the result lifetime in seconds and a size bound."""
+        self.conn = conn
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def make_key(query, num_results):
+        return hashlib.sha256(f"{num_results}\0{normalize_query(query)}".encode()).hexdigest()
+
+    def get(self, key):
+        """cached results for key, or None when missing or expired"""
+        now = time.time()
+        row = self.conn.execute("SELECT results, expires_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= now:
+            self.misses += 1
+            self.expired += row is not None
+            return None
+        self.conn.execute("UPDATE search_cache SET last_used = ? WHERE key = ?", (now, key))
+        self.conn.commit()
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, query, results):
+        now = time.time()
+        self.conn.execute('''INSERT INTO search_cache (key, query, results, created_at, expires_at, last_used)
+                             VALUES (?, ?, ?, ?, ?, ?)
+                             ON CONFLICT(key) DO UPDATE SET results = excluded.results,
+                                 created_at = excluded.created_at, expires_at = excluded.expires_at,
+                                 last_used = excluded.last_used''',
+                          (key, normalize_query(query), json.dumps(results), now, now + self.ttl, now))
+        self._evict(now)
+        self.conn.commit()
+
+    def _evict(self, now):
+        c = self.conn.cursor()
+        c.execute("DELETE FROM search_cache WHERE expires_at <= ?", (now,))
+        excess = c.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            c.execute('''DELETE FROM search_cache WHERE key IN (
+                             SELECT key FROM search_cache ORDER BY last_used LIMIT ?)''', (excess,))
+
+    def clear(self):
+        self.conn.execute("DELETE FROM search_cache")
+        self.conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': self.conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0],
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class RateLimiter:
+    """Token bucket for request rate plus a daily request quota counted in the api_usage table.
+
+    The daily count lives in the database, so restarts and other processes
+    sharing emails.db draw from the same quota. Days are counted in UTC.
+    """
+
+    def __init__(self, conn, api, rate=1.0, burst=1, daily_quota=None, db_lock=None):
+        """Initialize with requests per second, the bucket size and an optional requests-per-day limit.
+
+        db_lock guards conn when the caller shares it between threads.
+        """
+        self.conn = conn
+        self.db_lock = db_lock or threading.Lock()
+        self.api = api
+        self.rate = rate
+        self.burst = burst
+        self.daily_quota = daily_quota
+        self.waited = 0.0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+    def used_today(self):
+        with self.db_lock:
+            row = self.conn.execute("SELECT requests FROM api_usage WHERE api = ? AND day = ?",
+                                    (self.api, self._today())).fetchone()
+        return row[0] if row else 0
+
+    def acquire(self):
+        """block until a request may be made and count it; raises QuotaExceededError when the day's quota is spent"""
+        with self._lock:
+            if self.daily_quota is not None and self.used_today() >= self.daily_quota:
+                raise QuotaExceededError(f"{self.api}: daily quota of {self.daily_quota} requests used")
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                delay = (1 - self._tokens) / self.rate
+                self.waited += delay
+                time.sleep(delay)
+            with self.db_lock:
+                self.conn.execute('''INSERT INTO api_usage (api, day, requests) VALUES (?, ?, 1)
+                                     ON CONFLICT(api, day) DO UPDATE SET requests = requests + 1''',
+                                  (self.api, self._today()))
+                self.conn.commit()
@@ -1,9 +1,11 @@
 import os
-import sqlite3
 from dotenv import load_dotenv
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
-from email_analyzer import EmailAnalyzer
+from services.email_analyzer import EmailAnalyzer
+from services.rules import get_rules
+from services.slack_outbox import DIGEST_WINDOW, SlackOutbox, build_message
+from utils.db_utils import ANALYSIS_BODY_SQL, get_db_connection
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,43 +13,58 @@ load_dotenv()
 class SlackNotifier:
     """Class to send email notifications to Slack."""
 
-    def __init__(self, db_path='emails.db', channel='#general'):
-        """initialize the database and Slack client"""
+    def __init__(self, db_path='emails.db', channel='#general', analyzer=None, client=None,
+                 digest_window=DIGEST_WINDOW, rules=None):
+        """initialize the database and Slack client.
+
+        Notifications go through a background outbox that merges those arriving within
+        digest_window seconds into one digest per channel; digest_window=None posts
+        each one synchronously instead. The outbox is in memory, so notifications
+        still queued when the process dies are lost, and close() drops (and logs)
+        what it cannot post within slack_outbox.CLOSE_TIMEOUT.
+        """
         print("Initializing SlackNotifier...")
-        self.conn = sqlite3.connect(db_path)
-        self.slack_token = os.getenv('SLACK_BOT_TOKEN')
-        if not self.slack_token:
-            raise ValueError("Slack Bot Token must be set in environment variables.")
-        self.client = WebClient(token=self.slack_token)
+        self.conn = get_db_connection(db_path)
+        if client is None:
+            self.slack_token = os.getenv('SLACK_BOT_TOKEN')
+            if not self.slack_token:
+                raise ValueError("Slack Bot Token must be set in environment variables.")
+            client = WebClient(token=self.slack_token)
+        self.client = client
         self.channel = channel
-        self.email_analyzer = EmailAnalyzer(db_path=db_path)
+        self.analyzer = analyzer or EmailAnalyzer(db_path=db_path)
+        # Important senders and keywords come from rules.json (see services.rules)
+        self.rules = rules or get_rules()
+        self.outbox = SlackOutbox(self.client, window=digest_window) if digest_window is not None else None
 
     def get_email_details(self, email_id):
         """retrieve email details from the database"""
         c = self.conn.cursor()
-        c.execute("SELECT sender, subject, body FROM emails WHERE id= ?", (email_id,))
+        c.execute(f"SELECT sender, subject, {ANALYSIS_BODY_SQL}, thread_id, recipient, labels FROM emails WHERE id= ?",
+                  (email_id,))
         result = c.fetchone()
         if result:
             return {
                 'sender': result[0],
                 'subject': result[1],
-                'body': result[2]
+                'body': result[2],
+                'thread_id': result[3],
+                # rules.json policies can test these too
+                'recipient': result[4],
+                'labels': result[5]
             }
         print(f"Email with ID {email_id} not found in the database.")
         return None
     
     def is_important(self, email):
         """check if the email is important"""
-        important_senders = ['@indeed.com', '@linkedin.com']
-        important_keywords = ['urgent', 'important', 'meeting', 'deadline', 'action required']
-        
-        sender = email['sender'].lower()
-        subject = email['subject'].lower()
-
-        return any(s in sender for s in important_senders) or any(k in subject for k in important_keywords)
+        return self.rules.is_important(email)
     
     def send_slack_message(self, email_id):
-        """send a slack message with email details"""
+        """send a slack message with email details
+
+        With an outbox, True means the notification was queued, not yet posted.
+        """
         email = self.get_email_details(email_id)
         if not email:
             return False
@@ -57,33 +74,42 @@ class SlackNotifier:
             print(f"Email {email_id} not deemed important. skipping slack notification.")
             return False
         
-        # get summary and intent from emailanalyzer
-        summary = self.analyzer.summarize_thread(email_id)
-        intent = self.analyzer.infer_intent(email_id)
-
-        # construct the message
-        message = (
-            f"New Important Email Received!\n"
-            f"From: {email['sender']}\n"
-            f"Subject: {email['subject']}\n"
-            f"Summary: {summary}\n"
-            f"Intent: {intent}\n"
-            f"Body: {email['body'][:200]}..."
-        )
+        # A notification joining a pending digest is listed without a summary, so a burst costs one summary
+        detailed = self.outbox is None or not self.outbox.pending(self.channel)
+        notification = {
+            'email_id': email_id,
+            'sender': email['sender'],
+            'subject': email['subject'],
+            'summary': self.analyzer.summarize_thread(email['thread_id']) if detailed else None,
+            'intent': self.analyzer.infer_intent(email_id) if detailed else None,
+            'body': email['body'],
+        }
+        if self.outbox:
+            self.outbox.enqueue(self.channel, notification)
+            print(f"Queued Slack notification for email {email_id} ({self.outbox.pending(self.channel)} pending)")
+            return True
 
+        text, blocks = build_message([notification])
         try:
             response = self.client.chat_postMessage(
                 channel=self.channel,
-                text=message
+                text=text,
+                blocks=blocks
             )
             print(f"Message sent to Slack channel {self.channel} for email {email_id}")
             return True
         except SlackApiError as e:
             print(f"Error sending message to Slack: {e.response['error']}")
             return False
+
+    def stats(self):
+        """outbox counters and queue delay (empty without an outbox)"""
+        return self.outbox.stats() if self.outbox else {}
         
     def close(self):
-        """close the database connection"""
+        """flush queued notifications and close the database connection"""
+        if self.outbox:
+            self.outbox.close()
         self.conn.close()
         print("SlackNotifier closed.")
 
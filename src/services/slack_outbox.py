@@ -0,0 +1,229 @@
+import random
+import threading
+import time
+from collections import deque
+from slack_sdk.errors import SlackApiError
+from utils.latency import LatencyTracker
+
+# Seconds a channel's first queued notification waits for others to join its digest
+DIGEST_WINDOW = 30.0
+# Block Kit allows 50 blocks per message: one header plus one section per notification
+MAX_DIGEST_ITEMS = 40
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Seconds close() keeps posting before it abandons what is still queued
+CLOSE_TIMEOUT = 60.0
+
+
+def _escape(text):
+    """escape the characters Slack's mrkdwn treats as markup"""
+    return (text or '').replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def notification_text(notification):
+    """plain-text rendering of one notification (also the fallback text of its message)"""
+    lines = ["New Important Email Received!",
+             f"From: {notification['sender']}",
+             f"Subject: {notification['subject']}"]
+    if notification.get('summary'):
+        lines.append(f"Summary: {notification['summary']}")
+    if notification.get('intent'):
+        lines.append(f"Intent: {notification['intent']}")
+    lines.append(f"Body: {(notification.get('body') or '')[:200]}...")
+    return '\n'.join(lines)
+
+
+def build_message(batch):
+    """(text, blocks) for one notification or a digest of several"""
+    if len(batch) == 1:
+        text = notification_text(batch[0])
+        return text, [{'type': 'section', 'text': {'type': 'mrkdwn', 'text': _escape(text)[:3000]}}]
+    text = f"{len(batch)} new important emails"
+    blocks = [{'type': 'header', 'text': {'type': 'plain_text', 'text': text}}]
+    for notification in batch:
+        lines = [f"*{_escape(notification['subject'])}*", f"From: {_escape(notification['sender'])}"]
+        if notification.get('summary'):
+            lines.append(_escape(notification['summary']))
+        else:
+            lines.append(_escape((notification.get('body') or '')[:200]))
+        blocks.append({'type': 'section', 'text': {'type': 'mrkdwn', 'text': '\n'.join(lines)[:3000]}})
+    return text, blocks
+
+
+class SlackOutbox:
+    """Background sender that coalesces notifications per channel into time-windowed digests.
+
+    enqueue() returns immediately. A channel is flushed once its oldest notification
+    has waited `window` seconds or max_items are queued: one notification is posted
+    as is, several as a single Block Kit digest. A 429 pauses the channel for its
+    Retry-After (up to max_rate_limited times in a row per batch); other failures
+    retry with exponential backoff up to max_retries.
+
+    The queue is in memory: whatever is queued when the process dies is lost.
+    close() flushes what is left for at most its timeout, then drops the rest
+    and logs the email ids it dropped.
+    """
+
+    def __init__(self, client, window=DIGEST_WINDOW, max_items=MAX_DIGEST_ITEMS, max_retries=5, backoff=1.0,
+                 max_rate_limited=10):
+        """Initialize with a slack_sdk WebClient (or a fake) and start the sender thread."""
+        self.client = client
+        self.window = window
+        self.max_items = max_items
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_rate_limited = max_rate_limited
+        self.counters = {'notifications': 0, 'messages_posted': 0, 'digests': 0, 'coalesced': 0,
+                         'rate_limited': 0, 'retries': 0, 'dropped': 0}
+        self.queue_delay = LatencyTracker()
+        self._queues = {}  # channel -> deque of notifications
+        self._not_before = {}  # channel -> time before which nothing is posted (Retry-After / backoff)
+        self._attempts = {}  # channel -> failed attempts of the batch at its head
+        self._rate_limited = {}  # channel -> consecutive 429s for the batch at its head
+        self._cond = threading.Condition()
+        self._closed = False
+        self._abandoned = False
+        self._thread = threading.Thread(target=self._run, name='slack-outbox', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, channel, notification):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("SlackOutbox is closed")
+            self._queues.setdefault(channel, deque()).append(dict(notification, enqueued_at=time.time()))
+            self.counters['notifications'] += 1
+            self._cond.notify()
+
+    def pending(self, channel=None):
+        """notifications waiting to be posted (to channel, or to any channel)"""
+        with self._cond:
+            if channel is not None:
+                return len(self._queues.get(channel, ()))
+            return sum(len(queue) for queue in self._queues.values())
+
+    def _next_batch(self, now):
+        """(channel, batch) ready to post, or (None, seconds until one may be)"""
+        wait = None
+        for channel, queue in self._queues.items():
+            if not queue:
+                continue
+            ready_at = self._not_before.get(channel, 0)
+            if not self._closed and len(queue) < self.max_items:
+                ready_at = max(ready_at, queue[0]['enqueued_at'] + self.window)
+            if ready_at <= now:
+                batch = [queue.popleft() for _ in range(min(len(queue), self.max_items))]
+                return channel, batch
+            wait = ready_at - now if wait is None else min(wait, ready_at - now)
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    channel, ready = self._next_batch(time.time())
+                    if channel is not None:
+                        break
+                    if self._closed and not any(self._queues.values()):
+                        return
+                    self._cond.wait(ready)
+            self._post(channel, ready)
+
+    def _post(self, channel, batch):
+        text, blocks = build_message(batch)
+        try:
+            self.client.chat_postMessage(channel=channel, text=text, blocks=blocks)
+        except SlackApiError as e:
+            status = getattr(e.response, 'status_code', None)
+            if status == 429:
+                retry_after = float(e.response.headers.get('Retry-After', 1))
+                print(f"Slack rate limited {channel}, retrying in {retry_after:g}s")
+                self._requeue(channel, batch, retry_after, rate_limited=True)
+            elif status in RETRYABLE_STATUSES:
+                self._requeue(channel, batch, None)
+            else:
+                print(f"Error sending message to Slack: {e.response['error']}")
+                self._drop(channel, batch, f"error {e.response['error']}")
+            return
+        except Exception as e:
+            # Connection errors and the like
+            print(f"Error sending message to Slack: {e}")
+            self._requeue(channel, batch, None)
+            return
+
+        now = time.time()
+        with self._cond:
+            self._attempts.pop(channel, None)
+            self._rate_limited.pop(channel, None)
+            self.counters['messages_posted'] += 1
+            if len(batch) > 1:
+                self.counters['digests'] += 1
+                self.counters['coalesced'] += len(batch) - 1
+        for notification in batch:
+            self.queue_delay.add(now - notification['enqueued_at'])
+        print(f"Message sent to Slack channel {channel} ({len(batch)} notification(s))")
+
+    def _requeue(self, channel, batch, delay, rate_limited=False):
+        """put batch back at the head of its channel; delay None means exponential backoff"""
+        with self._cond:
+            if self._abandoned:
+                self._log_dropped(channel, batch, "the outbox was closed")
+                return
+            if rate_limited:
+                # Waiting out Retry-After is expected, so it has its own (larger) limit rather than max_retries
+                self.counters['rate_limited'] += 1
+                limited = self._rate_limited.get(channel, 0) + 1
+                if limited > self.max_rate_limited:
+                    self._drop(channel, batch, f"{self.max_rate_limited} rate limits in a row")
+                    return
+                self._rate_limited[channel] = limited
+            else:
+                attempts = self._attempts.get(channel, 0) + 1
+                if attempts > self.max_retries:
+                    self._drop(channel, batch, f"{self.max_retries} retries")
+                    return
+                self._attempts[channel] = attempts
+                delay = self.backoff * (2 ** (attempts - 1)) + random.uniform(0, self.backoff)
+            self.counters['retries'] += 1
+            self._queues[channel].extendleft(reversed(batch))
+            self._not_before[channel] = time.time() + delay
+            self._cond.notify()
+
+    def _drop(self, channel, batch, reason):
+        """give up on the batch at the head of channel, logging its email ids"""
+        with self._cond:
+            self._attempts.pop(channel, None)
+            self._rate_limited.pop(channel, None)
+            self._log_dropped(channel, batch, reason)
+
+    def _log_dropped(self, channel, batch, reason):
+        """count and report notifications given up on; caller holds the lock"""
+        self.counters['dropped'] += len(batch)
+        email_ids = ', '.join(str(notification.get('email_id')) for notification in batch)
+        print(f"Giving up on {len(batch)} Slack notification(s) for {channel} after {reason}: {email_ids}")
+
+    def stats(self):
+        with self._cond:
+            report = dict(self.counters)
+            report['pending'] = sum(len(queue) for queue in self._queues.values())
+        report['queue_delay'] = self.queue_delay.as_dict()
+        return report
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """post everything still queued (ignoring the digest window) and stop the sender
+
+        Waits at most timeout seconds (None waits for as long as it takes); what has
+        not been posted by then is dropped and its email ids are logged.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            return
+        with self._cond:
+            # A post still in flight finishes; if it fails, _requeue drops it
+            self._abandoned = True
+            for channel, queue in self._queues.items():
+                if queue:
+                    self._log_dropped(channel, list(queue), f"waiting {timeout:g}s to close")
+                    queue.clear()
+            self._cond.notify()
@@ -0,0 +1,145 @@
+import re
+import threading
+import time
+
+# Cheap signals, compiled once. Word boundaries matter: the old substring check for 'on'/'at' matched nearly every email.
+SCHEDULING_RE = re.compile(
+    r"\b(meet(ing)?s?|call|schedul\w*|reschedul\w*|appointment|calendar|invite|invitation|sync|catch up|"
+    r"availab\w*|interview|demo|webinar|standup|stand-up|1:1|one-on-one|zoom|teams|google meet|"
+    r"lunch|dinner|coffee|breakfast)\b",
+    re.IGNORECASE)
+WHEN_RE = re.compile(
+    r"\b(mon|tues|wednes|thurs|fri|satur|sun)day\b|\b(today|tomorrow|tonight|next week|this week)\b|"
+    r"\b\d{1,2}(:\d{2})?\s*([ap]\.?m\.?)\b|\b\d{1,2}:\d{2}\b|"
+    r"\b\d{1,2}(st|nd|rd|th)?\s+(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\b|"
+    r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+\d{1,2}(st|nd|rd|th)?\b",
+    re.IGNORECASE)
+BULK_SENDER_RE = re.compile(
+    r"\b(no-?reply|do-?not-?reply|mailer-daemon|notifications?|newsletter|digest|updates|alerts?|marketing)\b",
+    re.IGNORECASE)
+BULK_BODY_RE = re.compile(r"\bunsubscribe\b|\bview (this email )?in (your )?browser\b|\bmanage (your )?preferences\b",
+                          re.IGNORECASE)
+REQUEST_RE = re.compile(
+    r"\b(could|can|would|will) you\b|\b(can|could|shall) we\b|"
+    r"\bplease (send|confirm|let me know|review|share|reply|advise|call)\b|\blet me know\b|\bare you (free|available)\b|\bget back to me\b",
+    re.IGNORECASE)
+
+
+def _is_bulk(email):
+    return bool(BULK_SENDER_RE.search(email['sender'] or '') or BULK_BODY_RE.search(email['body'] or ''))
+
+
+class Cascade:
+    """Decision stages run cheapest first; the first stage returning True or False decides.
+
+    A stage is a callable taking the email dict (sender, subject, body) and
+    returning True, False or None (undecided). Emails no stage resolves get the
+    default. Each stage counts how many emails it saw, how many it resolved
+    (and how many of those positively) and the time it spent.
+    """
+
+    def __init__(self, stages, default=False):
+        """Initialize with (name, stage) pairs in order; stages given as None are skipped."""
+        self.stages = [(name, stage) for name, stage in stages if stage is not None]
+        self.default = default
+        self.counters = {name: {'seen': 0, 'resolved': 0, 'positive': 0, 'seconds': 0.0} for name, _ in self.stages}
+        self.unresolved = 0
+        self._lock = threading.Lock()
+
+    def decide(self, email):
+        for name, stage in self.stages:
+            started = time.perf_counter()
+            decision = stage(email)
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                counters = self.counters[name]
+                counters['seen'] += 1
+                counters['seconds'] += elapsed
+                if decision is not None:
+                    counters['resolved'] += 1
+                    counters['positive'] += bool(decision)
+            if decision is not None:
+                return bool(decision)
+        with self._lock:
+            self.unresolved += 1
+        return self.default
+
+    def stats(self):
+        """per-stage counters plus the share of all decided emails each stage resolved"""
+        with self._lock:
+            report = {name: dict(counters) for name, counters in self.counters.items()}
+            unresolved = self.unresolved
+        total = sum(counters['resolved'] for counters in report.values()) + unresolved
+        for counters in report.values():
+            counters['share'] = counters['resolved'] / total if total else 0.0
+        report['unresolved'] = unresolved
+        return report
+
+
+def probability_stage(model, low=0.2, high=0.8):
+    """stage from a small model (text -> probability of yes) that only decides when it is confident"""
+    def stage(email):
+        probability = model(f"{email['subject'] or ''}\n{email['body'] or ''}")
+        if probability >= high:
+            return True
+        if probability <= low:
+            return False
+        return None
+    return stage
+
+
+def scheduling_rules(email):
+    """bulk mail, or neither scheduling vocabulary nor a question: no; a scheduling word plus a day/time: yes"""
+    text = f"{email['subject'] or ''}\n{email['body'] or ''}"
+    if _is_bulk(email):
+        return False
+    topic = SCHEDULING_RE.search(text)
+    when = WHEN_RE.search(text)
+    if topic and when:
+        return True
+    if not topic and not (when and REQUEST_RE.search(text)):
+        # A bare date ("due 28 October") is not a meeting unless someone is asking about it
+        return False
+    return None
+
+
+def scheduling_cascade(analyzer, small_model=None):
+    """keyword rules, then an optional small model, then the summarizer for what is left
+
+    The summarizer stage summarizes the body and looks for scheduling vocabulary
+    in the summary, i.e. whether the meeting is what the email is about.
+    """
+    def summarizer_stage(email):
+        if not email['body']:
+            return False
+        summary = analyzer.summarize_text(email['body'], max_length=100, min_length=30)
+        return bool(SCHEDULING_RE.search(summary or ''))
+
+    return Cascade([
+        ('rules', scheduling_rules),
+        ('small_model', probability_stage(small_model) if small_model else None),
+        ('summarizer', summarizer_stage),
+    ])
+
+
+def reply_rules(email):
+    """bulk mail: no; a meeting or a direct request: yes"""
+    if _is_bulk(email):
+        return False
+    body = email['body'] or ''
+    if 'meeting' in body.lower() or REQUEST_RE.search(body):
+        return True
+    return None
+
+
+def reply_cascade(small_model=None):
+    """keyword rules, then an optional small model; emails neither resolves get no reply
+
+    There is no classifier stage: the intent classifier is a sentiment model
+    (POSITIVE/NEGATIVE), so its label says nothing about whether the email asks
+    for something, and the request check it used to back never matched.
+    """
+    return Cascade([
+        ('rules', reply_rules),
+        ('small_model', probability_stage(small_model) if small_model else None),
+    ])
@@ -1,43 +1,106 @@
-import sqlite3
 import os
+import threading
+from concurrent.futures import Future
 from googleapiclient.discovery import build
-from gmail_auth import GmailAuthenticator
 from dotenv import load_dotenv
+from services.search_cache import DEFAULT_TTL, QuotaExceededError, RateLimiter, SearchCache
+from utils.db_utils import get_db_connection
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Custom Search allows 100 free queries a day; raise SEARCH_DAILY_QUOTA for paid projects
+SEARCH_DAILY_QUOTA = int(os.getenv('SEARCH_DAILY_QUOTA', '100'))
+SEARCH_RATE = float(os.getenv('SEARCH_RATE', '1.0'))  # requests per second
+SEARCH_BURST = 5
+
 class WebSearchAssistant:
     """class to integrate web search for answering email queries."""
 
-    def __init__(self, db_path='emails.db'):
-        """initialize the database and google custom search credentials"""
+    def __init__(self, db_path='emails.db', authenticator=None, search_service=None, cache_ttl=DEFAULT_TTL,
+                 daily_quota=SEARCH_DAILY_QUOTA, rate=SEARCH_RATE):
+        """initialize the database and google custom search credentials (or a given search service)"""
         print("Initializing WebSearchAssistant...")
-        self.conn = sqlite3.connect(db_path)
-        self.service = GmailAuthenticator().get_service()
+        # Searches may run from several threads; they share this connection under _db_lock
+        self.conn = get_db_connection(db_path, check_same_thread=False)
+        self.service = authenticator.get_service() if authenticator else None
         self.api_key = os.getenv('GOOGLE_API_KEY')
         self.cx = os.getenv('GOOGLE_CX_ID')
 
-        print(f"API key loaded: {'yes' if self.api_key else 'no'}")
-        print(f"Custom Search Engine ID loaded: {'yes' if self.cx else 'no'}")
+        if search_service is None:
+            print(f"API key loaded: {'yes' if self.api_key else 'no'}")
+            print(f"Custom Search Engine ID loaded: {'yes' if self.cx else 'no'}")
+            if not self.api_key or not self.cx:
+                raise ValueError("Google API key and Custom Search Engine ID must be set in environment variables.")
+            # initialize the search service
+            search_service = build("customsearch", "v1", developerKey=self.api_key)
+        self.search_service = search_service
 
-        if not self.api_key or not self.cx:
-            raise ValueError("Google API key and Custom Search Engine ID must be set in environment variables.")
-        # initialize the search service
-        self.search_service = build("customsearch", "v1", developerKey=self.api_key)   
+        self._db_lock = threading.Lock()
+        self.cache = SearchCache(self.conn, ttl=cache_ttl)
+        self.limiter = RateLimiter(self.conn, 'customsearch', rate=rate, burst=SEARCH_BURST,
+                                   daily_quota=daily_quota, db_lock=self._db_lock)
+        # Identical queries already being fetched: key -> Future shared by every caller
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.api_calls = 0
+        self.coalesced = 0
+        self.quota_refusals = 0
 
     def get_email_content(self, email_id):
         """retreive email body from the database"""
-        c = self.conn.cursor()
-        c.execute("SELECT subject, body FROM emails WHERE ID=?", (email_id,))   
-        result = c.fetchone()
+        with self._db_lock:
+            c = self.conn.cursor()
+            c.execute("SELECT subject, body_text(body) FROM emails WHERE ID=?", (email_id,))
+            result = c.fetchone()
         if result:
             return {'subject': result[0], 'body': result[1]}
         print(f"Email with ID {email_id} not found in the database.")
         return None
 
     def search_web(self, query, num_results=3):
-        """perform a web search and return filtered results"""
+        """perform a web search and return filtered results.
+
+        Results are cached by normalized query, and concurrent identical queries
+        share one request. Returns [] once the daily quota is spent.
+        """
+        key = SearchCache.make_key(query, num_results)
+        with self._db_lock:
+            cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            results = self._fetch(query, num_results)
+            with self._db_lock:
+                self.cache.put(key, query, results)
+            future.set_result(results)
+            return results
+        except QuotaExceededError as e:
+            print(f"Skipping web search: {e}")
+            self.quota_refusals += 1
+            future.set_result([])
+            return []
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def _fetch(self, query, num_results):
+        self.limiter.acquire()
+        self.api_calls += 1
         print(f"Searching the web for query: {query}")
         response = self.search_service.cse().list(
             q=query,
@@ -53,7 +116,22 @@ class WebSearchAssistant:
                 'link': item['link']
             })
         return results
-    
+
+    def search_stats(self):
+        """cache hit rate, coalesced requests and the API quota they saved"""
+        with self._db_lock:
+            report = self.cache.stats()
+        used_today = self.limiter.used_today()
+        report.update({
+            'api_calls': self.api_calls,
+            'coalesced': self.coalesced,
+            'quota_refusals': self.quota_refusals,
+            'quota_saved': report['hits'] + self.coalesced,
+            'quota_used_today': used_today,
+            'daily_quota': self.limiter.daily_quota,
+        })
+        return report
+
     def process_email_query(self, email_id):
         """analyze email content and search the web if needed"""
         print(f"Processing email with ID: {email_id}")
@@ -0,0 +1,358 @@
+import argparse
+import os
+import socket
+import time
+import uuid
+from utils.db_utils import get_db_connection
+
+# Processing stages in order; a job's stage is the last one completed for that email
+STAGES = ['ingested', 'analyzed', 'notified', 'scheduled', 'drafted', 'sent']
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+SQL_CHUNK_SIZE = 500
+
+
+def next_stage(stage):
+    index = STAGES.index(stage)
+    return STAGES[index + 1] if index + 1 < len(STAGES) else None
+
+
+class WorkQueue:
+    """Persistent per-email processing state in the email_jobs table.
+
+    Workers claim jobs with a single atomic UPDATE ... RETURNING that takes a lease;
+    a job whose lease expires (its worker died) becomes claimable again. Completing
+    or failing a job is guarded by the lease owner, so a worker that lost its lease
+    cannot overwrite the state recorded by the worker that took over.
+    """
+
+    def __init__(self, conn, lease_seconds=300, max_attempts=5, backoff=30.0):
+        """Initialize with a connection from get_db_connection plus lease and retry settings."""
+        self.conn = conn
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+    def enqueue(self, email_ids, stage='ingested'):
+        """add jobs for emails not yet tracked; returns how many were added"""
+        now = time.time()
+        c = self.conn.cursor()
+        before = self.conn.total_changes
+        c.executemany('''INSERT INTO email_jobs (email_id, stage, status, created_at, updated_at)
+                         VALUES (?, ?, ?, ?, ?) ON CONFLICT(email_id) DO NOTHING''',
+                      [(email_id, stage, PENDING, now, now) for email_id in email_ids])
+        self.conn.commit()
+        return self.conn.total_changes - before
+
+    def claim(self, owner, limit=1, email_ids=None):
+        """lease up to limit runnable jobs (optionally only among email_ids) to owner"""
+        now = time.time()
+        where = '''((status = 'pending' AND next_attempt_at <= :now)
+                    OR (status = 'running' AND lease_expires < :now))'''
+        params = {'now': now, 'owner': owner, 'expires': now + self.lease_seconds, 'limit': limit}
+        if email_ids is not None:
+            email_ids = list(email_ids)[:SQL_CHUNK_SIZE]
+            where += f" AND email_id IN ({','.join(f':id{i}' for i in range(len(email_ids)))})"
+            params.update((f'id{i}', email_id) for i, email_id in enumerate(email_ids))
+        c = self.conn.cursor()
+        # One statement, so the select and the lease are atomic across processes
+        c.execute(f'''UPDATE email_jobs
+                      SET status = 'running', lease_owner = :owner, lease_expires = :expires,
+                          attempts = attempts + 1, updated_at = :now
+                      WHERE email_id IN (SELECT email_id FROM email_jobs WHERE {where}
+                                         ORDER BY next_attempt_at, created_at LIMIT :limit)
+                      RETURNING email_id, stage, attempts''', params)
+        jobs = [{'email_id': r[0], 'stage': r[1], 'attempts': r[2]} for r in c.fetchall()]
+        self.conn.commit()
+        return jobs
+
+    def renew(self, job, owner):
+        """extend the lease before a long step; False if the lease was lost"""
+        now = time.time()
+        c = self.conn.cursor()
+        c.execute('''UPDATE email_jobs SET lease_expires = ?, updated_at = ?
+                     WHERE email_id = ? AND status = 'running' AND lease_owner = ?''',
+                  (now + self.lease_seconds, now, job['email_id'], owner))
+        self.conn.commit()
+        return c.rowcount == 1
+
+    def advance(self, job, owner, stage, finished=False):
+        """record stage as completed; the job stays leased to owner for its next stage unless finished"""
+        now = time.time()
+        status = DONE if finished or next_stage(stage) is None else RUNNING
+        # Attempts count per stage; continuing under the current lease is the next stage's first attempt
+        attempts = 0 if status == DONE else 1
+        c = self.conn.cursor()
+        c.execute('''UPDATE email_jobs
+                     SET stage = ?, status = ?, attempts = ?, last_error = NULL,
+                         lease_owner = CASE WHEN ? = 'done' THEN NULL ELSE lease_owner END,
+                         lease_expires = ?, updated_at = ?
+                     WHERE email_id = ? AND status = 'running' AND lease_owner = ?''',
+                  (stage, status, attempts, status, now + self.lease_seconds, now, job['email_id'], owner))
+        self.conn.commit()
+        if c.rowcount == 1:
+            job['stage'] = stage
+            job['attempts'] = attempts
+        return c.rowcount == 1
+
+    def fail(self, job, owner, error):
+        """release a job after an error: retry later with backoff, or mark failed after max_attempts"""
+        now = time.time()
+        attempts = job['attempts']
+        status = FAILED if attempts >= self.max_attempts else PENDING
+        retry_at = now + self.backoff * (2 ** (attempts - 1))
+        c = self.conn.cursor()
+        c.execute('''UPDATE email_jobs
+                     SET status = ?, lease_owner = NULL, lease_expires = NULL, next_attempt_at = ?,
+                         last_error = ?, updated_at = ?
+                     WHERE email_id = ? AND status = 'running' AND lease_owner = ?''',
+                  (status, retry_at, str(error)[:1000], now, job['email_id'], owner))
+        self.conn.commit()
+        return status
+
+    def retry_failed(self):
+        """make failed jobs runnable again (with a fresh attempt count)"""
+        c = self.conn.cursor()
+        c.execute("UPDATE email_jobs SET status = 'pending', attempts = 0, next_attempt_at = 0 "
+                  "WHERE status = 'failed'")
+        self.conn.commit()
+        return c.rowcount
+
+    def state(self, email_id):
+        c = self.conn.cursor()
+        c.execute("SELECT stage, status, attempts, last_error FROM email_jobs WHERE email_id = ?", (email_id,))
+        row = c.fetchone()
+        return {'stage': row[0], 'status': row[1], 'attempts': row[2], 'last_error': row[3]} if row else None
+
+    def stats(self):
+        """job counts by status and by stage"""
+        c = self.conn.cursor()
+        c.execute("SELECT status, stage, COUNT(*) FROM email_jobs GROUP BY status, stage")
+        report = {'status': {}, 'stage': {}}
+        for status, stage, count in c.fetchall():
+            report['status'][status] = report['status'].get(status, 0) + count
+            report['stage'][stage] = report['stage'].get(stage, 0) + count
+        return report
+
+
+def build_handlers(conn, analyzer=None, notifier=None, scheduler=None, drafter=None, auto_send=False):
+    """stage -> callable(email_id) for the available components.
+
+    A handler returns False when its stage does not apply (no reply is warranted, the
+    sender is not safe to auto-send to); the job then ends at the previous stage.
+    Stages without a component are passed through, except that a job ends at the last
+    stage that has one (without a drafter nothing is recorded as drafted or sent).
+    Replies are only sent with auto_send: the safe-sender check trusts the From
+    header, which can be forged, so unattended sending has to be asked for. The
+    drafted stage stores its reply in the drafts table and the sent stage sends
+    that reply, so each email is drafted once.
+    """
+    def thread_of(email_id):
+        row = conn.execute("SELECT thread_id FROM emails WHERE id = ?", (email_id,)).fetchone()
+        return row[0] if row else email_id
+
+    def analyze(email_id):
+        # Results land in the analysis cache, where later stages pick them up
+        analyzer.infer_intent(email_id)
+        analyzer.summarize_thread(thread_of(email_id))
+
+    def notify(email_id):
+        # Unimportant mail is skipped by the notifier itself; later stages still apply
+        notifier.send_slack_message(email_id)
+
+    def schedule(email_id):
+        scheduler.create_calendar_event(email_id)
+
+    def draft(email_id):
+        if not drafter.should_reply(email_id):
+            return False
+        # The scheduled stage already booked any event, so drafting must not book it again
+        reply = drafter.draft_reply(email_id, book_event=False)
+        if not reply:
+            return False
+        with conn:
+            conn.execute('''INSERT INTO drafts (email_id, recipient, subject, body, created_at) VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT(email_id) DO UPDATE SET recipient = excluded.recipient,
+                                subject = excluded.subject, body = excluded.body,
+                                created_at = excluded.created_at, sent_at = NULL''',
+                         (email_id, reply['to'], reply['subject'], reply['body'], time.time()))
+        print(f"Drafted reply to {reply['to']}: {reply['subject']}")
+        return True
+
+    def send(email_id):
+        # Sending to anyone outside the safe_senders policy needs interactive confirmation
+        email = drafter.get_email_details(email_id)
+        if not email or not drafter.is_safe_sender(email['sender']):
+            return False
+        row = conn.execute("SELECT recipient, subject, body, sent_at FROM drafts WHERE email_id = ?",
+                           (email_id,)).fetchone()
+        if row and row[3] is not None:
+            return True
+        # Jobs drafted before replies were stored have no row; those are drafted again
+        reply = {'to': row[0], 'subject': row[1], 'body': row[2]} if row else None
+        # A failed send raises, so the queue retries it rather than recording the job done
+        sent = drafter.send_reply(email_id, auto_send=True, book_event=False, raise_errors=True, draft=reply)
+        if sent and row:
+            with conn:
+                conn.execute("UPDATE drafts SET sent_at = ? WHERE email_id = ?", (time.time(), email_id))
+        return sent
+
+    handlers = {}
+    if analyzer:
+        handlers['analyzed'] = analyze
+    if notifier:
+        handlers['notified'] = notify
+    if scheduler:
+        handlers['scheduled'] = schedule
+    if drafter:
+        handlers['drafted'] = draft
+        if auto_send:
+            handlers['sent'] = send
+    return handlers
+
+
+class QueueWorker:
+    """Claims jobs from a WorkQueue and runs each through its remaining stages."""
+
+    def __init__(self, queue, handlers, owner=None, batch_size=10, observe=None):
+        """Initialize with a WorkQueue, build_handlers() output and an optional observe(stage, seconds, error)."""
+        self.queue = queue
+        self.handlers = handlers
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.batch_size = batch_size
+        self.observe = observe
+        self.processed = 0
+        self.failed = 0
+
+    def process(self, job):
+        """run job's remaining stages; returns the final status"""
+        stage = job['stage']
+        while True:
+            upcoming = next_stage(stage)
+            if upcoming is None or not any(s in self.handlers for s in STAGES[STAGES.index(upcoming):]):
+                self.queue.advance(job, self.owner, stage, finished=True)
+                self.processed += 1
+                return DONE
+            handler = self.handlers.get(upcoming)
+            if handler is not None and not self.queue.renew(job, self.owner):
+                print(f"Lost the lease on email {job['email_id']}; leaving it to its new owner.")
+                return RUNNING
+            started = time.perf_counter()
+            try:
+                result = handler(job['email_id']) if handler else True
+            except Exception as e:
+                if self.observe:
+                    self.observe(upcoming, time.perf_counter() - started, e)
+                print(f"Stage {upcoming} failed for email {job['email_id']}: {e}")
+                self.failed += 1
+                return self.queue.fail(job, self.owner, e)
+            if self.observe and handler:
+                self.observe(upcoming, time.perf_counter() - started, None)
+            if result is False:
+                # Stage does not apply: the job ends at the last stage actually completed
+                upcoming, finished = stage, True
+            else:
+                finished = next_stage(upcoming) is None
+            if not self.queue.advance(job, self.owner, upcoming, finished=finished):
+                print(f"Lost the lease on email {job['email_id']} after {upcoming}.")
+                return RUNNING
+            stage = upcoming
+            if finished:
+                self.processed += 1
+                return DONE
+
+    def process_emails(self, email_ids):
+        """claim and process specific emails (those already done or leased elsewhere are skipped)"""
+        email_ids = list(email_ids)
+        results = {}
+        for start in range(0, len(email_ids), SQL_CHUNK_SIZE):
+            chunk = email_ids[start:start + SQL_CHUNK_SIZE]
+            for job in self.queue.claim(self.owner, limit=len(chunk), email_ids=chunk):
+                results[job['email_id']] = self.process(job)
+        return results
+
+    def run(self, max_jobs=None, idle_exit=True, poll_interval=5.0):
+        """drain the queue; with idle_exit=False keep polling for new jobs"""
+        handled = 0
+        while max_jobs is None or handled < max_jobs:
+            limit = self.batch_size if max_jobs is None else min(self.batch_size, max_jobs - handled)
+            jobs = self.queue.claim(self.owner, limit=limit)
+            if not jobs:
+                if idle_exit:
+                    break
+                time.sleep(poll_interval)
+                continue
+            for job in jobs:
+                self.process(job)
+                handled += 1
+        return handled
+
+
+def run_worker(db_path='emails.db', slack_channel=None, max_jobs=None, idle_exit=True, auto_send=False):
+    """worker process entry point: builds its own components and drains the queue"""
+    from controllers.email_drafter import EmailDrafter
+    from services.calendar_scheduler import CalendarScheduler
+    from services.email_analyzer import EmailAnalyzer
+    from services.gmail_auth import GmailAuthenticator
+    from services.slack_notifier import SlackNotifier
+
+    authenticator = GmailAuthenticator()
+    analyzer = EmailAnalyzer(authenticator, db_path=db_path)
+    notifier = SlackNotifier(db_path, channel=slack_channel, analyzer=analyzer) if slack_channel else None
+    scheduler = CalendarScheduler(authenticator, db_path=db_path, analyzer=analyzer)
+    drafter = EmailDrafter(db_path, authenticator=authenticator, analyzer=analyzer, scheduler=scheduler)
+    conn = get_db_connection(db_path)
+    handlers = build_handlers(conn, analyzer, notifier, scheduler, drafter, auto_send=auto_send)
+    worker = QueueWorker(WorkQueue(conn), handlers)
+    try:
+        handled = worker.run(max_jobs=max_jobs, idle_exit=idle_exit)
+        print(f"Worker {worker.owner}: {handled} jobs, {worker.failed} stage failures")
+    finally:
+        conn.close()
+        drafter.close()
+        scheduler.close()
+        if notifier:
+            notifier.close()
+        analyzer.close()
+
+
+if __name__ == '__main__':
+    from multiprocessing import Process
+
+    parser = argparse.ArgumentParser(description="Track and drain per-email processing jobs.")
+    parser.add_argument('--db', default='emails.db')
+    commands = parser.add_subparsers(dest='command', required=True)
+    enqueue = commands.add_parser('enqueue', help="queue emails (by id, or received in the last N days)")
+    enqueue.add_argument('email_ids', nargs='*')
+    enqueue.add_argument('--days', type=float)
+    work = commands.add_parser('work', help="drain the queue with one or more worker processes")
+    work.add_argument('--workers', type=int, default=1)
+    work.add_argument('--slack-channel')
+    work.add_argument('--max-jobs', type=int)
+    work.add_argument('--forever', action='store_true', help="keep polling instead of exiting when idle")
+    work.add_argument('--auto-send', action='store_true',
+                      help="send drafted replies to safe senders without confirmation (trusts the From header)")
+    commands.add_parser('stats')
+    commands.add_parser('retry-failed')
+    args = parser.parse_args()
+
+    conn = get_db_connection(args.db)
+    queue = WorkQueue(conn)
+    if args.command == 'enqueue':
+        email_ids = list(args.email_ids)
+        if args.days is not None:
+            since = int(time.time() - args.days * 86400)
+            email_ids += [row[0] for row in conn.execute(
+                "SELECT id FROM emails WHERE timestamp >= ? AND ',' || labels || ',' LIKE '%,INBOX,%'", (since,))]
+        print(f"Queued {queue.enqueue(email_ids)} new jobs.")
+    elif args.command == 'work':
+        workers = [Process(target=run_worker, args=(args.db, args.slack_channel, args.max_jobs, not args.forever,
+                                                        args.auto_send))
+                   for _ in range(args.workers)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+    elif args.command == 'retry-failed':
+        print(f"Requeued {queue.retry_failed()} failed jobs.")
+    print(queue.stats())
+    conn.close()
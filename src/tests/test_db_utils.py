@@ -0,0 +1,78 @@
+"""Run from src/:  python -m pytest tests"""
+import sqlite3
+from utils.compress_bodies import compress_existing, decompress_all
+from utils.db_utils import _index_plaintext_bodies, get_db_connection, has_fts, indexes_compressed_bodies
+
+INSERT = "INSERT INTO emails (id, thread_id, sender, subject, timestamp, body) VALUES (?, 't', 'a@example.com', ?, 1, ?)"
+
+
+def _write_with_plain_sqlite(db_path):
+    """insert, update and delete emails through a connection without body_text()"""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute(INSERT, ('plain1', 'Budget', 'quarterly budget review'))
+        conn.execute(INSERT, ('plain2', 'Lunch', 'lunch on friday'))
+        conn.execute("UPDATE emails SET body = 'revised budget review' WHERE id = 'plain1'")
+        conn.execute("DELETE FROM emails WHERE id = 'plain2'")
+    conn.close()
+
+
+def _search(db_path, term):
+    conn = get_db_connection(db_path)
+    rows = conn.execute("SELECT e.id FROM emails_fts JOIN emails e ON e.rowid = emails_fts.rowid "
+                        "WHERE emails_fts MATCH ?", (term,)).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def test_plain_sqlite_can_write_to_a_new_database(tmp_path):
+    db_path = str(tmp_path / 'emails.db')
+    get_db_connection(db_path).close()
+    _write_with_plain_sqlite(db_path)
+    conn = get_db_connection(db_path)
+    assert [row[0] for row in conn.execute("SELECT id FROM emails")] == ['plain1']
+    fts = has_fts(conn)
+    conn.close()
+    if fts:
+        assert _search(db_path, 'revised') == ['plain1']
+        assert _search(db_path, 'lunch') == []
+
+
+def test_migration_restores_plain_triggers_without_compressed_bodies(tmp_path):
+    db_path = str(tmp_path / 'emails.db')
+    conn = get_db_connection(db_path)
+    if not has_fts(conn):
+        conn.close()
+        return
+    # A database migrated when every database indexed body_text(body)
+    with conn:
+        _index_plaintext_bodies(conn)
+        conn.execute("PRAGMA user_version = 13")
+    conn.close()
+    conn = get_db_connection(db_path)
+    assert not indexes_compressed_bodies(conn)
+    conn.close()
+    _write_with_plain_sqlite(db_path)
+    assert _search(db_path, 'budget') == ['plain1']
+
+
+def test_compressed_bodies_are_indexed_as_text(tmp_path):
+    db_path = str(tmp_path / 'emails.db')
+    conn = get_db_connection(db_path)
+    if not has_fts(conn):
+        conn.close()
+        return
+    with conn:
+        conn.execute(INSERT, ('m1', 'Offsite', 'planning the offsite agenda'))
+    assert compress_existing(conn, train=False) == 1
+    assert indexes_compressed_bodies(conn)
+    assert conn.execute("SELECT typeof(body) FROM emails").fetchone()[0] == 'blob'
+    conn.close()
+    assert _search(db_path, 'agenda') == ['m1']
+
+    conn = get_db_connection(db_path)
+    decompress_all(conn)
+    assert not indexes_compressed_bodies(conn)
+    conn.close()
+    _write_with_plain_sqlite(db_path)
+    assert sorted(_search(db_path, 'budget OR agenda')) == ['m1', 'plain1']
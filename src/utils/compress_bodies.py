@@ -0,0 +1,79 @@
+"""Migrate stored email bodies to (or back from) compressed storage.
+
+Run from src/:  python -m utils.compress_bodies --db emails.db [--codec zstd|zlib] [--decompress]
+"""
+import argparse
+import os
+from utils.compression import default_codec
+from utils.db_utils import get_db_connection, index_compressed_bodies, index_raw_bodies
+
+# Columns holding message text that body_text() reads back
+BODY_COLUMNS = ('body', 'new_body')
+
+
+def db_size(conn, db_path):
+    """bytes on disk for the database file once the WAL is checkpointed"""
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(db_path)
+
+
+def compress_existing(conn, codec=None, train=True, sample_size=2000, dict_size=64 * 1024, batch_size=1000):
+    """compress every plain-text body and new_body, training a dictionary for this mailbox first;
+    returns values changed"""
+    codec_impl = conn.body_codec
+    index_compressed_bodies(conn)
+    dict_id = 0
+    if train:
+        samples = [row[0] for row in conn.execute(
+            "SELECT body FROM emails WHERE typeof(body) = 'text' AND body != '' ORDER BY random() LIMIT ?",
+            (sample_size,))]
+        if samples:
+            dict_id = codec_impl.train_dictionary(samples, codec or default_codec(), dict_size)
+    return sum(_rewrite(conn, column, 'text', lambda body: codec_impl.compress(body, dict_id, codec), batch_size)
+               for column in BODY_COLUMNS)
+
+
+def decompress_all(conn, batch_size=1000):
+    """turn every compressed body and new_body back into plain text; returns values changed"""
+    changed = sum(_rewrite(conn, column, 'blob', conn.body_codec.decompress, batch_size) for column in BODY_COLUMNS)
+    # Nothing compressed is left, so plain sqlite3 connections can write to emails again
+    index_raw_bodies(conn)
+    return changed
+
+
+def _rewrite(conn, column, stored_type, transform, batch_size):
+    changed, last_rowid = 0, 0
+    while True:
+        rows = conn.execute(f"SELECT rowid, {column} FROM emails WHERE rowid > ? AND typeof({column}) = ? "
+                            "ORDER BY rowid LIMIT ?", (last_rowid, stored_type, batch_size)).fetchall()
+        if not rows:
+            return changed
+        with conn:
+            conn.executemany(f"UPDATE emails SET {column} = ? WHERE rowid = ?",
+                             [(transform(body), rowid) for rowid, body in rows])
+        changed += len(rows)
+        last_rowid = rows[-1][0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db', default='emails.db')
+    parser.add_argument('--codec', choices=['zstd', 'zlib'], default=None)
+    parser.add_argument('--no-dictionary', action='store_true', help='compress without a trained dictionary')
+    parser.add_argument('--decompress', action='store_true', help='restore plain-text bodies')
+    args = parser.parse_args()
+
+    conn = get_db_connection(args.db)
+    before = db_size(conn, args.db)
+    if args.decompress:
+        changed = decompress_all(conn)
+    else:
+        changed = compress_existing(conn, codec=args.codec, train=not args.no_dictionary)
+    conn.execute("VACUUM")
+    after = db_size(conn, args.db)
+    conn.close()
+    print(f"{changed} bodies rewritten; database {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import sqlite3
+import struct
+import time
+import zlib
+from collections import Counter
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib (with a preset dictionary) is the fallback
+    zstandard = None
+
+# Compressed bodies are BLOBs: 1-byte codec tag + 4-byte dictionary id (0 = none) + payload.
+# Plain TEXT bodies are left as they are, so compressed and uncompressed rows can coexist.
+CODEC_ZLIB = b'z'
+CODEC_ZSTD = b's'
+HEADER = struct.Struct('>cI')
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+ZLIB_MAX_DICT = 32 * 1024  # deflate can only reference the last 32 KiB
+
+
+def default_codec():
+    return 'zstd' if zstandard is not None else 'zlib'
+
+
+def build_zlib_dictionary(samples, size=ZLIB_MAX_DICT):
+    """preset dictionary of the lines that recur most across samples (most frequent last, nearest to the data)"""
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(line.strip() for line in sample.splitlines() if len(line.strip()) > 8))
+    chosen, total = [], 0
+    for line, count in counts.most_common():
+        if count < 2:
+            break
+        encoded = (line + '\n').encode()
+        if total + len(encoded) > size:
+            break
+        chosen.append(encoded)
+        total += len(encoded)
+    return b''.join(reversed(chosen))
+
+
+class BodyCodec:
+    """Compresses and decompresses email bodies using dictionaries stored in body_dictionaries."""
+
+    def __init__(self, conn, db_path=None):
+        """Initialize with a connection; all stored dictionaries are loaded up front."""
+        self.conn = conn
+        self.db_path = db_path
+        self._dictionaries = {}
+        self._decompressors = {}
+        self.reload()
+
+    def reload(self, conn=None):
+        conn = conn or self.conn
+        try:
+            rows = conn.execute("SELECT id, codec, data FROM body_dictionaries").fetchall()
+        except sqlite3.OperationalError:
+            rows = []  # table not created yet (migrations pending)
+        for dict_id, codec, data in rows:
+            self._dictionaries[dict_id] = (codec, data)
+
+    def active_dictionary(self):
+        """id of the newest dictionary usable with the installed libraries, or 0"""
+        usable = [i for i, (codec, _) in self._dictionaries.items() if codec == 'zlib' or zstandard is not None]
+        return max(usable, default=0)
+
+    def train_dictionary(self, samples, codec=None, size=64 * 1024):
+        """train a dictionary from sample bodies, store it and return its id"""
+        codec = codec or default_codec()
+        if codec == 'zstd':
+            if zstandard is None:
+                raise RuntimeError("zstandard is not installed; use codec='zlib'.")
+            data = zstandard.train_dictionary(size, [s.encode() for s in samples]).as_bytes()
+        else:
+            data = build_zlib_dictionary(samples, min(size, ZLIB_MAX_DICT))
+        c = self.conn.cursor()
+        c.execute("INSERT INTO body_dictionaries (codec, data, created_at) VALUES (?, ?, ?)",
+                  (codec, data, time.time()))
+        self.conn.commit()
+        self._dictionaries[c.lastrowid] = (codec, data)
+        return c.lastrowid
+
+    def compress(self, text, dict_id=None, codec=None):
+        """compress text with the given (default: active) dictionary; dict_id=0 means no dictionary"""
+        if text is None:
+            return None
+        if dict_id is None:
+            dict_id = self.active_dictionary()
+        raw = text.encode('utf-8')
+        if dict_id:
+            codec, data = self._dictionaries[dict_id]
+        else:
+            codec, data = codec or default_codec(), None
+        if codec == 'zstd':
+            params = {'level': ZSTD_LEVEL}
+            if data:
+                params['dict_data'] = zstandard.ZstdCompressionDict(data)
+            return HEADER.pack(CODEC_ZSTD, dict_id) + zstandard.ZstdCompressor(**params).compress(raw)
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15, zdict=data) if data else \
+            zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15)
+        return HEADER.pack(CODEC_ZLIB, dict_id) + compressor.compress(raw) + compressor.flush()
+
+    def decompress(self, value):
+        """return the body text for a stored value (TEXT passes through unchanged)"""
+        if value is None or isinstance(value, str):
+            return value
+        tag, dict_id = HEADER.unpack_from(value)
+        payload = value[HEADER.size:]
+        if dict_id and dict_id not in self._dictionaries:
+            self._reload_out_of_band()
+        data = self._dictionaries[dict_id][1] if dict_id else None
+        if tag == CODEC_ZSTD:
+            key = ('zstd', dict_id)
+            if key not in self._decompressors:
+                params = {'dict_data': zstandard.ZstdCompressionDict(data)} if data else {}
+                self._decompressors[key] = zstandard.ZstdDecompressor(**params)
+            return self._decompressors[key].decompress(payload).decode('utf-8')
+        decompressor = zlib.decompressobj(-15, zdict=data) if data else zlib.decompressobj(-15)
+        return (decompressor.decompress(payload) + decompressor.flush()).decode('utf-8')
+
+    def _reload_out_of_band(self):
+        # Called from inside SQL functions, where re-entering self.conn is unsafe; use a side connection
+        if not self.db_path:
+            raise KeyError("Unknown body dictionary and no database path to reload from.")
+        side = sqlite3.connect(self.db_path)
+        try:
+            self.reload(side)
+        finally:
+            side.close()
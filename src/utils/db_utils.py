@@ -1,7 +1,361 @@
 import sqlite3
+from utils.compression import BodyCodec
+from utils.dequote import strip_quoted
 
-def get_db_connection(db_path='emails.db'):
-    conn = sqlite3.connect(db_path)
+# Applied to every connection. WAL lets readers run alongside the single writer,
+# and synchronous=NORMAL is durable enough under WAL while avoiding an fsync per commit.
+PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -64 * 1024),  # negative = KiB, i.e. 64 MiB
+    ('temp_store', 'MEMORY'),
+]
+
+
+def _add_column(conn, table, column, declaration):
+    """ALTER TABLE ADD COLUMN unless the column already exists (older databases may have it)"""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+FTS_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS emails_fts_insert AFTER INSERT ON emails BEGIN
+       INSERT INTO emails_fts(rowid, subject, sender, body)
+       VALUES (new.rowid, new.subject, new.sender, {new_body});
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS emails_fts_delete AFTER DELETE ON emails BEGIN
+       INSERT INTO emails_fts(emails_fts, rowid, subject, sender, body)
+       VALUES ('delete', old.rowid, old.subject, old.sender, {old_body});
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS emails_fts_update AFTER UPDATE OF subject, sender, body ON emails BEGIN
+       INSERT INTO emails_fts(emails_fts, rowid, subject, sender, body)
+       VALUES ('delete', old.rowid, old.subject, old.sender, {old_body});
+       INSERT INTO emails_fts(rowid, subject, sender, body)
+       VALUES (new.rowid, new.subject, new.sender, {new_body});
+       END''',
+]
+
+
+def _create_fts(conn, content='emails', body_expr='{row}.body'):
+    """full-text index over emails kept in sync by triggers (skipped if SQLite lacks FTS5)"""
+    try:
+        conn.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+                         subject, sender, body,
+                         content='{content}', content_rowid='rowid', tokenize='porter unicode61')''')
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search unavailable ({e}); skipping emails_fts.")
+        return
+    for trigger in FTS_TRIGGERS:
+        conn.execute(trigger.format(new_body=body_expr.format(row='new'), old_body=body_expr.format(row='old')))
+    conn.execute("INSERT INTO emails_fts(emails_fts) VALUES ('rebuild')")
+
+
+def _drop_fts(conn):
+    for name in ('emails_fts_insert', 'emails_fts_delete', 'emails_fts_update'):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute("DROP TABLE IF EXISTS emails_fts")
+    conn.execute("DROP VIEW IF EXISTS emails_fts_source")
+
+
+def indexes_compressed_bodies(conn):
+    """whether the FTS index reads bodies through body_text() (see index_compressed_bodies)"""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'emails_fts_source'").fetchone() is not None
+
+
+def has_compressed_bodies(conn):
+    return conn.execute("SELECT 1 FROM emails WHERE typeof(body) = 'blob' LIMIT 1").fetchone() is not None
+
+
+def _index_plaintext_bodies(conn):
+    """rebuild the FTS index over body_text(body) so compressed bodies are indexed as text"""
+    if not has_fts(conn):
+        return
+    _drop_fts(conn)
+    conn.execute('''CREATE VIEW IF NOT EXISTS emails_fts_source AS
+                    SELECT rowid, subject, sender, body_text(body) AS body FROM emails''')
+    _create_fts(conn, content='emails_fts_source', body_expr='body_text({row}.body)')
+
+
+def _index_raw_bodies(conn):
+    """rebuild the FTS index over the plain body column, as created by migration 5"""
+    if not has_fts(conn):
+        return
+    _drop_fts(conn)
+    _create_fts(conn)
+
+
+def _switch_fts(conn, compressed):
+    """rebuild the FTS index for (un)compressed bodies in its own write transaction; no-op if already so"""
+    if not has_fts(conn) or indexes_compressed_bodies(conn) == compressed:
+        return False
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Another process may have switched it while we waited for the write lock
+        if indexes_compressed_bodies(conn) != compressed:
+            (_index_plaintext_bodies if compressed else _index_raw_bodies)(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+def index_compressed_bodies(conn):
+    """make the FTS triggers decode bodies with body_text(); needed before the first compressed body is written.
+
+    From then on every write to emails needs a connection from get_db_connection, which
+    registers body_text(); until then plain sqlite3 connections (the CLI, backups) can write too.
+    """
+    return _switch_fts(conn, True)
+
+
+def index_raw_bodies(conn):
+    """undo index_compressed_bodies once no compressed body is left"""
+    if has_compressed_bodies(conn):
+        return False
+    return _switch_fts(conn, False)
+
+
+def _raw_fts_unless_compressed(conn):
+    if has_fts(conn) and indexes_compressed_bodies(conn) and not has_compressed_bodies(conn):
+        _index_raw_bodies(conn)
+
+
+def _backfill_new_bodies(conn, batch_size=1000):
+    """fill emails.new_body (body without quoted history or signature) for existing rows"""
+    last_rowid = 0
+    while True:
+        rows = conn.execute("SELECT rowid, body_text(body) FROM emails WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                            (last_rowid, batch_size)).fetchall()
+        if not rows:
+            return
+        conn.executemany("UPDATE emails SET new_body = ? WHERE rowid = ?",
+                         [(strip_quoted(body), rowid) for rowid, body in rows])
+        last_rowid = rows[-1][0]
+
+
+def has_fts(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'emails_fts'").fetchone() is not None
+
+
+# What the analysis services read: the new content of a message, or the full body when
+# stripping left nothing (a bare forward) or the row predates new_body. Both columns may be compressed.
+ANALYSIS_BODY_SQL = "COALESCE(NULLIF(body_text(new_body), ''), body_text(body))"
+
+
+# Versioned schema migrations; PRAGMA user_version records the last one applied.
+# Each step is either a SQL statement or a callable taking the connection.
+MIGRATIONS = [
+    (1, [
+        '''CREATE TABLE IF NOT EXISTS emails (
+           id TEXT PRIMARY KEY,
+           thread_id TEXT,
+           sender TEXT,
+           recipient TEXT,
+           subject TEXT,
+           timestamp INTEGER,
+           body TEXT)''',
+        '''CREATE TABLE IF NOT EXISTS attachments (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           message_id TEXT,
+           filename TEXT,
+           mime_type TEXT,
+           size INTEGER,
+           FOREIGN KEY (message_id) REFERENCES emails(id))''',
+    ]),
+    (2, [
+        lambda conn: _add_column(conn, 'emails', 'labels', 'TEXT'),
+        '''CREATE TABLE IF NOT EXISTS sync_state (
+           account TEXT PRIMARY KEY,
+           history_id TEXT,
+           last_full_sync INTEGER,
+           last_sync INTEGER)''',
+        '''CREATE TABLE IF NOT EXISTS analysis_cache (
+           key TEXT PRIMARY KEY,
+           kind TEXT,
+           value TEXT,
+           created_at REAL,
+           last_used REAL)''',
+        "CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache(last_used)",
+    ]),
+    (3, [
+        "CREATE INDEX IF NOT EXISTS idx_emails_thread_timestamp ON emails(thread_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_emails_sender ON emails(sender)",
+        "CREATE INDEX IF NOT EXISTS idx_attachments_message_id ON attachments(message_id)",
+    ]),
+    (4, [
+        # Re-storing a message used to append duplicate attachment rows; keep the first of each.
+        # Distinct attachments may share a filename, so rows only count as copies when everything matches;
+        # uniqueness is enforced per MIME part by migration 13.
+        '''DELETE FROM attachments WHERE id NOT IN (
+           SELECT MIN(id) FROM attachments GROUP BY message_id, filename, mime_type, size)''',
+    ]),
+    (5, [
+        _create_fts,
+    ]),
+    (6, [
+        lambda conn: _add_column(conn, 'attachments', 'attachment_id', 'TEXT'),
+        lambda conn: _add_column(conn, 'attachments', 'sha256', 'TEXT'),
+        '''CREATE TABLE IF NOT EXISTS attachment_blobs (
+           sha256 TEXT PRIMARY KEY,
+           size INTEGER,
+           path TEXT,
+           created_at REAL,
+           last_used REAL)''',
+        "CREATE INDEX IF NOT EXISTS idx_attachment_blobs_last_used ON attachment_blobs(last_used)",
+    ]),
+    (7, [
+        '''CREATE TABLE IF NOT EXISTS body_dictionaries (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           codec TEXT,
+           data BLOB,
+           created_at REAL)''',
+        # The FTS index reads body_text(body) only once bodies are compressed (see index_compressed_bodies)
+    ]),
+    (8, [
+        lambda conn: _add_column(conn, 'emails', 'new_body', 'TEXT'),
+        _backfill_new_bodies,
+    ]),
+    (9, [
+        # Per-email processing state for services.work_queue; stage is the last one completed
+        '''CREATE TABLE IF NOT EXISTS email_jobs (
+           email_id TEXT PRIMARY KEY,
+           stage TEXT NOT NULL,
+           status TEXT NOT NULL,
+           attempts INTEGER NOT NULL DEFAULT 0,
+           lease_owner TEXT,
+           lease_expires REAL,
+           next_attempt_at REAL NOT NULL DEFAULT 0,
+           last_error TEXT,
+           created_at REAL,
+           updated_at REAL)''',
+        "CREATE INDEX IF NOT EXISTS idx_email_jobs_claim ON email_jobs(status, next_attempt_at)",
+    ]),
+    (10, [
+        # Web search results keyed by normalized query, and per-day request counts for API quotas
+        '''CREATE TABLE IF NOT EXISTS search_cache (
+           key TEXT PRIMARY KEY,
+           query TEXT,
+           results TEXT,
+           created_at REAL,
+           expires_at REAL,
+           last_used REAL)''',
+        "CREATE INDEX IF NOT EXISTS idx_search_cache_expires ON search_cache(expires_at)",
+        '''CREATE TABLE IF NOT EXISTS api_usage (
+           api TEXT,
+           day TEXT,
+           requests INTEGER NOT NULL DEFAULT 0,
+           PRIMARY KEY (api, day))''',
+    ]),
+    (11, [
+        # Local copy of calendar events for free/busy and duplicate checks, kept current via syncToken
+        '''CREATE TABLE IF NOT EXISTS calendar_events (
+           calendar_id TEXT,
+           event_id TEXT,
+           summary TEXT,
+           start REAL,
+           end REAL,
+           transparent INTEGER NOT NULL DEFAULT 0,
+           source_email_id TEXT,
+           updated TEXT,
+           PRIMARY KEY (calendar_id, event_id))''',
+        "CREATE INDEX IF NOT EXISTS idx_calendar_events_start ON calendar_events(calendar_id, start)",
+        "CREATE INDEX IF NOT EXISTS idx_calendar_events_source ON calendar_events(calendar_id, source_email_id)",
+        '''CREATE TABLE IF NOT EXISTS calendar_sync (
+           calendar_id TEXT PRIMARY KEY,
+           sync_token TEXT,
+           last_sync REAL)''',
+    ]),
+    (12, [
+        # Messages a sync could not fetch, retried by later syncs so the historyId can still advance
+        '''CREATE TABLE IF NOT EXISTS sync_failures (
+           account TEXT,
+           message_id TEXT,
+           attempts INTEGER NOT NULL DEFAULT 0,
+           last_attempt INTEGER,
+           PRIMARY KEY (account, message_id))''',
+    ]),
+    (13, [
+        # Attachments are keyed by MIME part: one email can carry two different files named image.png.
+        # Rows stored before this have no part_id and are replaced when their message is stored again.
+        lambda conn: _add_column(conn, 'attachments', 'part_id', 'TEXT'),
+        "DROP INDEX IF EXISTS idx_attachments_message_filename",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_attachments_message_part ON attachments(message_id, part_id)",
+    ]),
+    (14, [
+        # Migration 7 used to index body_text(body) everywhere, which made every write to emails
+        # fail on connections without body_text() (the sqlite3 CLI, ad-hoc scripts) even where
+        # nothing is compressed; go back to the plain body column unless compressed rows exist.
+        _raw_fts_unless_compressed,
+    ]),
+    (15, [
+        # Replies drafted by the work queue's drafted stage, sent as they are by its sent stage
+        '''CREATE TABLE IF NOT EXISTS drafts (
+           email_id TEXT PRIMARY KEY,
+           recipient TEXT,
+           subject TEXT,
+           body TEXT,
+           created_at REAL,
+           sent_at REAL)''',
+    ]),
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn):
+    """bring the schema up to the latest version, one transaction per migration"""
+    if schema_version(conn) >= MIGRATIONS[-1][0]:
+        return
+    conn.commit()
+    for version, steps in MIGRATIONS:
+        # BEGIN IMMEDIATE takes the write lock, so concurrent processes migrate one at a time
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def configure_connection(conn):
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class EmailDBConnection(sqlite3.Connection):
+    """sqlite3 connection carrying the body codec used by its body_text() SQL function."""
+    body_codec = None
+
+
+def get_db_connection(db_path='emails.db', migrate=True, timeout=30.0, check_same_thread=True):
+    """open a tuned connection to the email database, applying pending migrations.
+
+    Bodies may be stored compressed; SELECT body_text(body) returns them as text.
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=check_same_thread,
+                           factory=EmailDBConnection)
+    configure_connection(conn)
+    conn.body_codec = BodyCodec(conn, db_path if db_path != ':memory:' else None)
+    conn.create_function('body_text', 1, conn.body_codec.decompress, deterministic=True)
+    if migrate:
+        apply_migrations(conn)
+        conn.body_codec.reload()
     return conn
 
 def close_db_connection(conn):
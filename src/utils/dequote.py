@@ -0,0 +1,79 @@
+import re
+
+# "On Tue, Nov 14, 2023 at 11:26 AM Bob <bob@example.org> wrote:" and its common translations.
+# Clients wrap long attributions, so up to ATTRIBUTION_MAX_LINES lines are joined before matching.
+ATTRIBUTION = re.compile(
+    r'^(On|Le|Am|El|Il|Op)\s.{0,300}\s(wrote|a écrit|schrieb|escribió|ha scritto|schreef)\s?:$',
+    re.IGNORECASE)
+ATTRIBUTION_MAX_LINES = 3
+# Separators Outlook and others put above the previous message
+ORIGINAL_MESSAGE = re.compile(r'^(-{2,}\s*Original Message\s*-{2,}|_{20,})$', re.IGNORECASE)
+OUTLOOK_HEADER_LINES = 6
+# RFC 3676 "-- " delimiter (often stripped to "--") and mobile client footers
+SIGNATURE_DELIMITER = re.compile(r'^--\s?$')
+MOBILE_SIGNATURE = re.compile(r'^(Sent from my \w+|Get Outlook for \w+|Sent from Mail for Windows)', re.IGNORECASE)
+
+
+def _attribution_length(lines, i):
+    """number of lines (starting at i) forming an "On ... wrote:" attribution, or 0"""
+    if not lines[i].lstrip()[:2].isalpha():
+        return 0
+    for length in range(1, ATTRIBUTION_MAX_LINES + 1):
+        if i + length > len(lines):
+            break
+        candidate = ' '.join(line.strip() for line in lines[i:i + length])
+        if ATTRIBUTION.match(candidate):
+            return length
+    return 0
+
+
+def _is_outlook_header(lines, i):
+    """a "From:" line followed closely by "Sent:"/"Date:" and "Subject:" starts a quoted Outlook message"""
+    if not lines[i].lstrip().startswith('From:'):
+        return False
+    following = [line.lstrip() for line in lines[i + 1:i + OUTLOOK_HEADER_LINES]]
+    return (any(line.startswith(('Sent:', 'Date:')) for line in following)
+            and any(line.startswith('Subject:') for line in following))
+
+
+def _quoted_only(lines):
+    """True if every non-blank line up to a signature is a '>' quote"""
+    for line in lines:
+        stripped = line.strip()
+        if SIGNATURE_DELIMITER.match(line) or MOBILE_SIGNATURE.match(stripped):
+            return True
+        if stripped and not stripped.startswith('>'):
+            return False
+    return True
+
+
+def strip_quoted(body):
+    """return only the new content of an email body.
+
+    Drops '>' quoted lines, everything below an "On ... wrote:" attribution or an
+    Outlook-style original-message header, and the signature. Inline replies (answers
+    interleaved with quotes after an attribution) keep their answers.
+    """
+    if not body:
+        return ''
+    lines = body.replace('\r\n', '\n').split('\n')
+    kept = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+        if stripped.startswith('>'):
+            i += 1
+            continue
+        attribution = _attribution_length(lines, i)
+        if attribution:
+            if _quoted_only(lines[i + attribution:]):
+                break
+            i += attribution
+            continue
+        if (ORIGINAL_MESSAGE.match(stripped) or _is_outlook_header(lines, i)
+                or SIGNATURE_DELIMITER.match(line) or MOBILE_SIGNATURE.match(stripped)):
+            break
+        kept.append(line)
+        i += 1
+    return '\n'.join(kept).strip()
@@ -0,0 +1,101 @@
+"""In-memory stand-in for the Calendar v3 discovery client, for exercising CalendarScheduler locally."""
+import itertools
+from datetime import datetime
+from services.calendar_cache import event_time
+from utils.fake_gmail import FakeBatchRequest, FakeHttpError, FakeRequest, _Collection
+
+
+class FakeCalendarService:
+    """Serves events().list/insert/delete and batch requests from in-memory calendars.
+
+    Every change bumps a sequence number; list() returns a nextSyncToken on its
+    last page and, given a syncToken, only the events changed since then (deleted
+    ones with status 'cancelled'). Without one, timeMin/timeMax limit the events
+    to those overlapping the window. expire_sync_tokens() makes older tokens fail
+    with 410, as Google does when a token is too old.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.request_count = 0
+        self.batch_count = 0
+        self.stored = {}  # (calendar_id, event_id) -> event
+        self.changed = {}  # (calendar_id, event_id) -> sequence of the last change
+        self.sequence = 0
+        self.oldest_sync_sequence = 0
+        self.list_calls = []
+        self._ids = itertools.count(1)
+
+    # calendar mutations, also usable to simulate changes made elsewhere
+
+    def add_event(self, event, calendar_id='primary'):
+        event_id = event.get('id') or f"evt{next(self._ids)}"
+        event = dict(event, id=event_id, status=event.get('status', 'confirmed'),
+                     htmlLink=f"https://calendar.example.com/event?eid={event_id}")
+        self._change(calendar_id, event)
+        return event
+
+    def remove_event(self, event_id, calendar_id='primary'):
+        event = dict(self.stored[(calendar_id, event_id)], status='cancelled')
+        self._change(calendar_id, event)
+
+    def _change(self, calendar_id, event):
+        self.sequence += 1
+        self.stored[(calendar_id, event['id'])] = event
+        self.changed[(calendar_id, event['id'])] = self.sequence
+
+    def expire_sync_tokens(self):
+        self.oldest_sync_sequence = self.sequence
+
+    # discovery-style accessors
+
+    def events(self):
+        return _Collection(list=self._list, insert=self._insert, delete=self._delete)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self, callback)
+
+    # resource methods
+
+    def _list(self, calendarId='primary', syncToken=None, pageToken=None, maxResults=250, showDeleted=False,
+              timeMin=None, timeMax=None, **kwargs):
+        self.list_calls.append({'syncToken': syncToken, 'pageToken': pageToken, 'timeMin': timeMin,
+                                'timeMax': timeMax})
+
+        def run():
+            if syncToken is not None and (timeMin or timeMax):
+                raise FakeHttpError(400, 'timeMin and timeMax cannot be combined with syncToken.')
+            since = 0
+            if syncToken is not None:
+                since = int(syncToken.split('-')[1])
+                if since < self.oldest_sync_sequence:
+                    raise FakeHttpError(410, 'Sync token is no longer valid, a full sync is required.')
+            keys = sorted((key for key in self.stored if key[0] == calendarId and self.changed[key] > since),
+                          key=self.changed.get)
+            items = [self.stored[key] for key in keys]
+            if syncToken is None and not showDeleted:
+                items = [item for item in items if item['status'] != 'cancelled']
+            if syncToken is None and (timeMin or timeMax):
+                low = datetime.fromisoformat(timeMin).timestamp() if timeMin else float('-inf')
+                high = datetime.fromisoformat(timeMax).timestamp() if timeMax else float('inf')
+                items = [item for item in items if 'start' not in item
+                         or (event_time(item['start']) < high and event_time(item['end']) > low)]
+            start = int(pageToken or 0)
+            result = {'items': items[start:start + maxResults]}
+            if start + maxResults < len(items):
+                result['nextPageToken'] = str(start + maxResults)
+            else:
+                result['nextSyncToken'] = f"sync-{self.sequence}"
+            return result
+        return FakeRequest(self, run)
+
+    def _insert(self, calendarId='primary', body=None, **kwargs):
+        return FakeRequest(self, lambda: self.add_event(dict(body), calendarId))
+
+    def _delete(self, calendarId='primary', eventId=None, **kwargs):
+        def run():
+            if (calendarId, eventId) not in self.stored:
+                raise FakeHttpError(404, 'Not Found')
+            self.remove_event(eventId, calendarId)
+            return ''
+        return FakeRequest(self, run)
@@ -0,0 +1,33 @@
+"""In-memory stand-in for the Custom Search JSON API client, for exercising WebSearchAssistant locally."""
+import threading
+from utils.fake_gmail import FakeHttpError, FakeRequest, _Collection
+
+
+class FakeCustomSearchService:
+    """Serves cse().list() with deterministic results derived from the query.
+
+    ``daily_limit`` makes requests past that count fail with 429, like an
+    exhausted quota. Every executed query is recorded in ``queries``.
+    """
+
+    def __init__(self, latency=0.0, daily_limit=None):
+        self.latency = latency
+        self.daily_limit = daily_limit
+        self.request_count = 0
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def cse(self):
+        return _Collection(list=self._list)
+
+    def _list(self, q, cx=None, num=10, **kwargs):
+        def run():
+            with self._lock:
+                self.queries.append(q)
+                if self.daily_limit is not None and len(self.queries) > self.daily_limit:
+                    raise FakeHttpError(429, 'Quota exceeded for quota metric Queries per day')
+            words = q.split()[:5]
+            return {'items': [{'title': f"Result {i} for {' '.join(words)}",
+                               'snippet': f"Snippet {i}: {q[:80]}",
+                               'link': f"https://example.com/{'-'.join(words)}/{i}"} for i in range(1, num + 1)]}
+        return FakeRequest(self, run)
@@ -0,0 +1,238 @@
+"""In-memory stand-in for the Gmail discovery client, for exercising ingestion locally."""
+import base64
+import time
+
+
+class FakeHttpError(Exception):
+    """Mimics googleapiclient.errors.HttpError closely enough for status checks."""
+
+    class _Resp:
+        def __init__(self, status):
+            self.status = status
+            self.reason = 'Fake error'
+
+    def __init__(self, status, message=''):
+        super().__init__(f"<FakeHttpError {status}: {message}>")
+        self.resp = self._Resp(status)
+        self.status_code = status
+
+
+class FakeRequest:
+    """A lazily executed API call, like googleapiclient.http.HttpRequest."""
+
+    def __init__(self, service, func):
+        self._service = service
+        self._func = func
+
+    def execute(self):
+        self._service.request_count += 1
+        if self._service.latency:
+            time.sleep(self._service.latency)
+        return self._func()
+
+
+class FakeBatchRequest:
+    """Mimics BatchHttpRequest: one round trip, per-item callbacks."""
+
+    def __init__(self, service, callback=None):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        if request_id is None:
+            request_id = str(len(self._requests) + 1)
+        self._requests.append((request_id, request, callback or self._callback))
+
+    def execute(self):
+        self._service.batch_count += 1
+        if self._service.latency:
+            time.sleep(self._service.latency)
+        for request_id, request, callback in self._requests:
+            response, exception = None, None
+            try:
+                response = request._func()
+            except FakeHttpError as e:
+                exception = e
+            if callback:
+                callback(request_id, response, exception)
+
+
+class _Collection:
+    """Attribute bag so that service.users().messages() chains resolve."""
+
+    def __init__(self, **members):
+        for name, member in members.items():
+            setattr(self, name, member)
+
+
+def make_message(message_id, thread_id=None, sender='sender@example.com', recipient='me@example.com',
+                 subject='Subject', body='Body', timestamp=0, label_ids=None, attachments=None):
+    """build a full-format Gmail message resource with a text/plain body"""
+    parts = [{
+        'mimeType': 'text/plain',
+        'filename': '',
+        'body': {'data': base64.urlsafe_b64encode(body.encode()).decode(), 'size': len(body)}
+    }]
+    for attachment in attachments or []:
+        parts.append({
+            'mimeType': attachment.get('mime_type', 'application/octet-stream'),
+            'filename': attachment['filename'],
+            'body': {'attachmentId': attachment.get('attachment_id', attachment['filename']),
+                     'size': len(attachment['data']) if 'data' in attachment else attachment.get('size', 0)}
+        })
+    return {
+        'id': message_id,
+        'threadId': thread_id or message_id,
+        'labelIds': list(label_ids or ['INBOX']),
+        'internalDate': str(timestamp * 1000),
+        'payload': {
+            'mimeType': 'multipart/mixed',
+            'headers': [
+                {'name': 'From', 'value': sender},
+                {'name': 'To', 'value': recipient},
+                {'name': 'Subject', 'value': subject},
+            ],
+            'body': {'size': 0},
+            'parts': parts
+        }
+    }
+
+
+class FakeGmailService:
+    """Serves users().messages(), users().history() and batch requests from in-memory state.
+
+    ``throttle_every`` makes every Nth get inside a batch fail with 429 the first
+    time it is attempted, to exercise per-item retry handling. Mutations made via
+    add_message/delete_message/add_labels are recorded as history records.
+    """
+
+    def __init__(self, messages=None, latency=0.0, throttle_every=None, history_id=1000, attachment_data=None):
+        self.messages = {m['id']: m for m in (messages or [])}
+        self.attachment_data = dict(attachment_data or {})  # attachmentId -> bytes
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.request_count = 0
+        self.batch_count = 0
+        self.history_id = history_id
+        self.history = []
+        self.oldest_history_id = history_id
+        self.watch_request = None
+        self._get_count = 0
+        self._throttled = set()
+
+    # mailbox mutations, recorded as history
+
+    def _record(self, **change):
+        self.history_id += 1
+        self.history.append(dict(change, id=str(self.history_id)))
+
+    def add_message(self, message):
+        self.messages[message['id']] = message
+        self._record(messagesAdded=[{'message': self._stub(message)}])
+
+    def delete_message(self, message_id):
+        message = self.messages.pop(message_id)
+        self._record(messagesDeleted=[{'message': self._stub(message)}])
+
+    def add_labels(self, message_id, label_ids):
+        message = self.messages[message_id]
+        message['labelIds'] = message.get('labelIds', []) + [l for l in label_ids if l not in message.get('labelIds', [])]
+        self._record(labelsAdded=[{'message': self._stub(message), 'labelIds': list(label_ids)}])
+
+    def expire_history(self):
+        """drop all history so older startHistoryIds return 404"""
+        self.history = []
+        self.oldest_history_id = self.history_id
+
+    @staticmethod
+    def _stub(message):
+        return {'id': message['id'], 'threadId': message['threadId'], 'labelIds': list(message.get('labelIds', []))}
+
+    # discovery-style accessors
+
+    def users(self):
+        return _Collection(messages=self._messages, history=self._history, getProfile=self._get_profile,
+                           watch=self._watch, stop=self._stop)
+
+    def _history(self):
+        return _Collection(list=self._history_list)
+
+    def _messages(self):
+        return _Collection(list=self._list, get=self._get, attachments=self._attachments)
+
+    def _attachments(self):
+        return _Collection(get=self._attachment_get)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self, callback)
+
+    # resource methods
+
+    def _get_profile(self, userId='me'):
+        return FakeRequest(self, lambda: {'emailAddress': 'me@example.com', 'messagesTotal': len(self.messages),
+                                          'historyId': str(self.history_id)})
+
+    def _watch(self, userId='me', body=None):
+        self.watch_request = body
+        # Gmail watches last 7 days
+        return FakeRequest(self, lambda: {'historyId': str(self.history_id),
+                                          'expiration': str(int((time.time() + 7 * 86400) * 1000))})
+
+    def _stop(self, userId='me'):
+        def run():
+            self.watch_request = None
+            return {}
+        return FakeRequest(self, run)
+
+    def _history_list(self, userId='me', startHistoryId=None, historyTypes=None, pageToken=None,
+                      maxResults=100, **kwargs):
+        def run():
+            if int(startHistoryId) < self.oldest_history_id:
+                raise FakeHttpError(404, 'Requested entity was not found.')
+            records = [r for r in self.history if int(r['id']) > int(startHistoryId)]
+            start = int(pageToken or 0)
+            result = {'historyId': str(self.history_id)}
+            if records[start:start + maxResults]:
+                result['history'] = records[start:start + maxResults]
+            if start + maxResults < len(records):
+                result['nextPageToken'] = str(start + maxResults)
+            return result
+        return FakeRequest(self, run)
+
+    def _attachment_get(self, userId='me', messageId=None, id=None):
+        def run():
+            if messageId not in self.messages or id not in self.attachment_data:
+                raise FakeHttpError(404, 'Requested entity was not found.')
+            data = self.attachment_data[id]
+            return {'attachmentId': id, 'size': len(data), 'data': base64.urlsafe_b64encode(data).decode()}
+        return FakeRequest(self, run)
+
+    def _ordered_ids(self):
+        # Gmail lists newest first
+        return sorted(self.messages, key=lambda i: int(self.messages[i].get('internalDate', 0)), reverse=True)
+
+    def _list(self, userId='me', maxResults=100, pageToken=None, q=None, **kwargs):
+        def run():
+            ids = self._ordered_ids()
+            start = int(pageToken or 0)
+            page = ids[start:start + maxResults]
+            result = {'resultSizeEstimate': len(ids)}
+            if page:
+                result['messages'] = [{'id': i, 'threadId': self.messages[i]['threadId']} for i in page]
+            if start + maxResults < len(ids):
+                result['nextPageToken'] = str(start + maxResults)
+            return result
+        return FakeRequest(self, run)
+
+    def _get(self, userId='me', id=None, format='full', **kwargs):
+        def run():
+            self._get_count += 1
+            if (self.throttle_every and id not in self._throttled
+                    and self._get_count % self.throttle_every == 0):
+                self._throttled.add(id)
+                raise FakeHttpError(429, 'Too many concurrent requests for user')
+            if id not in self.messages:
+                raise FakeHttpError(404, 'Requested entity was not found.')
+            return self.messages[id]
+        return FakeRequest(self, run)
@@ -0,0 +1,37 @@
+"""In-memory notification source for running the mail daemon without Pub/Sub or polling."""
+import queue
+import time
+
+
+class FakeNotificationSource:
+    """Delivers notifications queued with push(); pairs with FakeGmailService.
+
+    Typical use: service.add_message(...) then source.push(service.history_id).
+    """
+
+    def __init__(self):
+        self.service = None
+        self.reports = []
+        self._queue = queue.Queue()
+
+    def start(self, service):
+        self.service = service
+
+    def push(self, history_id=None, email='me@example.com'):
+        self._queue.put({'source': 'fake', 'received_at': time.time(), 'email': email,
+                         'history_id': int(history_id) if history_id is not None else None})
+
+    def get(self, timeout=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def report(self, new_messages):
+        self.reports.append(new_messages)
+
+    def close(self):
+        pass
@@ -0,0 +1,48 @@
+"""In-memory stand-in for slack_sdk.WebClient, for exercising SlackNotifier and SlackOutbox locally."""
+import threading
+import time
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web import SlackResponse
+
+
+class FakeWebClient:
+    """Records chat_postMessage calls and enforces a per-channel rate limit.
+
+    A channel accepts ``rate_limit`` messages per ``per`` seconds; further posts
+    in that window fail with 429 and a Retry-After header, like Slack's
+    chat.postMessage limit of about one message per second per channel.
+    ``fail_statuses`` is a list of HTTP statuses returned by the next posts.
+    """
+
+    def __init__(self, rate_limit=None, per=1.0, retry_after=1, fail_statuses=None):
+        self.rate_limit = rate_limit
+        self.per = per
+        self.retry_after = retry_after
+        self.fail_statuses = list(fail_statuses or [])
+        self.messages = []
+        self.calls = 0
+        self.rate_limited = 0
+        self._recent = {}  # channel -> times of accepted posts
+        self._lock = threading.Lock()
+
+    def _response(self, data, status_code=200, headers=None):
+        return SlackResponse(client=self, http_verb='POST', api_url='https://slack.com/api/chat.postMessage',
+                             req_args={}, data=data, headers=headers or {}, status_code=status_code)
+
+    def chat_postMessage(self, channel, text=None, blocks=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            now = time.time()
+            if self.fail_statuses:
+                status = self.fail_statuses.pop(0)
+                raise SlackApiError(f"HTTP {status}", self._response({'ok': False, 'error': 'fatal_error'}, status))
+            if self.rate_limit is not None:
+                recent = [t for t in self._recent.get(channel, []) if now - t < self.per]
+                if len(recent) >= self.rate_limit:
+                    self.rate_limited += 1
+                    response = self._response({'ok': False, 'error': 'ratelimited'}, 429,
+                                              {'Retry-After': str(self.retry_after)})
+                    raise SlackApiError("The request to the Slack API failed.", response)
+                self._recent[channel] = recent + [now]
+            self.messages.append({'channel': channel, 'text': text, 'blocks': blocks, 'ts': f"{now:.6f}"})
+            return self._response({'ok': True, 'channel': channel, 'ts': f"{now:.6f}"})
@@ -0,0 +1,32 @@
+"""Latency bookkeeping shared by the long-running services."""
+import threading
+from collections import deque
+
+LATENCY_WINDOW = 1000  # recent samples kept per tracker for percentiles
+
+
+class LatencyTracker:
+    """Running count/sum of latencies plus a window of recent samples for percentiles."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def as_dict(self):
+        with self._lock:
+            ordered = sorted(self.samples)
+            count, total = self.count, self.total
+        if not ordered:
+            return {'count': 0, 'sum': 0.0, 'p50': None, 'p95': None, 'max': None}
+
+        def percentile(p):
+            return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+        return {'count': count, 'sum': total, 'p50': percentile(0.5), 'p95': percentile(0.95), 'max': ordered[-1]}